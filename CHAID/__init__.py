@@ -1,5 +1,7 @@
 from .split import Split
 from .tree import Tree
+from .compiled_tree import CompiledTree
+from .streamed_tree import StreamedTree
 from .node import Node
 from .column import NominalColumn, OrdinalColumn, ContinuousColumn
 from .stats import Stats
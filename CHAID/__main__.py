@@ -4,6 +4,7 @@ Inference Detection (CHAID) decision tree.
 """
 import argparse
 from .tree import Tree
+from .streamed_tree import StreamedTree, csv_chunks
 import pandas as pd
 import numpy as np
 
@@ -33,6 +34,9 @@ def main():
     parser.add_argument('--min-child-node-size', type=int, help='Minimum number of '
                         'samples required to split the child node')
     parser.add_argument('--alpha-merge', type=float, help='Alpha Merge')
+    parser.add_argument('--chunksize', type=int, help='Read the csv file this '
+                        'many rows at a time, reading it once per level of the '
+                        'tree instead of loading it into memory (csv files only)')
     group = parser.add_mutually_exclusive_group(required=False)
     group.add_argument('--classify', action='store_true', help='Add column to'
                        ' input with the node id of the node that that '
@@ -45,10 +49,18 @@ def main():
     group.add_argument('--export-path', type=str, help='Path to store chart output')
 
     group.add_argument('--exhaustive', action='store_true', help='To implement exhustive CHAID')
+    parser.add_argument('--grouping', type=str, choices=['heuristic', 'optimal'],
+                        help='Merge the levels of each variable heuristically, '
+                        'or search every grouping for the most significant one')
 
     nspace = parser.parse_args()
 
-    if nspace.file[-4:] == '.csv':
+    if nspace.chunksize and nspace.file[-4:] != '.csv':
+        print('Only csv files can be read in chunks')
+        exit(1)
+    if nspace.file[-4:] == '.csv' and nspace.chunksize:
+        data = None
+    elif nspace.file[-4:] == '.csv':
         data = pd.read_csv(nspace.file)
     elif nspace.file[-4:] == '.sav':
         import savReaderWriter as spss
@@ -75,6 +87,8 @@ def main():
         config['dep_variable_type'] = nspace.dependent_variable_type
     if nspace.exhaustive:
         config['is_exhaustive'] = nspace.exhaustive
+    if nspace.grouping:
+        config['grouping'] = nspace.grouping
 
     ordinal = nspace.ordinal_variables or []
     nominal = nspace.nominal_variables or []
@@ -83,8 +97,23 @@ def main():
     if len(independent_variables) == 0:
         print('Need to provide at least one independent variable')
         exit(1)
-    tree = Tree.from_pandas_df(data, types, nspace.dependent_variable[0],
-                               **config)
+    if data is None:
+        chunks = csv_chunks(nspace.file, nspace.chunksize)
+        tree = StreamedTree.from_chunks(chunks, types, nspace.dependent_variable[0],
+                                        **config)
+        if nspace.classify or nspace.predict:
+            # the input is written out a chunk at a time with the added column
+            for i, chunk in enumerate(chunks()):
+                if nspace.classify:
+                    chunk['node_id'] = tree.apply(chunk).astype(float)
+                else:
+                    chunk['predicted'] = tree.predict(chunk)
+                print(chunk.to_csv(header=i == 0), end='')
+            print()
+            return
+    else:
+        tree = Tree.from_pandas_df(data, types, nspace.dependent_variable[0],
+                                   **config)
 
     if nspace.export or nspace.export_path:
         tree.render(nspace.export_path, True)
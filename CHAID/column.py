@@ -1,7 +1,6 @@
 import numpy as np
+import pandas as pd
 from math import isnan
-from itertools import combinations
-from .mapping_dict import MappingDict
 
 
 def convert_to_python_type(value):
@@ -25,6 +24,47 @@ def convert_to_python_type(value):
         return value.item()
     return value
 
+def compact_dtype(low, high):
+    """
+    Returns the smallest signed integer dtype that holds every value in
+    [low, high] with room to spare at both ends, so that its minimum can be
+    reserved as the missing code and high + 1 can't overflow
+
+    Parameters
+    ----------
+    low : int
+        the lowest value to hold
+    high : int
+        the highest value to hold
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min < low and high < info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+BLOCK_SIZE = 1 << 20
+
+
+def distinct_values(arr, block_size=BLOCK_SIZE):
+    """
+    Returns the sorted distinct values of arr, as np.unique does. Large
+    arrays are read a block at a time, so that an array that isn't held in
+    memory (such as a np.memmap) is never copied or sorted as a whole
+
+    Parameters
+    ----------
+    arr : np.ndarray
+        the values
+    block_size : int
+        the number of values read at a time
+    """
+    arr = arr.reshape(-1)
+    if len(arr) <= block_size:
+        return np.unique(arr)
+    blocks = [np.unique(arr[start:start + block_size]) for start in range(0, len(arr), block_size)]
+    return np.unique(np.concatenate(blocks))
+
 def is_sorted(ndarr, nan_val=None):
     store = []
     for arr in ndarr:
@@ -49,13 +89,28 @@ class Column(object):
     substitute : bool
         Whether the objects in the given array need to be substitued for
         integers
+    weights : array-like or None
+        The respondent weight of every row
+    name : string or None
+        The name of the column
+    frequencies : array-like or None
+        The number of respondents every row stands for, when the rows are
+        cells of pre-aggregated data rather than respondents
+    copy : bool
+        Whether to copy arr. If False, an array that is already integer
+        coded (such as a np.memmap, or an Arrow buffer) is used in place
     """
     def __init__(self, arr=None, metadata=None, missing_id='<missing>',
-                 substitute=True, weights=None, name=None):
+                 substitute=True, weights=None, name=None, frequencies=None, copy=True):
         self.metadata = dict(metadata or {})
-        self.arr = np.array(arr)
+        # an array used in place belongs to the caller, and is never written to
+        self._shared = not copy
+        self.arr = np.array(arr) if copy else np.asanyarray(arr)
+        if not copy and not np.issubdtype(self.arr.dtype, np.integer):
+            raise ValueError('Only integer coded values can be used without copying them')
         self._missing_id = missing_id
-        self.weights = weights
+        self.weights = None if weights is None else np.asarray(weights)
+        self.frequencies = None if frequencies is None else np.asarray(frequencies)
         self.name = name
 
     def __iter__(self):
@@ -107,60 +162,89 @@ class NominalColumn(Column):
     one another (i.e. do not follow a progression)
     """
     def __init__(self, arr=None, metadata=None, missing_id='<missing>',
-                 substitute=True, weights=None, name=None):
-        super(self.__class__, self).__init__(arr, metadata=metadata, missing_id=missing_id, weights=weights, name=name)
-        if substitute and metadata is None:
+                 substitute=True, weights=None, name=None, frequencies=None, copy=True):
+        super(self.__class__, self).__init__(arr, metadata=metadata, missing_id=missing_id, weights=weights, name=name,
+                                             frequencies=frequencies, copy=copy)
+        if not copy:
+            # the integer codes are their own labels, with -1 for missing values
+            if metadata is None and len(self.arr) and self.arr.min() == -1:
+                self.metadata[-1] = missing_id
+        elif substitute and metadata is None:
             self.substitute_values(arr)
 
-        self._groupings = MappingDict()
-        for x in np.unique(self.arr):
-            self._groupings[x] = [x]
+        # every distinct value belongs to the group headed by _head, and the group
+        # headed by a value lists its members until it's merged into another group
+        self._values = distinct_values(self.arr)
+        self._position = {x: i for i, x in enumerate(self._values.tolist())}
+        self._head = np.arange(len(self._values))
+        self._members = [[x] for x in self._values]
+        self._active = np.ones(len(self._values), dtype=bool)
+
+    @property
+    def arr(self):
+        if self._merged:
+            # rows of merged values are relabelled with the value heading their group once
+            # they're read, in a copy of an array used in place
+            self._merged = False
+            if self._shared:
+                self._arr, self._shared = np.array(self._arr), False
+            merged = self._head != np.arange(len(self._head))
+            rows = np.flatnonzero(np.isin(self._arr, self._values[merged]))
+            positions = np.searchsorted(self._values, self._arr[rows])
+            self._arr[rows] = self._values[self._head[positions]]
+        return self._arr
+
+    @arr.setter
+    def arr(self, value):
+        self._arr = value
+        self._merged = False
+
+    @property
+    def _groupings(self):
+        """ The members of the groups, by the value heading each """
+        return {
+            self._values[head]: self._members[head] for head in np.flatnonzero(self._active)
+        }
 
     def deep_copy(self):
         """
         Returns a deep copy.
         """
         return NominalColumn(self.arr, metadata=self.metadata, name=self.name,
-                             missing_id=self._missing_id, substitute=False, weights=self.weights)
+                             missing_id=self._missing_id, substitute=False, weights=self.weights,
+                             frequencies=self.frequencies)
 
     def substitute_values(self, vect):
         """
         Internal method to substitute integers into the vector, and construct
         metadata to convert back to the original vector.
 
-        np.nan is always given -1, all other objects are given integers in
-        order of apperence.
+        np.nan (and any other missing value, such as None) is always given
+        -1, all other objects are given integers in sorted order (numbers
+        before strings when the types are mixed). The values are encoded in
+        a single hashing pass, rather than a comparison per unique value,
+        and stored in the smallest integer dtype that holds the codes.
 
         Parameters
         ----------
         vect : np.array
             the vector in which to substitute values in
         """
+        codes, unique = pd.factorize(np.asarray(vect).ravel(), sort=True)
 
-        try:
-            unique = np.unique(vect)
-        except:
-            unique = set(vect)
-
-        unique = [
-            x for x in unique if not isinstance(x, float) or not isnan(x)
-        ]
-
-        arr = np.copy(vect)
         for new_id, value in enumerate(unique):
-            np.place(arr, arr==value, new_id)
             # Convert value to Python native type for numpy 2.0 compatibility
             self.metadata[new_id] = convert_to_python_type(value)
-        arr = arr.astype(np.float64)
-        np.place(arr, np.isnan(arr), -1)
-        self.arr = arr
+        self.arr = codes.astype(compact_dtype(-1, len(unique)))
 
-        if -1 in arr:
+        if (codes == -1).any():
             self.metadata[-1] = self._missing_id
 
     def __getitem__(self, key):
         new_weights = None if self.weights is None else self.weights[key]
-        return NominalColumn(self.arr[key], metadata=self.metadata, substitute=False, weights=new_weights, name=self.name)
+        new_frequencies = None if self.frequencies is None else self.frequencies[key]
+        return NominalColumn(self.arr[key], metadata=self.metadata, substitute=False, weights=new_weights, name=self.name,
+                             frequencies=new_frequencies)
 
     def __setitem__(self, key, value):
         self.arr[key] = value
@@ -171,7 +255,13 @@ class NominalColumn(Column):
         return [[convert_to_python_type(item) for item in group] for group in self._groupings.values()]
 
     def possible_groupings(self):
-        return combinations(self._groupings.keys(), 2)
+        return iter([tuple(pair) for pair in self.possible_pairs().tolist()])
+
+    def possible_pairs(self):
+        # any two groups can be merged
+        heads = self._values[np.flatnonzero(self._active)]
+        first, second = np.triu_indices(len(heads), 1)
+        return np.column_stack((heads[first], heads[second]))
 
     def all_combinations(self):
         bell_set = self.bell_set(sorted(list(self._groupings.keys())))
@@ -179,9 +269,17 @@ class NominalColumn(Column):
         return bell_set
 
     def group(self, x, y):
-        self._groupings[x] += self._groupings[y]
-        del self._groupings[y]
-        self.arr[self.arr == y] = x
+        """
+        Merges the group headed by y into the group headed by x, updating
+        only the group each value belongs to. The rows are relabelled when
+        they're next read
+        """
+        ix, iy = self._position[x], self._position[y]
+        self._members[ix] = self._members[ix] + self._members[iy]
+        self._members[iy] = None
+        self._head[self._head == iy] = ix
+        self._active[iy] = False
+        self._merged = True
 
     @property
     def type(self):
@@ -196,39 +294,104 @@ class OrdinalColumn(Column):
     A column containing integer values that have an order
     """
     def __init__(self, arr=None, metadata=None, missing_id='<missing>',
-                 groupings=None, substitute=True, weights=None, name=None):
-        super(self.__class__, self).__init__(arr, metadata, missing_id=missing_id, weights=weights, name=name)
+                 groupings=None, substitute=True, weights=None, name=None, copy=True):
+        super(self.__class__, self).__init__(arr, metadata, missing_id=missing_id, weights=weights, name=name,
+                                             copy=copy)
         self._nan = np.iinfo(np.int64).min
 
-        if substitute and metadata is None:
+        if not copy:
+            # the integer codes are used in place, the missing code is the minimum of the dtype
+            self._nan = np.iinfo(self.arr.dtype).min
+            if metadata is None and len(self.arr) and self.arr.min() == self._nan:
+                self.metadata[self._nan] = missing_id
+        elif substitute and metadata is None:
             self.arr, self.orig_type = self.substitute_values(self.arr)
         elif substitute and metadata and not np.issubdtype(self.arr.dtype, np.integer):
             # custom metadata has been passed in from external source, and must be converted to int
-            self.arr = self.arr.astype(int)
+            self.arr = self.compact_values(self.arr.astype(float))
             self.metadata = { int(k):v for k, v in metadata.items() }
             self.metadata[self._nan] = missing_id
-
-        self._groupings = {}
-        if groupings is None:
-            for x in np.unique(self.arr):
-                self._groupings[x] = [x, x + 1, False]
-        else:
-            for x in np.unique(self.arr):
-                self._groupings[x] = list(groupings[x])
+        elif np.issubdtype(self.arr.dtype, np.integer):
+            # already coded, the missing code is the minimum of the dtype
+            self._nan = np.iinfo(self.arr.dtype).min
+
+        # every distinct value heads a group of the values in [lower, upper), and whether it
+        # holds the missing values, until it's merged into another group
+        self._values = distinct_values(self.arr)
+        bounds = [
+            [x, x + 1, False] if groupings is None else groupings[x] for x in self._values.tolist()
+        ]
+        self._position = {x: i for i, x in enumerate(self._values.tolist())}
+        self._lower = np.array([bound[0] for bound in bounds], dtype=np.int64)
+        self._upper = np.array([bound[1] for bound in bounds], dtype=np.int64)
+        self._with_nan = np.array([bound[2] for bound in bounds], dtype=bool)
+        self._active = np.ones(len(bounds), dtype=bool)
         self._possible_groups = None
 
+    @property
+    def arr(self):
+        if self._merged:
+            # values are relabelled with the value heading their group once they're read, in
+            # a copy of an array used in place
+            if self._shared:
+                self._arr, self._shared = np.array(self._arr), False
+            heads = self._values.copy()
+            for x, y in self._merged:
+                heads[heads == y] = x
+            self._merged = []
+            self._arr[...] = heads[np.searchsorted(self._values, self._arr)]
+        return self._arr
+
+    @arr.setter
+    def arr(self, value):
+        self._arr = value
+        self._merged = []
+
+    @property
+    def _groupings(self):
+        """ The [lower, upper, with_nan] bounds of the groups, by the value heading each """
+        heads = np.flatnonzero(self._active)
+        return {
+            x: [lower, upper, with_nan] for x, lower, upper, with_nan in zip(
+                self._values[heads].tolist(), self._lower[heads].tolist(), self._upper[heads].tolist(),
+                self._with_nan[heads].tolist()
+            )
+        }
+
+    def compact_values(self, values):
+        """
+        Truncates the values to integers stored in the smallest sufficient
+        dtype, reserving the minimum of the dtype as the code for missing
+        values (np.nan)
+
+        Parameters
+        ----------
+        values : np.array
+            the integer or float values to store
+        """
+        missing = np.isnan(values) if values.dtype.kind == 'f' else np.zeros(values.shape, dtype=bool)
+        present = values[~missing].astype(np.int64)
+        dtype = compact_dtype(present.min(), present.max()) if len(present) else np.dtype(np.int8)
+        self._nan = np.iinfo(dtype).min
+        codes = np.full(values.shape, self._nan, dtype=dtype)
+        codes[~missing] = present
+        return codes
+
     def substitute_values(self, vect):
         if not np.issubdtype(vect.dtype, np.integer):
-            uniq = set(vect)
+            uniq = pd.unique(vect.ravel())
             uniq_floats = np.array(list(uniq), dtype=float)
-            uniq_ints = uniq_floats.astype(int)
+            self.arr = self.arr.astype(float)
+            codes = self.compact_values(self.arr)
             nan = self._missing_id
+            # values truncated to the same integer are labelled with the smallest of them
+            order = np.argsort(uniq_floats)[::-1]
             self.metadata = {
-                new: nan if isnan(as_float) else old
-                for old, as_float, new in zip(uniq, uniq_floats, uniq_ints)
+                self._nan if isnan(as_float) else int(as_float): nan if isnan(as_float) else old
+                for old, as_float in zip(uniq[order], uniq_floats[order])
             }
-            self.arr = self.arr.astype(float)
-        return self.arr.astype(int), self.arr.dtype.type
+            return codes, self.arr.dtype.type
+        return self.compact_values(self.arr), self.arr.dtype.type
 
     def deep_copy(self):
         """
@@ -249,25 +412,27 @@ class OrdinalColumn(Column):
         return self
 
     def groups(self):
-        vals = self._groupings.values()
         return [
-            [convert_to_python_type(x) for x in range(minmax[0], minmax[1])] + ([convert_to_python_type(self._nan)] if minmax[2] else [])
-            for minmax in vals
+            list(range(lower, upper)) + ([convert_to_python_type(self._nan)] if with_nan else [])
+            for lower, upper, with_nan in self._groupings.values()
         ]
 
     def possible_groupings(self):
+        return iter([tuple(pair) for pair in self.possible_pairs().tolist()])
+
+    def possible_pairs(self):
         if self._possible_groups is None:
-            ranges = sorted(self._groupings.items())
-            candidates = zip(ranges[0:], ranges[1:])
-            self._possible_groups = [
-                (k1, k2) for (k1, minmax1), (k2, minmax2) in candidates
-                if minmax1[1] == minmax2[0]
-            ]
-            if self._nan in self.arr:
-                self._possible_groups += [
-                    (key, self._nan) for key in self._groupings.keys() if key != self._nan
-                ]
-        return self._possible_groups.__iter__()
+            # neighbouring groups can be merged if their values are consecutive, and any
+            # group with the missing values while they're a group of their own
+            heads = np.flatnonzero(self._active)
+            adjacent = self._upper[heads[:-1]] == self._lower[heads[1:]]
+            pairs = [np.column_stack((heads[:-1][adjacent], heads[1:][adjacent]))]
+            missing = self._position.get(self._nan)
+            if missing is not None and self._active[missing]:
+                others = heads[heads != missing]
+                pairs.append(np.column_stack((others, np.full(len(others), missing))))
+            self._possible_groups = self._values[np.concatenate(pairs)].astype(np.int64)
+        return self._possible_groups
 
     def all_combinations(self):
         bell_set = self.bell_set(sorted(list(self._groupings.keys())), True)
@@ -276,22 +441,23 @@ class OrdinalColumn(Column):
 
 
     def group(self, x, y):
+        """
+        Merges the group headed by y into the group headed by x, updating
+        only their bounds. The values are relabelled when they're next read
+        """
         self._possible_groups = None
+        ix, iy = self._position[int(x)], self._position[int(y)]
         if y != self._nan:
-            x = int(x)
-            y = int(y)
-            x_max = self._groupings[x][1]
-            y_min = self._groupings[y][0]
-            if y_min >= x_max:
-                self._groupings[x][1] = self._groupings[y][1]
+            if self._lower[iy] >= self._upper[ix]:
+                self._upper[ix] = self._upper[iy]
             else:
-                self._groupings[x][0] = y_min
-            self._groupings[x][2] = self._groupings[x][2] or self._groupings[y][2]
+                self._lower[ix] = self._lower[iy]
+            self._with_nan[ix] = self._with_nan[ix] or self._with_nan[iy]
         else:
-            self._groupings[x][2] = True
+            self._with_nan[ix] = True
 
-        del self._groupings[y]
-        self.arr[self.arr == y] = x
+        self._active[iy] = False
+        self._merged.append((x, y))
 
     @property
     def type(self):
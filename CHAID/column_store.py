@@ -0,0 +1,185 @@
+import numpy as np
+from .column import NominalColumn, OrdinalColumn, BLOCK_SIZE, compact_dtype, distinct_values
+from .contingency_table import ContingencyTable
+
+
+def consecutive(levels):
+    """ Whether the sorted levels are consecutive integers """
+    return np.issubdtype(levels.dtype, np.integer) and len(levels) > 0 and \
+        int(levels[-1]) - int(levels[0]) == len(levels) - 1
+
+
+def positions(arr, levels, block_size=BLOCK_SIZE):
+    """
+    Returns the position within the sorted levels of every value of arr, in
+    the smallest sufficient integer dtype. arr is read a block at a time
+    """
+    arr = arr.reshape(-1)
+    codes = np.empty(len(arr), dtype=compact_dtype(0, len(levels)))
+    for start in range(0, len(arr), block_size):
+        codes[start:start + block_size] = np.searchsorted(levels, arr[start:start + block_size])
+    return codes
+
+
+class ColumnStore(object):
+    """
+    The independent columns of a tree, encoded once for the whole build.
+    For every column the store holds its distinct values (levels), and for
+    every row the position of its value among those levels. A node then
+    tabulates a column from its rows with a single bincount, and merges the
+    levels present in the node rather than relabelling its rows.
+
+    A column of integers that are all consecutive, such as nominal codes, is
+    its own positions once offset by its lowest value, so it's used in place
+    rather than copied. This keeps memory-mapped columns on disk
+
+    Parameters
+    ----------
+    columns : array<Column>
+        the independent columns
+    levels : array<np.ndarray>
+        the sorted distinct values of every column. Derived from the
+        columns if not passed
+    codes : array<np.ndarray>
+        the position within levels of every row's value, for every column,
+        plus its offset. Derived from the columns if not passed
+    offsets : array<int>
+        the value of codes at the first level of every column (default 0)
+    """
+    def __init__(self, columns, levels=None, codes=None, offsets=None):
+        self.columns = list(columns)
+        if levels is None or codes is None:
+            levels, codes, offsets = [], [], []
+            for column in self.columns:
+                column_levels = distinct_values(column.arr)
+                levels.append(column_levels)
+                if consecutive(column_levels):
+                    codes.append(column.arr.reshape(-1))
+                    offsets.append(int(column_levels[0]))
+                else:
+                    codes.append(positions(column.arr, column_levels))
+                    offsets.append(0)
+        self.levels = list(levels)
+        self.codes = list(codes)
+        self.offsets = [0] * len(self.codes) if offsets is None else list(offsets)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def level_codes(self, i, rows):
+        """
+        Returns the position within the levels of column i of the level of
+        every row of the node, shared by the tabulations of the column
+
+        Parameters
+        ----------
+        i : int
+            the position of the column
+        rows : np.ndarray
+            the rows of the node
+        """
+        return self.codes[i][rows].astype(np.intp) - self.offsets[i]
+
+    def level_counts(self, i, rows, dep_codes, n_categories, weights=None, frequencies=None):
+        """
+        Tabulates column i against the dependent categories for the given
+        rows. Returns the levels x categories frequencies (weighted if
+        weights are passed) and whether each level has any respondents
+
+        Parameters
+        ----------
+        i : int
+            the position of the column
+        rows : np.ndarray
+            the rows of the node
+        dep_codes : np.ndarray
+            the dependent category of every row of the node, in the range
+            [0, n_categories)
+        n_categories : int
+            the number of dependent categories
+        weights : np.ndarray or None
+            the weight of every row of the node
+        frequencies : np.ndarray or None
+            the number of respondents every row of the node stands for, if
+            the rows are cells of pre-aggregated data
+        """
+        codes = self.level_codes(i, rows)
+        categories = np.arange(n_categories)
+        counts = ContingencyTable.from_codes(codes, dep_codes, self.levels[i], categories, frequencies).counts
+        present = counts.sum(axis=1) > 0
+        if weights is not None:
+            counts = ContingencyTable.from_codes(codes, dep_codes, self.levels[i], categories, weights).counts
+        return counts, present
+
+    def level_groups(self, i, rows, values):
+        """
+        Splits the values of the node's rows by their level of column i.
+        Returns whether each level has any rows, and the values of each
+        level present, in row order
+
+        Parameters
+        ----------
+        i : int
+            the position of the column
+        rows : np.ndarray
+            the rows of the node
+        values : np.ndarray
+            a value for every row of the node
+        """
+        codes = self.level_codes(i, rows)
+        counts = np.bincount(codes, minlength=len(self.levels[i]))
+        order = np.argsort(codes, kind='stable')
+        groups = np.split(values[order], np.cumsum(counts)[:-1])
+        present = counts > 0
+        return present, [group for group, is_present in zip(groups, present) if is_present]
+
+    def level_moments(self, i, rows, values):
+        """
+        Summarises the values of the node's rows by their level of column i
+        with bincounts, without grouping the rows. Returns whether each
+        level has any rows, and the count, mean and sum of squared
+        deviations from the mean of the values of each level present
+
+        Parameters
+        ----------
+        i : int
+            the position of the column
+        rows : np.ndarray
+            the rows of the node
+        values : np.ndarray
+            a value for every row of the node
+        """
+        n_levels = len(self.levels[i])
+        codes = self.level_codes(i, rows)
+        counts = np.bincount(codes, minlength=n_levels)
+        present = counts > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.bincount(codes, weights=values, minlength=n_levels) / counts
+        squares = np.bincount(codes, weights=(values - means[codes]) ** 2, minlength=n_levels)
+        return present, counts[present], means[present], squares[present]
+
+    def node_column(self, i, present):
+        """
+        Returns a column holding one row per level of column i present in a
+        node, whose groupings are merged to find the node's split
+
+        Parameters
+        ----------
+        i : int
+            the position of the column
+        present : np.ndarray
+            whether each level of the column has rows in the node
+        """
+        column = self.columns[i]
+        levels = self.levels[i][present]
+        if isinstance(column, OrdinalColumn):
+            return OrdinalColumn(levels, metadata=column.metadata, missing_id=column._missing_id,
+                                 substitute=False, name=column.name)
+        return NominalColumn(levels, metadata=column.metadata, missing_id=column._missing_id,
+                             substitute=False, name=column.name)
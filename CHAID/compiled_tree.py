@@ -0,0 +1,428 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from .column import ContinuousColumn, OrdinalColumn, convert_to_python_type
+
+ORDINAL_MISSING = np.iinfo(np.int64).min
+FORMAT_VERSION = 2
+ARRAYS = ('parent', 'column', 'offset', 'children', 'distributions')
+SURROGATE_ARRAYS = ('surrogate_start', 'surrogate_column', 'surrogate_offset')
+
+
+def branches(values, splits):
+    """ Returns the group of splits each value is in, or -1 if it's in none """
+    branch = np.full(len(values), -1, dtype=np.intp)
+    for index, group in enumerate(splits):
+        branch[np.isin(values, group)] = index
+    return branch
+
+
+def surrogate_tables(node, child_ids, columns, level_index, frequencies=None):
+    """
+    Returns the column and lookup table of every surrogate split of a node,
+    ordered by how many of the node's training rows the surrogate sends to
+    the same child as the node's split. Each group of a surrogate leads to
+    the child that most of the training rows of the group went to
+
+    Parameters
+    ----------
+    node : Node
+        a split node of a built tree, holding the rows it was split from
+    child_ids : array-like
+        the ids of the node's children, in the order of its split
+    columns : array<Column>
+        the independent columns of the tree
+    level_index : array<dict>
+        the position of every code within the levels of every column
+    frequencies : np.ndarray or None
+        the number of respondents every row of the tree stands for
+    """
+    if not len(node.indices) or not node.split.surrogates:
+        return []
+    split = node.split
+    branch = branches(columns[split.column_id].arr[node.indices], split.splits)
+    counts = None if frequencies is None else frequencies[node.indices]
+
+    tables = []
+    for surrogate in split.surrogates:
+        surrogate_branch = branches(columns[surrogate.column_id].arr[node.indices], surrogate.splits)
+        known = (branch >= 0) & (surrogate_branch >= 0)
+        votes = np.bincount(
+            surrogate_branch[known] * len(child_ids) + branch[known],
+            weights=None if counts is None else counts[known], minlength=len(surrogate.splits) * len(child_ids)
+        ).reshape(len(surrogate.splits), len(child_ids))
+        targets = votes.argmax(axis=1)
+        agreement = votes[np.arange(len(targets)), targets].sum()
+
+        index = level_index[surrogate.column_id]
+        table = np.full(len(index), -1, dtype=np.intp)
+        for target, group in zip(targets, surrogate.splits):
+            table[[index[code] for code in group]] = child_ids[target]
+        tables.append((agreement, surrogate.column_id, table))
+    tables.sort(key=lambda surrogate: -surrogate[0])
+    return [(column_id, table) for _, column_id, table in tables]
+
+
+class CompiledTree(object):
+    """
+    A built tree flattened into arrays, so that new rows can be routed to
+    their nodes with vectorised lookups instead of by matching rules.
+
+    Every internal node has a lookup table, indexed by the levels of the
+    column it splits on, giving the id of the child each level belongs to.
+    Rows are moved down one level of the tree at a time for all rows at
+    once. A row whose value isn't in a node's split (a category unseen in
+    training) is routed by the lookup tables of the node's surrogate
+    splits in turn, and stays at that node if none of them include its
+    values
+
+    Parameters
+    ----------
+    parent : np.ndarray
+        the id of the parent of every node, -1 for the root
+    column : np.ndarray
+        the independent column every node splits on, -1 for terminal nodes
+    offset : np.ndarray
+        the position of every node's lookup table within children
+    children : np.ndarray
+        the concatenated lookup tables, holding the child node id of each
+        level, or -1 if the level isn't part of the split
+    column_types : array-like
+        'nominal' or 'ordinal' for every independent column
+    column_levels : array<np.ndarray>
+        the levels indexing the lookup tables of every independent column.
+        Nominal levels are the original values (NaN for missing values),
+        ordinal levels are the integer codes of the column
+    column_names : array-like
+        the name of every independent column, used to select the columns
+        of a DataFrame
+    distributions : np.ndarray
+        the members of every node, one row per node. For a categorical
+        dependent variable, the (weighted) frequency of each category, for a
+        continuous one, the mean and standard deviation
+    members : array-like
+        the names of the columns of distributions
+    dependent_type : str
+        'categorical' or 'continuous'
+    surrogate_start : np.ndarray or None
+        the position of the first surrogate of every node within
+        surrogate_column, followed by the number of surrogates. A node's
+        surrogates are tried in order. No surrogates are used if None
+    surrogate_column : np.ndarray or None
+        the independent column of every surrogate
+    surrogate_offset : np.ndarray or None
+        the position of every surrogate's lookup table within children
+    """
+    def __init__(self, parent, column, offset, children, column_types, column_levels,
+                 column_names, distributions, members, dependent_type='categorical',
+                 surrogate_start=None, surrogate_column=None, surrogate_offset=None):
+        self.parent = parent
+        self.column = column
+        self.offset = offset
+        self.children = children
+        self.column_types = list(column_types)
+        self.column_levels = list(column_levels)
+        self.column_names = list(column_names)
+        self.distributions = distributions
+        self.members = list(members)
+        self.dependent_type = dependent_type
+        if surrogate_start is None:
+            surrogate_start = np.zeros(len(parent) + 1, dtype=np.intp)
+            surrogate_column = surrogate_offset = np.zeros(0, dtype=np.intp)
+        self.surrogate_start = surrogate_start
+        self.surrogate_column = surrogate_column
+        self.surrogate_offset = surrogate_offset
+        self._probabilities = None
+
+    @staticmethod
+    def from_tree(tree):
+        """
+        Flattens a built tree
+
+        Parameters
+        ----------
+        tree : Tree
+            the tree to compile
+        """
+        nodes = list(tree)
+        columns = tree.vectorised_array
+        parent = np.array([-1 if node.parent is None else node.parent for node in nodes], dtype=np.intp)
+        column = np.array([
+            -1 if node.is_terminal else node.split.column_id for node in nodes
+        ], dtype=np.intp)
+
+        codes = [set() for _ in columns]
+        for node in nodes:
+            if not node.is_terminal:
+                for split in [node.split] + node.split.surrogates:
+                    for group in split.splits:
+                        codes[split.column_id].update(group)
+
+        column_types, column_levels, level_index = [], [], []
+        for ind_var, column_codes in zip(columns, codes):
+            column_codes = sorted(column_codes)
+            level_index.append({code: i for i, code in enumerate(column_codes)})
+            column_types.append(ind_var.type)
+            if isinstance(ind_var, OrdinalColumn):
+                # missing values are coded with the minimum of the column's dtype
+                column_levels.append(np.array([
+                    ORDINAL_MISSING if code == ind_var._nan else code for code in column_codes
+                ], dtype=np.int64))
+            else:
+                column_levels.append(np.asarray(pd.Index([
+                    np.nan if code == -1 else ind_var.metadata.get(code, code) for code in column_codes
+                ])))
+
+        offset = np.zeros(len(nodes), dtype=np.intp)
+        surrogate_start = np.zeros(len(nodes) + 1, dtype=np.intp)
+        surrogate_column, surrogate_offset = [], []
+        tables = []
+        size = 0
+        child_ids = [[] for _ in nodes]
+        for node in nodes[1:]:
+            child_ids[node.parent].append(node.node_id)
+        for node in nodes:
+            surrogate_start[node.node_id] = len(surrogate_column)
+            if node.is_terminal:
+                continue
+            index = level_index[node.split.column_id]
+            table = np.full(len(index), -1, dtype=np.intp)
+            for child_id, group in zip(child_ids[node.node_id], node.split.splits):
+                table[[index[code] for code in group]] = child_id
+            offset[node.node_id] = size
+            size += len(table)
+            tables.append(table)
+
+            surrogates = surrogate_tables(
+                node, child_ids[node.node_id], columns, level_index, tree.observed.frequencies
+            )
+            for column_id, table in surrogates:
+                surrogate_column.append(column_id)
+                surrogate_offset.append(size)
+                size += len(table)
+                tables.append(table)
+        surrogate_start[len(nodes)] = len(surrogate_column)
+        children = np.concatenate(tables) if tables else np.zeros(0, dtype=np.intp)
+
+        dependent_type = 'continuous' if isinstance(tree.observed, ContinuousColumn) else 'categorical'
+        members = list(nodes[0].members)
+        distributions = np.array([
+            [node.members[member] for member in members] for node in nodes
+        ], dtype=float).reshape(len(nodes), len(members))
+
+        names = [ind_var.name for ind_var in columns]
+        return CompiledTree(parent, column, offset, children, column_types, column_levels, names,
+                            distributions, members, dependent_type, surrogate_start,
+                            np.array(surrogate_column, dtype=np.intp), np.array(surrogate_offset, dtype=np.intp))
+
+    def save(self, path):
+        """
+        Saves the compiled tree to a directory, holding every per-node
+        array as a .npy file and the column levels and names in
+        metadata.json. Nothing of the training data is kept
+
+        Parameters
+        ----------
+        path : str
+            the directory to save in, created if it doesn't exist
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name in ARRAYS + SURROGATE_ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name), allow_pickle=False)
+        metadata = {
+            'format_version': FORMAT_VERSION,
+            'column_types': self.column_types,
+            'column_levels': [[convert_to_python_type(x) for x in levels] for levels in self.column_levels],
+            'column_names': [convert_to_python_type(x) for x in self.column_names],
+            'members': [convert_to_python_type(x) for x in self.members],
+            'dependent_type': self.dependent_type,
+        }
+        with open(os.path.join(path, 'metadata.json'), 'w') as handle:
+            json.dump(metadata, handle)
+
+    @staticmethod
+    def load(path, mmap_mode='r'):
+        """
+        Loads a compiled tree saved with save, without any of the training
+        data or the Tree, Node and Column objects
+
+        Parameters
+        ----------
+        path : str
+            the directory the tree was saved in
+        mmap_mode : str or None
+            passed to np.load; by default the arrays are memory-mapped read
+            only, so that they are paged in as scoring needs them
+            (default 'r')
+        """
+        with open(os.path.join(path, 'metadata.json')) as handle:
+            metadata = json.load(handle)
+        version = metadata.get('format_version')
+        if version not in (1, FORMAT_VERSION):
+            raise ValueError('Unsupported compiled tree format ' + str(version))
+        # trees saved before surrogates were compiled are loaded without them
+        names = ARRAYS if version == 1 else ARRAYS + SURROGATE_ARRAYS
+        arrays = dict(
+            (name, np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode, allow_pickle=False))
+            for name in names
+        )
+        column_levels = [
+            np.array(levels, dtype=np.int64) if column_type == 'ordinal' else np.asarray(pd.Index(levels))
+            for column_type, levels in zip(metadata['column_types'], metadata['column_levels'])
+        ]
+        return CompiledTree(
+            arrays['parent'], arrays['column'], arrays['offset'], arrays['children'],
+            metadata['column_types'], column_levels, metadata['column_names'],
+            arrays['distributions'], metadata['members'], metadata['dependent_type'],
+            arrays.get('surrogate_start'), arrays.get('surrogate_column'), arrays.get('surrogate_offset')
+        )
+
+    def __len__(self):
+        return len(self.parent)
+
+    @property
+    def classes(self):
+        """ The dependent categories, in the order of the columns of distributions """
+        return np.asarray(pd.Index(self.members))
+
+    @property
+    def predictions(self):
+        """
+        The prediction of every node: the most frequent category of a
+        categorical dependent variable, or the mean of a continuous one
+        """
+        if self.dependent_type == 'continuous':
+            return np.asarray(self.distributions[:, 0])
+        return self.classes[np.argmax(self.distributions, axis=1)]
+
+    @property
+    def probabilities(self):
+        """
+        The share of every dependent category in every node, one row per
+        node and one column per class. Computed once from distributions
+        """
+        if self.dependent_type == 'continuous':
+            raise ValueError('Cannot predict probabilities of a continuous dependent variable')
+        if self._probabilities is None:
+            distributions = np.asarray(self.distributions, dtype=float)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self._probabilities = distributions / distributions.sum(axis=1, keepdims=True)
+        return self._probabilities
+
+    def levels(self, column_id, values):
+        """
+        Returns the position of every value within the levels of an
+        independent column, or -1 for values no split refers to
+
+        Parameters
+        ----------
+        column_id : int
+            the position of the independent column
+        values : array-like
+            the raw values of the column
+        """
+        levels = self.column_levels[column_id]
+        if self.column_types[column_id] == 'ordinal':
+            values = np.asarray(values)
+            if np.issubdtype(values.dtype, np.signedinteger):
+                # integer codes used in place mark missing values with the minimum of their dtype
+                codes = values.astype(np.int64)
+                codes[values == np.iinfo(values.dtype).min] = ORDINAL_MISSING
+            else:
+                values = values.astype(float)
+                codes = np.full(len(values), ORDINAL_MISSING, dtype=np.int64)
+                known = ~np.isnan(values)
+                codes[known] = values[known].astype(np.int64)
+            index = np.searchsorted(levels, codes)
+            index[index == len(levels)] = 0
+            return np.where(levels[index] == codes, index, -1) if len(levels) else np.full(len(codes), -1)
+        return pd.Index(levels).get_indexer(values)
+
+    def columns(self, data):
+        """
+        Returns the raw values of every independent column from a DataFrame
+        (selected by name when the columns are named) or 2-dimensional array
+        """
+        if isinstance(data, pd.DataFrame):
+            if all(name is not None and name in data for name in self.column_names):
+                return [data[name].values for name in self.column_names]
+            data = data.values
+        data = np.asarray(data)
+        return [data[:, i] for i in range(data.shape[1])]
+
+    def apply(self, data):
+        """
+        Returns the id of the node every row of data ends up in
+
+        Parameters
+        ----------
+        data : pandas.DataFrame or numpy.ndarray
+            the independent variables, in the same layout as the tree was
+            built from
+        """
+        values = self.columns(data)
+        n_rows = len(values[0]) if values else 0
+        used = np.unique(np.concatenate([self.column[self.column >= 0], self.surrogate_column]))
+        levels = np.full((n_rows, len(self.column_levels)), -1, dtype=np.intp)
+        for column_id in used:
+            levels[:, column_id] = self.levels(column_id, values[column_id])
+
+        node = np.zeros(n_rows, dtype=np.intp)
+        active = np.arange(n_rows) if self.column[0] >= 0 else np.zeros(0, dtype=np.intp)
+        while len(active):
+            current = node[active]
+            child = self.lookup(levels[active, self.column[current]], self.offset[current])
+
+            # rows the split doesn't route fall back on the node's surrogates in turn
+            unrouted = np.flatnonzero(child < 0)
+            rank = 0
+            while len(unrouted):
+                surrogate = self.surrogate_start[current[unrouted]] + rank
+                remaining = surrogate < self.surrogate_start[current[unrouted] + 1]
+                unrouted, surrogate = unrouted[remaining], surrogate[remaining]
+                level = levels[active[unrouted], self.surrogate_column[surrogate]]
+                child[unrouted] = self.lookup(level, self.surrogate_offset[surrogate])
+                unrouted = unrouted[child[unrouted] < 0]
+                rank += 1
+
+            moved = child >= 0
+            active = active[moved]
+            node[active] = child[moved]
+            active = active[self.column[node[active]] >= 0]
+        return node
+
+    def lookup(self, level, offset):
+        """
+        Returns the child of every row from the lookup tables starting at
+        offset, or -1 for rows whose level (-1 if unknown) has no child
+        """
+        return np.where(level >= 0, self.children[offset + np.maximum(level, 0)], -1)
+
+    def predict(self, data):
+        """
+        Returns the prediction of the node every row of data ends up in
+
+        Parameters
+        ----------
+        data : pandas.DataFrame or numpy.ndarray
+            the independent variables, in the same layout as the tree was
+            built from
+        """
+        return self.predictions[self.apply(data)]
+
+    def predict_proba(self, data):
+        """
+        Returns the probability of every dependent category for every row of
+        data, as the share of the category in the node the row ends up in.
+        One row per row of data and one column per class (in the order of
+        classes)
+
+        Parameters
+        ----------
+        data : pandas.DataFrame or numpy.ndarray
+            the independent variables, in the same layout as the tree was
+            built from
+        """
+        return np.take(self.probabilities, self.apply(data), axis=0)
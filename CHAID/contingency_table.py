@@ -0,0 +1,80 @@
+import numpy as np
+from .level_table import LevelTable
+
+
+class ContingencyTable(LevelTable):
+    """
+    A matrix of independent variable levels x dependent variable categories,
+    holding the (optionally weighted) frequency of every combination
+
+    Parameters
+    ----------
+    counts : np.ndarray
+        2-dimensional array of frequencies, one row per level
+    levels : array-like
+        the independent variable value associated with each row
+    categories : array-like
+        the dependent variable value associated with each column
+    """
+    def __init__(self, counts, levels, categories):
+        super(ContingencyTable, self).__init__(levels)
+        self.counts = counts
+        self.categories = categories
+
+    @staticmethod
+    def from_arrays(ind, dep, weights=None):
+        """
+        Tabulate an independent variable against a dependent variable
+
+        Parameters
+        ----------
+        ind : np.array
+            the independent variable values
+        dep : np.array
+            the dependent variable values
+        weights : array-like or None
+            the respondent weights. If passed, weighted frequencies are
+            tabulated
+        """
+        levels, ind_codes = np.unique(ind, return_inverse=True)
+        categories, dep_codes = np.unique(dep, return_inverse=True)
+        return ContingencyTable.from_codes(ind_codes.ravel(), dep_codes, levels, categories, weights)
+
+    @staticmethod
+    def from_codes(ind_codes, dep_codes, levels, categories, weights=None):
+        """
+        Tabulate an independent variable against a dependent variable, both
+        already coded as positions into their `levels` and `categories`. All
+        cells are counted in a single bincount pass over a combined code
+
+        Parameters
+        ----------
+        ind_codes : np.array
+            integer codes in the range [0, len(levels))
+        dep_codes : np.array
+            integer codes in the range [0, len(categories))
+        levels : array-like
+            the independent variable values the codes refer to
+        categories : array-like
+            the dependent variable values the codes refer to
+        weights : array-like or None
+            the respondent weights (or the number of respondents every row
+            stands for). If passed, weighted frequencies are tabulated
+        """
+        n_levels, n_categories = len(levels), len(categories)
+        combined = ind_codes * n_categories + dep_codes.ravel()
+        counts = np.bincount(
+            combined, weights=None if weights is None else np.asarray(weights, dtype=float),
+            minlength=n_levels * n_categories
+        ).reshape(n_levels, n_categories)
+        return ContingencyTable(counts, levels, categories)
+
+    def merge(self, x, y):
+        """ Folds the frequencies of level y into level x """
+        ix, iy = self._index[x], self._index[y]
+        self.counts[ix] += self.counts[iy]
+        self._active[iy] = False
+
+    def table(self):
+        """ Returns the matrix of the remaining (unmerged) levels """
+        return self.counts[self._active]
@@ -0,0 +1,98 @@
+import numpy as np
+from .level_table import LevelTable
+
+
+def median_deviations(values):
+    """
+    Returns the mean absolute deviation of values from their median, and
+    the sum of squared differences of those absolute deviations from it
+    """
+    deviations = np.abs(values - np.median(values))
+    mean = deviations.mean()
+    return mean, ((deviations - mean) ** 2).sum()
+
+
+class DispersionTable(LevelTable):
+    """
+    The sufficient statistics of a continuous dependent variable within
+    every independent variable level, so that levels are merged and tested
+    for equal variances without going back to the dependent values.
+
+    Every level holds its count, mean and sum of squared deviations from
+    the mean, from which Bartlett's test is computed, and which merge in
+    constant time. Levene's test centres each level on its median, which
+    doesn't merge, so a table built with the values of each level also
+    holds their absolute deviations from the median, and recomputes them
+    from the values when levels are merged
+
+    Parameters
+    ----------
+    counts : np.ndarray
+        the number of rows of each level
+    means : np.ndarray
+        the mean dependent value of each level
+    squares : np.ndarray
+        the sum of squared deviations from the mean of each level
+    levels : array-like
+        the independent variable value associated with each level
+    values : array<np.ndarray> or None
+        the dependent values of each level, if the table is centred on
+        medians for Levene's test
+    """
+    def __init__(self, counts, means, squares, levels, values=None):
+        super(DispersionTable, self).__init__(levels)
+        self.counts = np.asarray(counts)
+        self.means = np.asarray(means, dtype=float)
+        self.squares = np.asarray(squares, dtype=float)
+        self.values = None if values is None else list(values)
+        if self.values is not None:
+            deviations = [median_deviations(level_values) for level_values in self.values]
+            self.deviations = np.array([deviation for deviation, _ in deviations], dtype=float).reshape(-1)
+            self.deviation_squares = np.array([square for _, square in deviations], dtype=float).reshape(-1)
+
+    @staticmethod
+    def from_groups(groups, levels, median_centred=False):
+        """
+        Summarises the dependent values of every level
+
+        Parameters
+        ----------
+        groups : array<np.ndarray>
+            the dependent values of each level
+        levels : array-like
+            the independent variable value associated with each group
+        median_centred : bool
+            whether to keep the values, to centre levels on their medians
+            for Levene's test
+        """
+        counts = np.array([len(group) for group in groups], dtype=np.intp)
+        means = np.array([group.mean() for group in groups], dtype=float)
+        squares = np.array([((group - mean) ** 2).sum() for group, mean in zip(groups, means)], dtype=float)
+        return DispersionTable(counts, means, squares, levels, groups if median_centred else None)
+
+    @property
+    def median_centred(self):
+        return self.values is not None
+
+    def remaining(self):
+        """ Returns the positions of the remaining (unmerged) levels """
+        return np.flatnonzero(self._active)
+
+    def sizes(self):
+        """ Returns the count of the remaining levels """
+        return self.counts[self._active]
+
+    def merge(self, x, y):
+        """ Folds level y into level x """
+        ix, iy = self._index[x], self._index[y]
+        count_x, count_y = self.counts[ix], self.counts[iy]
+        count = count_x + count_y
+        delta = self.means[iy] - self.means[ix]
+        self.means[ix] += delta * count_y / count
+        self.squares[ix] += self.squares[iy] + delta ** 2 * count_x * count_y / count
+        self.counts[ix] = count
+        if self.values is not None:
+            self.values[ix] = np.concatenate((self.values[iy], self.values[ix]))
+            self.deviations[ix], self.deviation_squares[ix] = median_deviations(self.values[ix])
+            self.values[iy] = None
+        self._active[iy] = False
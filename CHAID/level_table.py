@@ -0,0 +1,43 @@
+import numpy as np
+
+
+class LevelTable(object):
+    """
+    The base of the tables holding statistics for every independent variable
+    level, which map levels (and pairs of levels) to their positions in the
+    table, and track the levels that remain as levels are merged
+
+    Parameters
+    ----------
+    levels : array-like
+        the independent variable value associated with each position
+    """
+    def __init__(self, levels):
+        self.levels = list(levels)
+        self._active = np.ones(len(self.levels), dtype=bool)
+        self._levels_index = None
+        self._sorted = None
+
+    @property
+    def _index(self):
+        """ The position of every level, built the first time a level is looked up """
+        if self._levels_index is None:
+            self._levels_index = {level: i for i, level in enumerate(self.levels)}
+        return self._levels_index
+
+    def __len__(self):
+        return int(self._active.sum())
+
+    def index(self, combinations):
+        """ Returns the positions of pairs of levels as an n x 2 array """
+        return np.array([
+            [self._index[x], self._index[y]] for x, y in combinations
+        ], dtype=np.intp).reshape(-1, 2)
+
+    def positions(self, levels):
+        """ Returns the positions of an array of levels, such as an n x 2 array of pairs """
+        if self._sorted is None:
+            order = np.argsort(np.asarray(self.levels), kind='stable')
+            self._sorted = (np.asarray(self.levels)[order], order)
+        values, order = self._sorted
+        return order[np.searchsorted(values, levels)]
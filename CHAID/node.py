@@ -25,6 +25,31 @@ def convert_to_python_type(value):
     return value
 
 
+def category_members(metadata, categories, counts, frequencies):
+    """
+    Returns the members of a node with a categorical dependent variable,
+    mapping every category of metadata to its frequency in the node (0 for
+    the categories without rows in the node)
+
+    Parameters
+    ----------
+    metadata : dict
+        the label of every dependent category
+    categories : array-like
+        the dependent categories that counts and frequencies tabulate
+    counts : np.ndarray
+        the number of rows of each category in the node
+    frequencies : np.ndarray
+        the frequency reported for each category, weighted if the
+        dependent variable is
+    """
+    members = dict((convert_to_python_type(member), 0) for member in metadata.values())
+    for category, count, frequency in zip(categories, counts, frequencies):
+        if count:
+            members[convert_to_python_type(metadata[category])] = convert_to_python_type(frequency)
+    return members
+
+
 class Node(object):
     """
     A node in the CHAID tree
@@ -47,10 +72,14 @@ class Node(object):
         The node_id of the parent of that node
     dep_v : array-like
         The dependent variable set
+    members : dict or None
+        The frequency of each dependent category in the node, for nodes
+        whose dependent variable set isn't held in memory. Derived from
+        dep_v if not passed
     is_terminal : boolean
         Whether the node is terminal
     """
-    def __init__(self, choices=None, split=None, indices=None, node_id=0, parent=None, dep_v=None):
+    def __init__(self, choices=None, split=None, indices=None, node_id=0, parent=None, dep_v=None, members=None):
         indices = [] if indices is None else indices
         self.choices = list(choices or [])
         self.split = split or Split(None, None, None, None, 0)
@@ -58,7 +87,7 @@ class Node(object):
         self.node_id = node_id
         self.parent = parent
         self.dep_v = dep_v
-        self._members = None
+        self._members = members
 
     def __hash__(self):
         return hash(self.__dict__)
@@ -102,21 +131,17 @@ class Node(object):
                     's.t.d': convert_to_python_type(self.dep_v.arr.std())
                 }
             else:
-                metadata = dep_v.metadata
-                self._members = {}
-                for member in metadata.values():
-                    self._members[convert_to_python_type(member)] = 0
-
-                if dep_v.weights is None:
-                    counts = np.transpose(np.unique(dep_v.arr, return_counts=True))
+                categories, codes = np.unique(dep_v.arr, return_inverse=True)
+                codes = codes.ravel()
+                counts = np.bincount(codes, minlength=len(categories))
+                if dep_v.weights is not None:
+                    frequencies = np.bincount(codes, weights=dep_v.weights, minlength=len(categories))
+                elif dep_v.frequencies is not None:
+                    # pre-aggregated rows count as the respondents they stand for
+                    frequencies = np.bincount(codes, weights=dep_v.frequencies, minlength=len(categories))
                 else:
-                    counts = np.array([
-                        [i, dep_v.weights[dep_v.arr == i].sum()] for i in set(dep_v.arr)
-                    ])
-
-                self._members.update(
-                    (convert_to_python_type(metadata[k]), convert_to_python_type(v))
-                    for k, v in counts
-                )
+                    # frequencies are reported as floats, as weighted frequencies are
+                    frequencies = counts.astype(float)
+                self._members = category_members(dep_v.metadata, categories, counts, frequencies)
 
         return self._members
@@ -0,0 +1,265 @@
+import os
+import mmap
+from copy import copy
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from .column_store import ColumnStore
+
+BACKENDS = ('process', 'thread')
+
+# the state of a process worker, set once when the worker starts
+_worker_stats = None
+_worker_store = None
+_worker_memory = []
+
+
+def effective_n_jobs(n_jobs):
+    """
+    Returns the number of workers to use, where negative values count back
+    from the number of cpus (-1 meaning all of them)
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs == 0:
+        raise ValueError('n_jobs must not be 0')
+    if n_jobs < 0:
+        return max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return n_jobs
+
+
+def attach_shared_memory(name):
+    """
+    Attaches to an existing block of shared memory without taking ownership
+    of it, the creating process is responsible for unlinking it
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 registers the block again, which is harmless as
+        # workers share the resource tracker of the process that created it
+        return shared_memory.SharedMemory(name=name)
+
+
+def mapped_file(arr):
+    """
+    Returns the file and byte offset that a contiguous view of a np.memmap
+    maps, or None if arr isn't one
+    """
+    base = arr
+    while isinstance(base, np.ndarray) and not isinstance(base.base, mmap.mmap):
+        base = base.base
+    if not isinstance(base, np.memmap) or base.filename is None or not arr.flags.c_contiguous or not arr.size:
+        return None
+    # the start of the memmap maps the byte at its offset within the file
+    start = arr.__array_interface__['data'][0] - base.__array_interface__['data'][0]
+    return base.filename, base.offset + start
+
+
+class SharedArray(object):
+    """
+    A picklable handle on an array held in shared memory, so that process
+    workers can read the array without it being copied. An array mapping a
+    file is mapped again by the workers instead, so it's never read into
+    memory
+
+    Parameters
+    ----------
+    arr : np.ndarray
+        the array to share
+    """
+    def __init__(self, arr):
+        self.shape = arr.shape
+        self.dtype = arr.dtype
+        self.memory_name = None
+        self._memory = None
+        self.mapped = mapped_file(arr)
+        if self.mapped is not None:
+            return
+        self._memory = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=self._memory.buf)[...] = arr
+        self.memory_name = self._memory.name
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_memory'] = None
+        return state
+
+    def attach(self):
+        """ Returns a view of the shared values in place """
+        if self.mapped is not None:
+            filename, offset = self.mapped
+            return np.memmap(filename, dtype=self.dtype, mode='r', offset=offset, shape=self.shape)
+        memory = attach_shared_memory(self.memory_name)
+        _worker_memory.append(memory)
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=memory.buf)
+
+    def release(self):
+        """ Frees the shared memory, called by the process that created it """
+        if self._memory is not None:
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
+
+
+class SharedColumnStore(object):
+    """
+    A picklable handle on a ColumnStore whose row codes are held in shared
+    memory. The columns are sent without their rows, as workers only group
+    the levels of each node
+
+    Parameters
+    ----------
+    store : ColumnStore
+        the store to share
+    """
+    def __init__(self, store):
+        self.columns = []
+        for column in store.columns:
+            column = copy(column)
+            column.arr = column.arr[:0]
+            self.columns.append(column)
+        self.levels = store.levels
+        self.offsets = store.offsets
+        self.codes = []
+        try:
+            for codes in store.codes:
+                self.codes.append(SharedArray(codes))
+        except Exception:
+            self.release()
+            raise
+
+    def attach(self):
+        """ Rebuilds the store, viewing the shared codes in place """
+        return ColumnStore(self.columns, self.levels, [codes.attach() for codes in self.codes], self.offsets)
+
+    def release(self):
+        """ Frees the shared memory, called by the process that created it """
+        for codes in self.codes:
+            codes.release()
+        self.codes = []
+
+
+def init_worker(stats, shared_store):
+    """ Sets up a process worker with the statistics and shared column store """
+    global _worker_stats, _worker_store
+    _worker_stats = stats
+    _worker_store = shared_store.attach()
+
+
+def evaluate_chunk(stats, store, method, chunk, dep, rows, args):
+    """ Evaluates the predictors in chunk, returning their outcomes in order """
+    evaluate = getattr(stats, method)
+    return [evaluate(i, store, dep, rows, *args) for i in chunk]
+
+
+def evaluate_shared_chunk(method, chunk, dep, rows, args):
+    """ Evaluates the predictors in chunk within a process worker """
+    return evaluate_chunk(_worker_stats, _worker_store, method, chunk, dep, rows, args)
+
+
+def split_shared_node(dep, rows):
+    """ Finds the best split of the node holding rows within a process worker """
+    return _worker_stats.best_split(_worker_store, dep, rows)
+
+
+class WorkerPool(object):
+    """
+    A pool of workers that either evaluates the independent columns of a
+    node concurrently, or splits several nodes concurrently. Columns are
+    split into contiguous chunks and the outcomes are gathered back in
+    column order, so that the reduction to the best split is the same as
+    when evaluating serially
+
+    Parameters
+    ----------
+    stats : Stats
+        the statistics used to evaluate each column. The pool is attached to
+        it while in use as a context manager
+    store : ColumnStore
+        the encoded independent columns shared by every node of the tree
+    n_jobs : int
+        the number of workers; -1 uses every cpu (default -1)
+    backend : str
+        'process' to evaluate in worker processes reading the columns from
+        shared memory, or 'thread' to evaluate in threads of this process
+        (default 'process')
+    """
+    def __init__(self, stats, store, n_jobs=-1, backend='process'):
+        if backend not in BACKENDS:
+            raise NotImplementedError('Unknown parallel backend ' + str(backend))
+        self.stats = stats
+        self.store = store
+        # nodes are split in the workers one at a time, evaluating their columns serially
+        self._serial_stats = copy(stats)
+        self.backend = backend
+        self.n_jobs = effective_n_jobs(n_jobs)
+        self._shared_store = None
+        if backend == 'process':
+            self._shared_store = SharedColumnStore(store)
+            try:
+                self._executor = ProcessPoolExecutor(
+                    self.n_jobs, initializer=init_worker, initargs=(stats, self._shared_store)
+                )
+            except Exception:
+                self._release()
+                raise
+        else:
+            self._executor = ThreadPoolExecutor(self.n_jobs)
+
+    def __enter__(self):
+        self.stats.pool = self
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.pool = None
+        self.close()
+
+    def shares(self, store):
+        """ Whether the workers evaluate the columns of this store """
+        return store is self.store
+
+    def chunks(self):
+        """ Splits the column positions into one contiguous chunk per worker """
+        return [chunk.tolist() for chunk in np.array_split(np.arange(len(self.store)), self.n_jobs) if len(chunk)]
+
+    def map(self, method, dep, rows, args):
+        """
+        Calls the named Stats method for every column on the given rows,
+        returning the outcomes in column order
+        """
+        if self.backend == 'process':
+            futures = [
+                self._executor.submit(evaluate_shared_chunk, method, chunk, dep, rows, args)
+                for chunk in self.chunks()
+            ]
+        else:
+            futures = [
+                self._executor.submit(evaluate_chunk, self.stats, self.store, method, chunk, dep, rows, args)
+                for chunk in self.chunks()
+            ]
+        return [outcome for future in futures for outcome in future.result()]
+
+    def map_nodes(self, nodes):
+        """
+        Finds the best split of every (dependent column, rows) node, returning
+        the splits in the order of the nodes
+        """
+        if self.backend == 'process':
+            futures = [self._executor.submit(split_shared_node, dep, rows) for dep, rows in nodes]
+        else:
+            futures = [
+                self._executor.submit(self._serial_stats.best_split, self.store, dep, rows)
+                for dep, rows in nodes
+            ]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """ Stops the workers and frees the shared column store """
+        self._executor.shutdown(wait=True)
+        self._release()
+
+    def _release(self):
+        if self._shared_store is not None:
+            self._shared_store.release()
+            self._shared_store = None
@@ -0,0 +1,131 @@
+import numpy as np
+
+BLOCK_SIZE = 1 << 13
+MAX_PARTITIONS = 5000000
+
+# how a level may be placed, given the groups of the levels before it
+JOIN_ANY = 0
+JOIN_LAST = 1
+JOIN_NONE = 2
+
+
+def level_moves(column):
+    """
+    Returns the order in which the levels of a node column are placed into
+    groups, as positions into column.arr, and how each level may be placed.
+
+    Any level of a nominal column may join any group. An ordinal level may
+    only join the group of the level before it if their values are
+    consecutive, as the column merges them, and the missing level is placed
+    last and may join any group
+    """
+    levels = np.asarray(column.arr)
+    if column.type != 'ordinal':
+        return np.arange(len(levels)), np.full(len(levels), JOIN_ANY, dtype=np.int8)
+    missing = levels == column._nan
+    present = np.flatnonzero(~missing)
+    order = np.concatenate((present[np.argsort(levels[present], kind='stable')], np.flatnonzero(missing)))
+    values = levels[order].astype(np.int64)
+    moves = np.full(len(order), JOIN_NONE, dtype=np.int8)
+    moves[1:][np.diff(values) == 1] = JOIN_LAST
+    moves[missing[order]] = JOIN_ANY
+    return order, moves
+
+
+def partition_count(moves, max_groups=None):
+    """
+    Returns the number of ways of grouping levels placed by moves into at
+    most max_groups groups, counting the grouping of every level together.
+    For a nominal column this is the Bell number of the number of levels
+    """
+    n = len(moves)
+    max_groups = n if max_groups is None else min(max_groups, n)
+    if n == 0:
+        return 0
+    # ways[k] is the number of ways of placing the levels so far into k + 1 groups
+    ways = [0] * max_groups
+    ways[0] = 1
+    for move in moves[1:]:
+        opened = [0] + ways[:-1]
+        if move == JOIN_ANY:
+            ways = [(k + 1) * way + new for k, (way, new) in enumerate(zip(ways, opened))]
+        elif move == JOIN_LAST:
+            ways = [way + new for way, new in zip(ways, opened)]
+        else:
+            ways = opened
+    return sum(ways)
+
+
+def restricted_growth_strings(moves, counts, min_size=0, max_groups=None, block_size=BLOCK_SIZE):
+    """
+    Enumerates the groupings of levels into at least two groups as
+    restricted growth strings: the group of every level, numbered in the
+    order the groups are first used. Strings are built a level at a time
+    for blocks of prefixes at once, in lexicographic order, and a prefix is
+    dropped as soon as it has too many groups, or as soon as the levels
+    left can't bring every group up to min_size. The frequencies of the
+    groups are summed along the way.
+
+    Yields the strings a block at a time, as an array of strings x levels,
+    along with the number of groups of every string and its frequencies, as
+    an array of strings x max_groups x categories
+
+    Parameters
+    ----------
+    moves : np.ndarray
+        how each level may be placed, as given by level_moves
+    counts : np.ndarray
+        the levels x categories frequencies, whose sum over categories is
+        the size of each level
+    min_size : float
+        the minimum size of a group
+    max_groups : int or None
+        the maximum number of groups; no limit if None
+    block_size : int
+        the number of prefixes extended at once
+    """
+    n = len(moves)
+    sizes = counts.sum(axis=1).astype(float)
+    max_groups = n if max_groups is None else min(max_groups, n)
+    if n < 2 or max_groups < 2:
+        return
+    remaining = np.append(np.cumsum(sizes[::-1])[::-1], 0)
+    groups = np.arange(max_groups)
+
+    group_sizes = np.zeros((1, max_groups))
+    group_sizes[0, 0] = sizes[0]
+    grouped = np.zeros((1, max_groups, counts.shape[1]), dtype=counts.dtype)
+    grouped[0, 0] = counts[0]
+    stack = [(1, np.zeros((1, n), dtype=np.int8), np.ones(1, dtype=np.intp), group_sizes, grouped)]
+    while stack:
+        level, strings, used, group_sizes, grouped = stack.pop()
+        if level == n:
+            valid = (used > 1) & ((group_sizes >= min_size) | (groups >= used[:, None])).all(axis=1)
+            if valid.any():
+                yield strings[valid], used[valid], grouped[valid]
+            continue
+
+        if moves[level] == JOIN_ANY:
+            allowed = groups <= used[:, None]
+        elif moves[level] == JOIN_LAST:
+            allowed = (groups == used[:, None] - 1) | (groups == used[:, None])
+        else:
+            allowed = groups == used[:, None]
+        prefix, group = np.nonzero(allowed)
+        index = np.arange(len(prefix))
+        strings = strings[prefix]
+        strings[:, level] = group
+        used = np.maximum(used[prefix], group + 1)
+        group_sizes = group_sizes[prefix]
+        group_sizes[index, group] += sizes[level]
+
+        deficit = np.where(groups < used[:, None], np.clip(min_size - group_sizes, 0, None), 0).sum(axis=1)
+        feasible = np.flatnonzero(deficit <= remaining[level + 1] * (1 + 1e-9))
+        grouped = grouped[prefix[feasible]]
+        grouped[np.arange(len(feasible)), group[feasible]] += counts[level]
+        # blocks are pushed last first so that the strings come out in order
+        for start in reversed(range(0, len(feasible), block_size)):
+            keep = feasible[start:start + block_size]
+            stack.append((
+                level + 1, strings[keep], used[keep], group_sizes[keep], grouped[start:start + block_size]
+            ))
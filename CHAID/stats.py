@@ -1,10 +1,111 @@
-import collections as cl
 from .column import ContinuousColumn
+from .column_store import ColumnStore
+from .contingency_table import ContingencyTable
+from .dispersion_table import DispersionTable
+from .partitions import MAX_PARTITIONS, level_moves, partition_count, restricted_growth_strings
 from .split import Split
+import warnings
 import numpy as np
 from scipy import stats
+from scipy.special import chdtrc, fdtrc
 from .invalid_split_reason import InvalidSplitReason
-from numpy import nan as NaN
+
+IPF_TOLERANCE = 10e-6
+IPF_MAX_ITERATIONS = 1000
+TOTAL_TOLERANCE = 1e-9
+VARIANCE_TESTS = ('bartlett', 'levene')
+GROUPINGS = ('heuristic', 'optimal')
+
+
+def ipf_expected(n_ij, tol=IPF_TOLERANCE, max_iter=IPF_MAX_ITERATIONS):
+    """
+    Fits the expected frequencies of the SPSS weighted chisquare for a
+    matrix of ind_v x dep_v by iterative proportional fitting. Empty cells
+    are given a very small weight, otherwise they break the chi-squared test.
+
+    When no cell is empty the fit is the independence model, which is
+    returned in closed form.
+
+    Returns the expected frequencies and whether the fit converged within
+    max_iter iterations
+    """
+    n_ij = np.asarray(n_ij, dtype=float)
+    row_sum = n_ij.sum(axis=1)
+    col_sum = n_ij.sum(axis=0)
+    empty = n_ij == 0
+    if not empty.any():
+        return (np.outer(row_sum, col_sum) / row_sum.sum(), True)
+
+    w_ij = np.where(empty, 0.000001, 1.0)
+    m_ij = w_ij.copy()
+    fitted = np.empty_like(w_ij)
+    alpha = np.ones((n_ij.shape[0], 1))
+    for _ in range(max_iter):
+        alpha *= (row_sum / m_ij.sum(axis=1))[:, None]
+        np.multiply(alpha, w_ij, out=fitted)
+        fitted *= col_sum / fitted.sum(axis=0)
+        eps = np.max(np.absolute(fitted - m_ij))
+        m_ij, fitted = fitted, m_ij
+        if not eps > tol:
+            return (m_ij, True)
+    return (m_ij, False)
+
+
+def ipf_expected_batch(n_ij, tol=IPF_TOLERANCE, max_iter=IPF_MAX_ITERATIONS):
+    """
+    Fits the expected frequencies of a stack of ind_v x dep_v matrices at
+    once, as ipf_expected does for a single matrix. Matrices stop being
+    updated as soon as they converge, so each fit is the same as fitting it
+    on its own.
+
+    Returns the expected frequencies and an array of whether each fit
+    converged
+    """
+    n_ij = np.asarray(n_ij, dtype=float)
+    row_sum = n_ij.sum(axis=2)
+    col_sum = n_ij.sum(axis=1)
+    empty = n_ij == 0
+    m_ij = row_sum[:, :, None] * col_sum[:, None, :] / row_sum.sum(axis=1)[:, None, None]
+    converged = np.ones(len(n_ij), dtype=bool)
+
+    active = np.flatnonzero(empty.any(axis=(1, 2)))
+    if len(active) == 0:
+        return (m_ij, converged)
+
+    w_ij = np.where(empty[active], 0.000001, 1.0)
+    row_sum, col_sum = row_sum[active], col_sum[active]
+    fit = w_ij.copy()
+    # every iteration fits into the buffer of the previous fit, once it has been compared
+    fitted = np.empty_like(fit)
+    alpha = np.ones(row_sum.shape + (1,))
+    for _ in range(max_iter):
+        alpha *= (row_sum / fit.sum(axis=2))[:, :, None]
+        np.multiply(alpha, w_ij, out=fitted)
+        fitted *= (col_sum / fitted.sum(axis=1))[:, None, :]
+        np.subtract(fitted, fit, out=fit)
+        eps = np.absolute(fit, out=fit).max(axis=(1, 2))
+        fit, fitted = fitted, fit
+
+        done = ~(eps > tol)
+        m_ij[active[done]] = fit[done]
+        if done.all():
+            return (m_ij, converged)
+        if done.any():
+            keep = ~done
+            active, w_ij, fit, fitted, alpha = active[keep], w_ij[keep], fit[keep], fitted[keep], alpha[keep]
+            row_sum, col_sum = row_sum[keep], col_sum[keep]
+
+    m_ij[active] = fit
+    converged[active] = False
+    return (m_ij, converged)
+
+
+def warn_not_converged(count):
+    warnings.warn(RuntimeWarning(
+        'Weighted chisquare fit did not converge after {} iterations for {} '
+        'table(s)'.format(IPF_MAX_ITERATIONS, count)
+    ))
+
 
 def chisquare(n_ij, weighted):
     """
@@ -12,21 +113,9 @@ def chisquare(n_ij, weighted):
     for the unweighted and SPSS weighted case
     """
     if weighted:
-        m_ij = n_ij / n_ij
-
-        nan_mask = np.isnan(m_ij)
-        m_ij[nan_mask] = 0.000001  # otherwise it breaks the chi-squared test
-
-        w_ij = m_ij
-        n_ij_col_sum = n_ij.sum(axis=1)
-        n_ij_row_sum = n_ij.sum(axis=0)
-        alpha, beta, eps = (1, 1, 1)
-        while eps > 10e-6:
-            alpha = alpha * np.vstack(n_ij_col_sum / m_ij.sum(axis=1))
-            beta = n_ij_row_sum / (alpha * w_ij).sum(axis=0)
-            eps = np.max(np.absolute(w_ij * alpha * beta - m_ij))
-            m_ij = w_ij * alpha * beta
-
+        m_ij, converged = ipf_expected(n_ij)
+        if not converged:
+            warn_not_converged(1)
     else:
         m_ij = (np.vstack(n_ij.sum(axis=1)) * n_ij.sum(axis=0)) / n_ij.sum().astype(float)
 
@@ -36,229 +125,582 @@ def chisquare(n_ij, weighted):
     return (chi, p_val, dof)
 
 
+def chisquare_batch(n_ij, weighted):
+    """
+    Calculates the chisquare for a stack of ind_v x dep_v matrices at once,
+    returning arrays of chi, p-values and degrees of freedom.
+
+    In the unweighted case, dependent categories that are empty in a given
+    matrix are left out of that matrix's statistic and degrees of freedom,
+    equivalent to calling `chisquare` on the matrix without those columns
+    """
+    n_ij = np.asarray(n_ij, dtype=float)
+    if len(n_ij) == 0:
+        return (np.zeros(0), np.zeros(0), np.zeros(0, dtype=int))
+
+    if weighted:
+        # matrices with an empty row or column have undefined expected frequencies
+        with np.errstate(divide='ignore', invalid='ignore'):
+            m_ij, converged = ipf_expected_batch(n_ij)
+        if not converged.all():
+            warn_not_converged((~converged).sum())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            chi = ((n_ij - m_ij) ** 2 / m_ij).sum(axis=(1, 2))
+        dof = np.full(len(n_ij), (n_ij.shape[1] - 1) * (n_ij.shape[2] - 1))
+        return (chi, chdtrc(dof, chi), dof)
+
+    row_sum = n_ij.sum(axis=2)
+    col_sum = n_ij.sum(axis=1)
+    observed = col_sum > 0
+    terms = np.zeros_like(n_ij)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m_ij = row_sum[:, :, None] * col_sum[:, None, :] / row_sum.sum(axis=1)[:, None, None]
+        np.divide((n_ij - m_ij) ** 2, m_ij, out=terms, where=observed[:, None, :])
+    chi = terms.sum(axis=(1, 2))
+
+    dof = (n_ij.shape[1] - 1) * (observed.sum(axis=1) - 1)
+    return (chi, chdtrc(dof, chi), dof)
+
+
+def bartlett_batch(counts, squares):
+    """
+    Calculates Bartlett's test for equal variances of several tests at once,
+    from the count and sum of squared deviations from the mean of each of
+    their groups, given as tests x groups arrays. Returns arrays of the
+    statistic and p-value, as scipy.stats.bartlett does from the values
+    """
+    counts = np.asarray(counts, dtype=float)
+    k = counts.shape[1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variances = squares / (counts - 1)
+        total = counts.sum(axis=1)
+        pooled = ((counts - 1) * variances).sum(axis=1) / (total - k)
+        numer = (total - k) * np.log(pooled) - ((counts - 1) * np.log(variances)).sum(axis=1)
+        denom = 1 + 1.0 / (3 * (k - 1)) * ((1 / (counts - 1)).sum(axis=1) - 1 / (total - k))
+        statistic = numer / denom
+    return np.clip(statistic, 0, np.inf), chdtrc(k - 1, statistic)
+
+
+def levene_batch(counts, deviations, deviation_squares):
+    """
+    Calculates Levene's test (centred on the median) for equal variances of
+    several tests at once, from the count, mean absolute deviation from the
+    median and sum of squared differences from that mean of each of their
+    groups, given as tests x groups arrays. Returns arrays of the statistic
+    and p-value, as scipy.stats.levene does from the values
+    """
+    counts = np.asarray(counts, dtype=float)
+    k = counts.shape[1]
+    total = counts.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (counts * deviations).sum(axis=1) / total
+        numer = (total - k) * (counts * (deviations - mean[:, None]) ** 2).sum(axis=1)
+        denom = (k - 1.0) * deviation_squares.sum(axis=1)
+        statistic = numer / denom
+    return statistic, fdtrc(k - 1.0, total - k, statistic)
+
+
+def dispersion_tests(table, index):
+    """
+    Tests the levels of a DispersionTable at each row of index (positions
+    of levels) for equal variances, with Levene's test if the table is
+    centred on medians, and Bartlett's test otherwise
+    """
+    if table.median_centred:
+        return levene_batch(table.counts[index], table.deviations[index], table.deviation_squares[index])
+    return bartlett_batch(table.counts[index], table.squares[index])
+
+
+def select_variance_test(population, sample_size=None, random_state=0):
+    """
+    Chooses the test for equal variances of a continuous dependent
+    variable: Bartlett's test if its population is normally distributed by
+    D'Agostino and Pearson's test, and Levene's test otherwise. If
+    sample_size is less than the population, the normality test is run on
+    a sample of that many values, drawn reproducibly with replacement
+    """
+    population = np.asarray(population)
+    if sample_size is not None and sample_size < len(population):
+        sample = np.random.RandomState(random_state).randint(0, len(population), sample_size)
+        population = population[sample]
+    return 'bartlett' if stats.normaltest(population)[1] > 0.05 else 'levene'
+
+
+def most_similar_pair(p_vals, chis):
+    """
+    Returns the position of the pair to merge: the highest p-value, with ties
+    broken by the highest chi. Resolves exactly as comparing the pairs one
+    after another in order would, including when p-values are NaN
+    """
+    if len(p_vals) == 0:
+        return None
+    if np.isnan(p_vals[0]):
+        return 0
+    with np.errstate(invalid='ignore'):
+        candidates = np.flatnonzero(p_vals == np.nanmax(p_vals))
+    choice = candidates[0]
+    for k in candidates[1:]:
+        if chis[k] > chis[choice]:
+            choice = k
+    return choice
+
+
+class MergeState(object):
+    """
+    The pairwise statistics of the levels of a ContingencyTable during the
+    heuristic merge. Statistics are cached between merge rounds, so that after
+    a merge only the pairs involving the merged level are recomputed
+
+    Parameters
+    ----------
+    table : ContingencyTable
+        the frequencies of the levels being merged
+    weighted : bool
+        whether to run the SPSS weighted chisquare
+    """
+    def __init__(self, table, weighted):
+        self.table = table
+        self.weighted = weighted
+        size = len(table.levels)
+        self._known = np.zeros((size, size), dtype=bool)
+        self._scored = np.zeros((size, size), dtype=bool)
+        self._total = np.zeros((size, size))
+        self._observed = np.zeros((size, size), dtype=int)
+        self._chi = np.zeros((size, size))
+        self._p = np.zeros((size, size))
+
+    def _index(self, combinations):
+        index = self.table.index(combinations)
+        return index[:, 0], index[:, 1]
+
+    def _store(self, store, x, y, values):
+        store[x, y] = values
+        store[y, x] = values
+
+    def totals(self, combinations):
+        """
+        Returns the total frequency of each pair, and how many dependent
+        categories the pair is observed in
+        """
+        return self.pair_totals(*self._index(combinations))
+
+    def pair_totals(self, x, y):
+        """ As totals, for pairs given by the positions x and y of their levels in the table """
+        missing = ~self._known[x, y]
+        if missing.any():
+            mx, my = x[missing], y[missing]
+            n_ijs = self.table.counts[mx] + self.table.counts[my]
+            self._store(self._total, mx, my, n_ijs.sum(axis=1))
+            self._store(self._observed, mx, my, (n_ijs != 0).sum(axis=1))
+            self._store(self._known, mx, my, True)
+        return self._total[x, y], self._observed[x, y]
+
+    def scores(self, combinations):
+        """ Returns the chi and p-value of merging each pair """
+        return self.pair_scores(*self._index(combinations))
+
+    def pair_scores(self, x, y):
+        """ As scores, for pairs given by the positions x and y of their levels in the table """
+        missing = ~self._scored[x, y]
+        if missing.any():
+            mx, my = x[missing], y[missing]
+            n_ijs = np.stack((self.table.counts[mx], self.table.counts[my]), axis=1)
+            chi, p_val, _ = chisquare_batch(n_ijs, self.weighted)
+            self._store(self._chi, mx, my, chi)
+            self._store(self._p, mx, my, p_val)
+            self._store(self._scored, mx, my, True)
+        return self._chi[x, y], self._p[x, y]
+
+    def merge(self, x, y):
+        """ Merges level y into level x, forgetting the statistics of x """
+        self.table.merge(x, y)
+        ix = self.table.index([(x, y)])[0, 0]
+        for store in (self._known, self._scored):
+            store[ix, :] = False
+            store[:, ix] = False
+
+
 class Stats(object):
     """
     Stats class that determines the correct statistical method to apply
     """
-    def __init__(self, alpha_merge, min_child_node_size, max_splits, split_threshold, dep_population, is_exhaustive=False):
+    def __init__(self, alpha_merge, min_child_node_size, max_splits, split_threshold, dep_population, is_exhaustive=False,
+                 variance_test=None, normality_sample_size=None, grouping='heuristic'):
+        if variance_test is not None and variance_test not in VARIANCE_TESTS:
+            raise NotImplementedError('Unknown variance test ' + str(variance_test))
+        if grouping not in GROUPINGS:
+            raise NotImplementedError('Unknown grouping ' + str(grouping))
         self.split_threshold = 1 - split_threshold
         self.alpha_merge = alpha_merge
         self.min_child_node_size = min_child_node_size
         self.max_splits = max_splits
         self.dep_population = dep_population
         self.is_exhaustive = is_exhaustive
-
-    def best_split(self, ind, dep):
-        """ determine which splitting function to apply """
+        self.grouping = grouping
+        self.normality_sample_size = normality_sample_size
+        self._variance_test = variance_test
+        self.pool = None
+
+    @property
+    def variance_test(self):
+        """
+        The test for equal variances of a continuous dependent variable,
+        'bartlett' or 'levene'. Unless it was given, it's chosen by the
+        normality of the dependent population the first time it's needed,
+        and kept for every node after
+        """
+        if self._variance_test is None:
+            self._variance_test = select_variance_test(self.dep_population, self.normality_sample_size)
+        return self._variance_test
+
+    def __getstate__(self):
+        # a pool of workers can't be sent to (or used from) another process
+        state = dict(self.__dict__)
+        state['pool'] = None
+        # once the variance test is chosen the population isn't needed again
+        if state['_variance_test'] is not None:
+            state['dep_population'] = None
+        return state
+
+    def best_split(self, ind, dep, rows=None):
+        """
+        determine which splitting function to apply. ind is the ColumnStore
+        (or the independent columns) of the whole tree, and if rows are
+        passed only those rows are considered
+        """
         if isinstance(dep, ContinuousColumn):
-            return self.best_con_split(ind, dep)
+            return self.best_con_split(ind, dep, rows)
         else:
-            return self.best_cat_heuristic_split(ind, dep)
+            return self.best_cat_heuristic_split(ind, dep, rows)
+
+    def evaluate_predictors(self, method, ind, dep, rows, *args):
+        """
+        Calls the named per-predictor method for every independent column,
+        returning the outcomes in column order. The columns are handed out to
+        the pool of workers when one is attached and shares these columns
+        """
+        if not isinstance(ind, ColumnStore):
+            ind = ColumnStore(ind)
+        if rows is None:
+            rows = np.arange(len(dep.arr))
+        if self.pool is not None and self.pool.shares(ind):
+            return self.pool.map(method, dep, rows, args)
+        evaluate = getattr(self, method)
+        return [evaluate(i, ind, dep, rows, *args) for i in range(len(ind))]
+
+    def keep_best_split(self, split, temp_split, i):
+        """
+        Returns the better of the current best split and the split of
+        column i, collecting the other as a surrogate
+        """
+        better_split = not split.valid() or temp_split.p < split.p or \
+            (temp_split.p == split.p and temp_split.score > split.score)
+
+        if better_split:
+            split, temp_split = temp_split, split
+
+        score_threshold = self.split_threshold * split.score
+
+        if temp_split.valid() and temp_split.score >= score_threshold:
+            for sur in temp_split.surrogates:
+                if sur.column_id != i and sur.score >= score_threshold:
+                    split.surrogates.append(sur)
+
+            temp_split.surrogates = []
+            split.surrogates.append(temp_split)
+        return split
 
-    def best_cat_heuristic_split(self, ind, dep):
-        """ determine best categorical variable split using heuristic methods """
+    def invalid_cat_node(self, n_categories, n_rows, weighted):
+        """
+        Returns why a node of n_rows rows observed in n_categories dependent
+        categories can't be split, or None if its columns should be merged
+        """
+        if n_categories == 1:
+            return InvalidSplitReason.PURE_NODE
+        elif n_rows < self.min_child_node_size and not weighted:
+            # if not weights and too small, skip
+            return InvalidSplitReason.MIN_CHILD_NODE_SIZE
+        elif weighted and n_rows < self.min_child_node_size:
+            # if weighted count is too small, skip
+            return InvalidSplitReason.PURE_NODE
+        return None
+
+    def best_cat_outcome(self, ind, outcomes):
+        """
+        Reduces the outcomes of merging every column of a node against a
+        categorical dependent variable to the best split
+        """
         split = Split(None, None, None, None, 0)
-        min_child_node_size = self.min_child_node_size
+        for i, (temp_split, reasons) in enumerate(outcomes):
+            # must reset because using invalid reason to break
+            split.invalid_reason = reasons[-1] if reasons else None
+            if temp_split is not None:
+                split = self.keep_best_split(split, temp_split, i)
 
-        all_dep = np.unique(dep.arr)
-        if len(all_dep) == 1:
-            split.invalid_reason = InvalidSplitReason.PURE_NODE
-            return split
-        elif len(dep.arr) < min_child_node_size and dep.weights is None:
-            # if not weights and too small, skip
-            split.invalid_reason = InvalidSplitReason.MIN_CHILD_NODE_SIZE
+        if split.valid():
+            split.sub_split_values(ind[split.column_id].metadata)
+        return split
+
+    def best_cat_heuristic_split(self, ind, dep, rows=None):
+        """ determine best categorical variable split using heuristic methods """
+        all_dep, dep_codes = np.unique(dep.arr, return_inverse=True)
+        # pre-aggregated rows count as the respondents they stand for
+        n_rows = len(dep.arr) if dep.frequencies is None else dep.frequencies.sum()
+        invalid_reason = self.invalid_cat_node(len(all_dep), n_rows, dep.weights is not None)
+        if invalid_reason is not None:
+            split = Split(None, None, None, None, 0)
+            split.invalid_reason = invalid_reason
             return split
-        elif dep.weights is not None and len(dep.weights) < min_child_node_size:
-            # if weighted count is too small, skip
-            split.invalid_reason = InvalidSplitReason.PURE_NODE
+
+        if dep.weights is not None:
+            row_count = dep.weights.sum()
+        else:
+            row_count = n_rows
+
+        outcomes = self.evaluate_predictors('cat_predictor_split', ind, dep, rows, all_dep, dep_codes, row_count)
+        return self.best_cat_outcome(ind, outcomes)
+
+    def best_cat_counts_split(self, ind, counts, weighted_counts=None):
+        """
+        determine best categorical variable split of a node from its
+        frequencies alone, for data that isn't held in memory
+
+        Parameters
+        ----------
+        ind : ColumnStore
+            the independent columns of the tree
+        counts : array<np.ndarray>
+            for every column of ind, the levels x dependent categories
+            frequencies of the node's rows
+        weighted_counts : array<np.ndarray> or None
+            the weighted frequencies, in the same layout as counts, if the
+            weighted chi-square is run
+        """
+        observed = counts[0].sum(axis=0) > 0
+        weighted = weighted_counts is not None
+        invalid_reason = self.invalid_cat_node(observed.sum(), counts[0].sum(), weighted)
+        if invalid_reason is not None:
+            split = Split(None, None, None, None, 0)
+            split.invalid_reason = invalid_reason
             return split
 
-        for i, ind_var in enumerate(ind):
-            split.invalid_reason = None # must reset because using invalid reason to break
-            ind_var = ind_var.deep_copy()
-            unique = np.unique(ind_var.arr)
-
-            freq = {}
-            if dep.weights is None:
-                for col in unique:
-                    counts = np.unique(np.compress(ind_var.arr == col, dep.arr), return_counts=True)
-                    freq[col] = cl.defaultdict(int)
-                    freq[col].update(np.transpose(counts))
+        frequencies = weighted_counts if weighted else counts
+        row_count = frequencies[0].sum()
+        all_dep = np.flatnonzero(observed)
+        outcomes = []
+        for i in range(len(ind)):
+            present = counts[i].sum(axis=1) > 0
+            ind_var = ind.node_column(i, present)
+            freq = ContingencyTable(frequencies[i][present][:, observed], ind_var.arr, all_dep)
+            outcomes.append(self.cat_table_split(i, ind_var, freq, weighted, row_count))
+        return self.best_cat_outcome(ind, outcomes)
+
+    def cat_predictor_split(self, i, store, dep, rows, all_dep, dep_codes, row_count):
+        """
+        Merges the categories of independent column i of the store against a
+        categorical dependent variable. Returns the resulting split (None if
+        the column can't be split) and the invalid reasons met along the way
+        """
+        counts, present = store.level_counts(i, rows, dep_codes, len(all_dep), dep.weights, dep.frequencies)
+        ind_var = store.node_column(i, present)
+        freq = ContingencyTable(counts[present], ind_var.arr, all_dep)
+        return self.cat_table_split(i, ind_var, freq, dep.weights is not None, row_count)
+
+    def cat_table_split(self, i, ind_var, freq, weighted, row_count):
+        """
+        Merges the levels of the node column ind_var, whose frequencies are
+        tabulated in freq, as cat_predictor_split does
+        """
+        if self.grouping == 'optimal':
+            outcome = self.optimal_table_split(i, ind_var, freq, weighted)
+            if outcome is not None:
+                return outcome
+        reasons = []
+        min_child_node_size = self.min_child_node_size
+        merge_state = MergeState(freq, weighted)
+
+        pairs = ind_var.possible_pairs()
+        if len(pairs) == 0:
+            reasons.append(InvalidSplitReason.PURE_NODE)
+        while len(pairs) > 0:
+            choice, highest_p_join, split_chi = None, None, None
+            x, y = freq.positions(pairs).T
+            totals, observed = merge_state.pair_totals(x, y)
+
+            # check to see if min_child_node_size permits this direction
+            # 31 can't merge with 10 if it only leaves 27 for the other node(s)
+            # but if these are the only two, can't skip, because the level can be defined
+            # as these two nodes
+            # (weighted totals are compared with a tolerance relative to the node's total,
+            # so that summation order can't decide whether these are the only two)
+            other_splits = row_count - totals
+            only_pair = np.isclose(totals, row_count, rtol=TOTAL_TOLERANCE, atol=0)
+            skipped = (other_splits < min_child_node_size) & ~only_pair
+
+            # a pair observed in a single dependent category could be the only valid
+            # combination, as we skip ones that result in other nodes that give min
+            # child node sizes. this solves [[20], [10, 11]] even though 10 & 11 are
+            # exact, the first such pair must be the choice of this iteration
+            last = len(pairs) - 1
+            single = np.zeros(len(pairs), dtype=bool)
+            if not weighted:
+                single = ~skipped & (observed == 1)
+                if single.any():
+                    last = np.flatnonzero(single)[0]
+
+            evaluated = np.flatnonzero(~skipped[:last])
+            if not single[last] and not skipped[last]:
+                evaluated = np.append(evaluated, last)
+            chis, p_splits = merge_state.pair_scores(x[evaluated], y[evaluated])
+
+            best = most_similar_pair(p_splits, chis)
+            if best is not None:
+                choice, highest_p_join, split_chi = evaluated[best], p_splits[best], chis[best]
+
+            if single[last]:
+                choice = last
+            n_ij = freq.counts[[x[last], y[last]]]
+
+            sufficient_split = not highest_p_join or highest_p_join < self.alpha_merge
+            if not sufficient_split:
+                reasons.append(InvalidSplitReason.ALPHA_MERGE)
+            elif self.max_splits and len(ind_var.groups()) > self.max_splits:
+                reasons.append(InvalidSplitReason.MAX_SPLITS)
+            elif (n_ij.sum(axis=1) < min_child_node_size).any():
+                reasons.append(InvalidSplitReason.MIN_CHILD_NODE_SIZE)
+            elif self.is_exhaustive and len(freq) > 2:
+                reasons.append(InvalidSplitReason.NODE_NOT_EXHAUSTIVE)
             else:
-                for col in unique:
-                    counts = np.unique(np.compress(ind_var.arr == col, dep.arr), return_counts=True)
-                    freq[col] = cl.defaultdict(int)
-                    for dep_v in all_dep:
-                        freq[col][dep_v] = dep.weights[(ind_var.arr == col) * (dep.arr == dep_v)].sum()
+                n_ij = freq.table()
+                chi, p_split, dof = chisquare(n_ij, weighted)
+                return Split(i, ind_var.groups(), chi, p_split, dof, split_name=ind_var.name), reasons
 
-
-            if dep.weights is not None:
-                row_count = dep.weights.sum()
+            # all combinations created don't suffice. i.e. what's left is below min_child_node_size
+            if choice is None:
+                break
             else:
-                row_count = len(dep.arr)
-
-            if len(list(ind_var.possible_groupings())) == 0:
-                split.invalid_reason = InvalidSplitReason.PURE_NODE
-            while next(ind_var.possible_groupings(), None) is not None:
-                choice, highest_p_join, split_chi = None, None, None
-
-                for comb in ind_var.possible_groupings():
-                    col1_freq = freq[comb[0]]
-                    col2_freq = freq[comb[1]]
-
-                    keys = set(col1_freq.keys()).union(col2_freq.keys())
-                    n_ij = np.array([
-                        [col1_freq.get(k, 0) for k in keys],
-                        [col2_freq.get(k, 0) for k in keys]
-                    ])
-
-                    # check to see if min_child_node_size permits this direction
-                    # 31 can't merge with 10 if it only leaves 27 for the other node(s)
-                    # but if these are the only two, can't skip, because the level can be defined
-                    # as these two nodes
-                    other_splits = row_count - n_ij.sum()
-                    if other_splits < min_child_node_size and other_splits != 0:
-                        p_split, dof, chi = 1, NaN, NaN
-                        continue
-
-                    if n_ij.shape[1] == 1:
-                        p_split, dof, chi = 1, NaN, NaN
-                        # could be the only valid combination, as we skip
-                        # ones that result in other nodes that give min child node sizes
-                        # this solves [[20], [10, 11]] even though 10 & 11 are exact,
-                        # this must be the choice of this iteration
-                        choice = comb
-                        break
-                    else:
-                        chi, p_split, dof = chisquare(n_ij, dep.weights is not None)
-
-                    if choice is None or p_split > highest_p_join or (p_split == highest_p_join and chi > split_chi):
-                        choice, highest_p_join, split_chi = comb, p_split, chi
-
-                sufficient_split = not highest_p_join or highest_p_join < self.alpha_merge
-                if not sufficient_split:
-                    split.invalid_reason = InvalidSplitReason.ALPHA_MERGE
-                elif self.max_splits and len(ind_var.groups()) > self.max_splits:
-                    split.invalid_reason = InvalidSplitReason.MAX_SPLITS
-                elif (n_ij.sum(axis=1) < min_child_node_size).any():
-                    split.invalid_reason = InvalidSplitReason.MIN_CHILD_NODE_SIZE
-                elif self.is_exhaustive and len(freq.values()) > 2:
-                    split.invalid_reason = InvalidSplitReason.NODE_NOT_EXHAUSTIVE
-                else:
-                    n_ij = np.array([
-                        [f[dep_val] for dep_val in all_dep] for f in freq.values()
-                    ])
-
-                    dof = (n_ij.shape[0] - 1) * (n_ij.shape[1] - 1)
-                    chi, p_split, dof = chisquare(n_ij, dep.weights is not None)
-
-                    temp_split = Split(i, ind_var.groups(), chi, p_split, dof, split_name=ind_var.name)
-                    better_split = not split.valid() or p_split < split.p or (p_split == split.p and chi > split.score)
-
-                    if better_split:
-                        split, temp_split = temp_split, split
-
-                    chi_threshold = self.split_threshold * split.score
-
-                    if temp_split.valid() and temp_split.score >= chi_threshold:
-                        for sur in temp_split.surrogates:
-                            if sur.column_id != i and sur.score >= chi_threshold:
-                                split.surrogates.append(sur)
-
-                        temp_split.surrogates = []
-                        split.surrogates.append(temp_split)
-
-                    break
-
-                # all combinations created don't suffice. i.e. what's left is below min_child_node_size
-                if choice is None:
-                    break
-                else:
-                    ind_var.group(choice[0], choice[1])
-                    for val, count in freq[choice[1]].items():
-                        freq[choice[0]][val] += count
-                    del freq[choice[1]]
-        if split.valid():
-            split.sub_split_values(ind[split.column_id].metadata)
-        return split
-
-    def best_con_split(self, ind, dep):
+                x, y = pairs[choice].tolist()
+                ind_var.group(x, y)
+                merge_state.merge(x, y)
+                pairs = ind_var.possible_pairs()
+        return None, reasons
+
+    def optimal_table_split(self, i, ind_var, freq, weighted):
+        """
+        Groups the levels of the node column ind_var, whose frequencies are
+        tabulated in freq, in the way with the most significant chi-squared
+        test (ties broken by the highest chi, then by the first grouping
+        found), out of every grouping into at most max_splits groups (two if
+        is_exhaustive) that meet min_child_node_size. Returns the resulting
+        split and invalid reasons as cat_table_split does, or None if the
+        column has more than MAX_PARTITIONS groupings to search
+        """
+        if len(freq) < 2:
+            return None, [InvalidSplitReason.PURE_NODE]
+        order, moves = level_moves(ind_var)
+        max_groups = 2 if self.is_exhaustive else self.max_splits
+        if partition_count(moves, max_groups) > MAX_PARTITIONS:
+            warnings.warn(RuntimeWarning(
+                'A column has more than {} groupings of its levels, they are merged '
+                'heuristically'.format(MAX_PARTITIONS)
+            ))
+            return None
+
+        counts = freq.counts[order]
+        choice, highest_p, split_chi = None, None, None
+        strings = restricted_growth_strings(moves, counts, self.min_child_node_size, max_groups)
+        for block, used, grouped in strings:
+            chis, p_splits = np.empty(len(block)), np.empty(len(block))
+            for n_groups in np.unique(used):
+                subset = used == n_groups
+                chis[subset], p_splits[subset], _ = chisquare_batch(grouped[subset, :n_groups], weighted)
+            if np.isnan(p_splits).all():
+                continue
+            candidates = np.flatnonzero(p_splits == np.nanmin(p_splits))
+            best = candidates[np.argmax(chis[candidates])]
+            if choice is None or p_splits[best] < highest_p or \
+                    (p_splits[best] == highest_p and chis[best] > split_chi):
+                choice, highest_p, split_chi = block[best], p_splits[best], chis[best]
+
+        if choice is None:
+            return None, [InvalidSplitReason.MIN_CHILD_NODE_SIZE]
+        if highest_p >= self.alpha_merge:
+            return None, [InvalidSplitReason.ALPHA_MERGE]
+
+        levels = ind_var.arr[order]
+        for group in range(choice.max() + 1):
+            members = levels[choice == group]
+            for member in members[1:]:
+                ind_var.group(members[0], member)
+        n_ij = np.array([counts[choice == group].sum(axis=0) for group in range(choice.max() + 1)])
+        chi, p_split, dof = chisquare(n_ij, weighted)
+        return Split(i, ind_var.groups(), chi, p_split, dof, split_name=ind_var.name), []
+
+    def best_con_split(self, ind, dep, rows=None):
         """ determine best continuous variable split """
         split = Split(None, None, None, None, 0)
-        is_normal = stats.normaltest(self.dep_population)[1] > 0.05
-        sig_test = stats.bartlett if is_normal else stats.levene
         response_set = dep.arr
         if dep.weights is not None:
             response_set = dep.arr * dep.weights
 
-        for i, ind_var in enumerate(ind):
-            ind_var = ind_var.deep_copy()
-            unique = np.unique(ind_var.arr)
-            keyed_set = {}
-
-            for col in unique:
-                matched_elements = np.compress(ind_var.arr == col, response_set)
-                keyed_set[col] = matched_elements
-
-            if len(list(ind_var.possible_groupings())) == 0:
-                split.invalid_reason = InvalidSplitReason.PURE_NODE
-            while next(ind_var.possible_groupings(), None) is not None:
-                choice, highest_p_join, split_score = None, None, None
-                for comb in ind_var.possible_groupings():
-                    col1_keyed_set = keyed_set[comb[0]]
-                    col2_keyed_set = keyed_set[comb[1]]
-                    dof = len(np.concatenate((col1_keyed_set, col2_keyed_set))) - 2
-                    score, p_split = sig_test(col1_keyed_set, col2_keyed_set)
-
-                    if choice is None or p_split > highest_p_join or (p_split == highest_p_join and score > split_score):
-                        choice, highest_p_join, split_score = comb, p_split, score
-
-                invalid_reason = None
-                sufficient_split = highest_p_join < self.alpha_merge
-                if not sufficient_split:
-                    invalid_reason = InvalidSplitReason.ALPHA_MERGE
-
-                sufficient_split = sufficient_split and (self.max_splits is None or len(ind_var.groups()) <= self.max_splits)
-                if not sufficient_split:
-                    invalid_reason = InvalidSplitReason.MAX_SPLITS
-
-                sufficient_split = sufficient_split and all(
-                    len(node_v) >= self.min_child_node_size for node_v in keyed_set.values()
-                )
-                if not sufficient_split: 
-                    split.invalid_reason = InvalidSplitReason.MIN_CHILD_NODE_SIZE
-                elif self.is_exhaustive and len(list(ind_var.possible_groupings())) != 1: 
-                    split.invalid_reason = InvalidSplitReason.NODE_NOT_EXHAUSTIVE
-                elif sufficient_split and len(keyed_set.values()) > 1:
-                    dof = len(np.concatenate(list(keyed_set.values()))) - 2
-                    score, p_split = sig_test(*keyed_set.values())
-
-                    temp_split = Split(i, ind_var.groups(), score, p_split, dof, split_name=ind_var.name)
-
-                    better_split = not split.valid() or p_split < split.p or (p_split == split.p and score > split.score)
-
-                    if better_split:
-                        split, temp_split = temp_split, split
-
-                    score_threshold = self.split_threshold * split.score
-
-                    if temp_split.valid() and temp_split.score >= score_threshold:
-                        for sur in temp_split.surrogates:
-                            if sur.column_id != i and sur.score >= score_threshold:
-                                split.surrogates.append(sur)
-
-                        temp_split.surrogates = []
-                        split.surrogates.append(temp_split)
-
-                    break
-                else:
-                    split.invalid_reason = invalid_reason
-
-                ind_var.group(choice[0], choice[1])
-
-                keyed_set[choice[0]] = np.concatenate((keyed_set[choice[1]], keyed_set[choice[0]]))
-                del keyed_set[choice[1]]
+        outcomes = self.evaluate_predictors('con_predictor_split', ind, dep, rows, self.variance_test == 'levene', response_set)
+        for i, (temp_split, reasons) in enumerate(outcomes):
+            if reasons:
+                split.invalid_reason = reasons[-1]
+            if temp_split is not None:
+                split = self.keep_best_split(split, temp_split, i)
 
         if split.valid():
             split.sub_split_values(ind[split.column_id].metadata)
         return split
+
+    def con_predictor_split(self, i, store, dep, rows, median_centred, response_set):
+        """
+        Merges the categories of independent column i of the store against a
+        continuous dependent variable, with Levene's test if median_centred
+        and Bartlett's test otherwise. Returns the resulting split (None if
+        the column can't be split) and the invalid reasons met along the way
+        """
+        reasons = []
+        if median_centred:
+            present, groups = store.level_groups(i, rows, response_set)
+            ind_var = store.node_column(i, present)
+            table = DispersionTable.from_groups(groups, ind_var.arr, median_centred=True)
+        else:
+            present, counts, means, squares = store.level_moments(i, rows, response_set)
+            ind_var = store.node_column(i, present)
+            table = DispersionTable(counts, means, squares, ind_var.arr)
+
+        pairs = ind_var.possible_pairs()
+        if len(pairs) == 0:
+            reasons.append(InvalidSplitReason.PURE_NODE)
+        while len(pairs) > 0:
+            scores, p_splits = dispersion_tests(table, table.positions(pairs))
+            best = most_similar_pair(p_splits, scores)
+            choice, highest_p_join = pairs[best].tolist(), p_splits[best]
+
+            invalid_reason = None
+            sufficient_split = highest_p_join < self.alpha_merge
+            if not sufficient_split:
+                invalid_reason = InvalidSplitReason.ALPHA_MERGE
+
+            sufficient_split = sufficient_split and (self.max_splits is None or len(ind_var.groups()) <= self.max_splits)
+            if not sufficient_split:
+                invalid_reason = InvalidSplitReason.MAX_SPLITS
+
+            sufficient_split = sufficient_split and (table.sizes() >= self.min_child_node_size).all()
+            if not sufficient_split: 
+                reasons.append(InvalidSplitReason.MIN_CHILD_NODE_SIZE)
+            elif self.is_exhaustive and len(pairs) != 1: 
+                reasons.append(InvalidSplitReason.NODE_NOT_EXHAUSTIVE)
+            elif sufficient_split and len(table) > 1:
+                dof = int(table.sizes().sum()) - 2
+                score, p_split = dispersion_tests(table, table.remaining()[None, :])
+                return Split(i, ind_var.groups(), score[0], p_split[0], dof, split_name=ind_var.name), reasons
+            else:
+                reasons.append(invalid_reason)
+
+            ind_var.group(choice[0], choice[1])
+            table.merge(choice[0], choice[1])
+            pairs = ind_var.possible_pairs()
+        return None, reasons
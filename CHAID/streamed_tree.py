@@ -0,0 +1,353 @@
+import numpy as np
+import pandas as pd
+from math import ceil
+from .column import NominalColumn, OrdinalColumn
+from .column_store import ColumnStore
+from .invalid_split_reason import InvalidSplitReason
+from .node import Node, category_members
+from .tree import Tree
+
+
+def csv_chunks(path, chunksize=100000, **kwargs):
+    """
+    Returns a callable reading a csv file chunksize rows at a time, to build
+    a StreamedTree from. kwargs are passed on to pandas.read_csv
+    """
+    def chunks():
+        return pd.read_csv(path, chunksize=chunksize, **kwargs)
+    return chunks
+
+
+def parquet_chunks(path, columns=None):
+    """
+    Returns a callable reading a parquet file a row group at a time, to
+    build a StreamedTree from. Requires pyarrow
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Reading parquet files requires pyarrow. Please install it with "pip install pyarrow"')
+
+    def chunks():
+        parquet_file = pq.ParquetFile(path)
+        for i in range(parquet_file.num_row_groups):
+            yield parquet_file.read_row_group(i, columns=columns).to_pandas()
+    return chunks
+
+
+def unique_values(seen, values):
+    """ Returns the distinct values of seen (None at first) and values """
+    values = pd.unique(np.asarray(values).ravel())
+    if seen is None:
+        return values
+    return pd.unique(np.concatenate((seen, values)))
+
+
+class ChunkedData(object):
+    """
+    A dataset read a chunk at a time, encoded just as Tree.from_pandas_df
+    encodes a DataFrame held in memory. A first pass over the chunks finds
+    the values of every column, after which every pass yields each chunk as
+    the positions of its values within the levels of the ColumnStore
+
+    Parameters
+    ----------
+    chunks : callable
+        returns a new iterable of pandas.DataFrame chunks on every call, as
+        the data is read once per level of the tree. Every call must yield
+        the same rows
+    i_variables : dict
+        dict of independent variable names with their variable types.
+        Supported variable types are the strings 'nominal' or 'ordinal' in
+        lower case
+    d_variable : string
+        the name of the (categorical) dependent variable
+    weight : string or None
+        the name of the column of respondent weights, if any
+    """
+    def __init__(self, chunks, i_variables, d_variable, weight=None):
+        for col_type in i_variables.values():
+            if col_type not in ('nominal', 'ordinal'):
+                raise NotImplementedError('Unknown independent variable type ' + col_type)
+        self.chunks = chunks
+        self.names = list(i_variables.keys())
+        self.d_variable = d_variable
+        self.weight = weight
+        self.data_size = 0
+
+        uniques = [None] * len(self.names)
+        dep_uniques = None
+        for chunk in chunks():
+            values = chunk[self.names].values
+            for i in range(len(self.names)):
+                uniques[i] = unique_values(uniques[i], values[:, i])
+            dep_uniques = unique_values(dep_uniques, chunk[d_variable].values)
+            self.data_size += len(chunk)
+        if self.data_size == 0:
+            raise ValueError('There are no rows to build the tree from')
+
+        # columns of the distinct values are encoded as the full columns would be
+        self.columns = [
+            OrdinalColumn(values, name=name) if col_type == 'ordinal' else NominalColumn(values, name=name)
+            for name, col_type, values in zip(self.names, i_variables.values(), uniques)
+        ]
+        self.observed = NominalColumn(dep_uniques)
+        self.store = ColumnStore(self.columns)
+        self.categories = np.unique(self.observed.arr)
+
+    def codes(self, column, values):
+        """
+        Returns the codes the column gives to raw values, as if the values
+        were part of the column
+        """
+        values = np.asarray(values).ravel()
+        if isinstance(column, OrdinalColumn):
+            if np.issubdtype(values.dtype, np.integer):
+                return values.astype(np.int64)
+            values = values.astype(float)
+            codes = np.full(len(values), column._nan, dtype=np.int64)
+            known = ~np.isnan(values)
+            codes[known] = values[known].astype(np.int64)
+            return codes
+        labels = [column.metadata[code] for code in sorted(column.metadata) if code != -1]
+        return pd.Index(labels).get_indexer(values)
+
+    def dependent_labels(self, chunk):
+        """ Returns the label of the dependent variable of every row of chunk """
+        codes = self.codes(self.observed, chunk[self.d_variable].values)
+        return np.array([self.observed.metadata[code] for code in codes])
+
+    def encoded(self):
+        """
+        Reads the data a chunk at a time, yielding for each chunk the
+        positions of every independent column's values within the levels of
+        the store, the position of the dependent variable within the
+        categories, and the weights (None if unweighted)
+        """
+        for chunk in self.chunks():
+            values = chunk[self.names].values
+            positions = [
+                np.searchsorted(self.store.levels[i], self.codes(column, values[:, i]))
+                for i, column in enumerate(self.columns)
+            ]
+            dep = np.searchsorted(self.categories, self.codes(self.observed, chunk[self.d_variable].values))
+            weights = None if self.weight is None else chunk[self.weight].values.astype(float)
+            yield positions, dep, weights
+
+
+class StreamedTree(Tree):
+    """
+    A tree built from data read a chunk at a time, such as a file too large
+    to hold in memory. Only the frequencies of the nodes being split are
+    held, counted with one pass over the data for every level of the tree.
+    Only a categorical dependent variable is supported
+
+    Parameters
+    ----------
+    data : ChunkedData
+        the data to build the tree from
+    config : dict
+        the configuration of the tree, as for Tree. The nodes are split
+        serially, n_jobs isn't used
+    """
+    def __init__(self, data, config={}):
+        # fractional node sizes are relative to the number of rows, not the distinct values
+        config = dict(config)
+        for key in ('min_parent_node_size', 'min_child_node_size'):
+            size = config.get(key, 30)
+            if 0 < size < 1:
+                config[key] = int(ceil(size * data.data_size))
+        super(StreamedTree, self).__init__(data.columns, data.observed, config)
+        self.data = data
+        self.data_size = data.data_size
+        self.column_store = data.store
+
+    @staticmethod
+    def from_chunks(chunks, i_variables, d_variable, alpha_merge=0.05, max_depth=2,
+                    min_parent_node_size=30, min_child_node_size=30, split_threshold=0,
+                    weight=None, dep_variable_type='categorical', is_exhaustive=False, max_splits=None,
+                    grouping='heuristic'):
+        """
+        Create a CHAID object from data read a chunk at a time. The data is
+        read once to find the values of every column, then once for every
+        level of the tree
+
+        Parameters
+        ----------
+        chunks : callable
+            returns a new iterable of pandas.DataFrame chunks on every call,
+            such as csv_chunks(path) or parquet_chunks(path)
+        i_variables : dict
+            dict of instance variable names with their variable types. Supported
+            variable types are the strings 'nominal' or 'ordinal' in lower case
+        d_variable : string
+            the name of the dependent variable in the chunks
+        alpha_merge : float
+            the threshold value in which to create a split (default 0.05)
+        max_depth : float
+            the threshold value for the maximum number of levels after the root
+            node in the tree (default 2)
+        split_threshold : float
+            the variation in chi-score such that surrogate splits are created
+            (default 0)
+        min_parent_node_size : float
+            the threshold value of the number of respondents that the node must
+            contain (default 30)
+        min_child_node_size : float
+            the threshold value of the number of respondents that each child node must
+            contain (default 30)
+        max_splits : int
+            maximum number of splits allowed at each depth; no limit if None (default None)
+        weight : string
+            the name of the column of respondent weights. If passed, weighted
+            chi-square calculation is run
+        dep_variable_type : str
+            the type of dependent variable. Only 'categorical' is supported
+        grouping : str
+            how the levels of each independent variable are grouped.
+            'heuristic' merges the most similar pair of groups in turn,
+            'optimal' searches every grouping for the most significant one
+            (default 'heuristic')
+        """
+        if dep_variable_type != 'categorical':
+            raise NotImplementedError('Streamed trees only support a categorical dependent variable')
+        data = ChunkedData(chunks, i_variables, d_variable, weight)
+        config = { 'alpha_merge': alpha_merge, 'max_depth': max_depth, 'min_parent_node_size': min_parent_node_size,
+                   'min_child_node_size': min_child_node_size, 'max_splits': max_splits,
+                   'split_threshold': split_threshold, 'is_exhaustive': is_exhaustive, 'grouping': grouping, }
+        return StreamedTree(data, config)
+
+    def build_tree(self):
+        """ Build chaid tree, reading the data once for every level """
+        root = Node()
+        children = {}
+        # the nodes are routed through lookup tables of the child of each level of their split column
+        routes = {'column': [-1], 'offset': [0], 'children': []}
+        route_ids = {id(root): 0}
+        frontier = [root]
+
+        depth = 1
+        while frontier:
+            counts, weighted_counts = self.count(frontier, [route_ids[id(node)] for node in frontier], depth - 1, routes)
+            next_frontier = []
+            for slot, node in enumerate(frontier):
+                node_counts = [column_counts[slot] for column_counts in counts]
+                node_weighted = None
+                if weighted_counts is not None:
+                    node_weighted = [column_counts[slot] for column_counts in weighted_counts]
+                if node._members is None:
+                    node._members = self.members(
+                        node_counts[0].sum(axis=0), None if node_weighted is None else node_weighted[0].sum(axis=0)
+                    )
+                if self.max_depth < 1:
+                    node.split.invalid_reason = InvalidSplitReason.MAX_DEPTH
+                    continue
+
+                split = self._stats.best_cat_counts_split(self.column_store, node_counts, node_weighted)
+                node.split = split
+                if not split.valid():
+                    continue
+
+                levels = self.column_store.levels[split.column_id]
+                table = np.full(len(levels), -1, dtype=np.intp)
+                route_id = route_ids[id(node)]
+                routes['column'][route_id] = split.column_id
+                routes['offset'][route_id] = len(routes['children'])
+                children[id(node)] = []
+                for index, choices in enumerate(split.splits):
+                    positions = np.flatnonzero(np.isin(levels, choices))
+                    child_counts = node_counts[split.column_id][positions].sum(axis=0)
+                    child_weighted = None
+                    if node_weighted is not None:
+                        child_weighted = node_weighted[split.column_id][positions].sum(axis=0)
+                    child = Node(choices=split.split_map[index], members=self.members(child_counts, child_weighted))
+                    children[id(node)].append(child)
+
+                    route_ids[id(child)] = len(routes['column'])
+                    routes['column'].append(-1)
+                    routes['offset'].append(0)
+                    table[positions] = route_ids[id(child)]
+
+                    if self.min_parent_node_size >= child_counts.sum():
+                        child.split.invalid_reason = InvalidSplitReason.MIN_PARENT_NODE_SIZE
+                    elif self.max_depth <= depth:
+                        child.split.invalid_reason = InvalidSplitReason.MAX_DEPTH
+                    else:
+                        next_frontier.append(child)
+                routes['children'].extend(table.tolist())
+            frontier = next_frontier
+            depth += 1
+        return self.number_nodes(root, children)
+
+    def count(self, frontier, frontier_ids, depth, routes):
+        """
+        internal method to count, in one pass over the data, the levels x
+        dependent categories frequencies of every column for every node of
+        the frontier, which are all depth splits from the root. Returns the
+        frequencies of each column as a nodes x levels x categories array,
+        and the weighted frequencies (None if unweighted)
+        """
+        column = np.array(routes['column'], dtype=np.intp)
+        offset = np.array(routes['offset'], dtype=np.intp)
+        table = np.array(routes['children'], dtype=np.intp)
+        slots = np.full(len(column), -1, dtype=np.intp)
+        slots[frontier_ids] = np.arange(len(frontier))
+
+        n_categories = len(self.data.categories)
+        sizes = [len(frontier) * len(levels) * n_categories for levels in self.column_store.levels]
+        counts = [np.zeros(size, dtype=np.int64) for size in sizes]
+        weighted_counts = None if self.data.weight is None else [np.zeros(size) for size in sizes]
+        for positions, dep, weights in self.data.encoded():
+            node = np.zeros(len(dep), dtype=np.intp)
+            if depth:
+                levels = np.column_stack(positions)
+                for _ in range(depth):
+                    active = np.flatnonzero(column[node] >= 0)
+                    current = node[active]
+                    child = table[offset[current] + levels[active, column[current]]]
+                    node[active] = np.where(child >= 0, child, current)
+            slot = slots[node]
+            kept = slot >= 0
+            for i, levels in enumerate(self.column_store.levels):
+                combined = (slot[kept] * len(levels) + positions[i][kept]) * n_categories + dep[kept]
+                counts[i] += np.bincount(combined, minlength=sizes[i])
+                if weighted_counts is not None:
+                    weighted_counts[i] += np.bincount(combined, weights=weights[kept], minlength=sizes[i])
+
+        shapes = [(len(frontier), len(levels), n_categories) for levels in self.column_store.levels]
+        counts = [column_counts.reshape(shape) for column_counts, shape in zip(counts, shapes)]
+        if weighted_counts is not None:
+            weighted_counts = [column_counts.reshape(shape) for column_counts, shape in zip(weighted_counts, shapes)]
+        return counts, weighted_counts
+
+    def members(self, counts, weighted_counts=None):
+        """
+        internal method to build the members of a node from the frequency of
+        each dependent category, as Node does from the node's rows
+        """
+        frequencies = counts.astype(float) if weighted_counts is None else weighted_counts
+        return category_members(self.observed.metadata, self.data.categories, counts, frequencies)
+
+    def node_predictions(self):
+        """ Determines which rows fall into which node, reading the data a chunk at a time """
+        return np.concatenate([self.apply(chunk).astype(float) for chunk in self.data.chunks()])
+
+    def model_predictions(self):
+        """
+        Determines the highest frequency of categorical dependent variable
+        in the terminal node where each row fell, reading the data a chunk
+        at a time
+        """
+        return np.concatenate([self.predict(chunk).astype('object') for chunk in self.data.chunks()])
+
+    def accuracy(self):
+        """
+        Calculates the accuracy of the tree by comparing the model
+        predictions to the dataset, reading the data a chunk at a time
+        """
+        if not self.observed.metadata: return float('nan')
+
+        correct = 0
+        for chunk in self.data.chunks():
+            correct += (self.predict(chunk).astype('object') == self.data.dependent_labels(chunk)).sum()
+        return float(correct) / self.data_size
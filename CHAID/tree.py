@@ -1,12 +1,16 @@
 import numpy as np
+import pandas as pd
 from math import ceil
 from treelib import Tree as TreeLibTree
-from .node import Node
+from .node import Node, category_members
 from .split import Split
-from .column import NominalColumn, OrdinalColumn, ContinuousColumn
+from .column import NominalColumn, OrdinalColumn, ContinuousColumn, convert_to_python_type
+from .column_store import ColumnStore
 from .stats import Stats
 from .invalid_split_reason import InvalidSplitReason
 from .graph import Graph
+from .parallel import WorkerPool, effective_n_jobs
+from .compiled_tree import CompiledTree
 
 class Tree(object):
     def __init__(self, independent_columns, dependent_column, config={}):
@@ -27,39 +31,62 @@ class Tree(object):
                 min_child_node_size=30,
                 max_splits=None,
                 split_threshold=0,
-                is_exhaustive=False
+                is_exhaustive=False,
+                n_jobs=1,
+                parallel_backend='process',
+                variance_test=None,
+                normality_sample_size=None,
+                grouping='heuristic'
             }
         """
-        # Use the absolute size if at least 1; otherwise, treat as a fraction.
+        # Use the absolute size if at least 1; otherwise, treat as a fraction of the respondents.
         data_size = dependent_column.arr.shape[0]
+        respondents = data_size if dependent_column.frequencies is None else dependent_column.frequencies.sum()
         min_parent_node_size = config.get('min_parent_node_size', 30)
         min_child_node_size = config.get('min_child_node_size', 30)
         if 0 < min_parent_node_size < 1:
-            min_parent_node_size = int(ceil(min_parent_node_size * data_size))
+            min_parent_node_size = int(ceil(min_parent_node_size * respondents))
         if 0 < min_child_node_size < 1:
-            min_child_node_size = int(ceil(min_child_node_size * data_size))
+            min_child_node_size = int(ceil(min_child_node_size * respondents))
 
         # Save away the parameters and configurations.
         self.max_depth = config.get('max_depth', 2)
         self.min_parent_node_size = min_parent_node_size
         self.vectorised_array = independent_columns
+        self._column_store = None
         self.data_size = data_size
         self.node_count = 0
         self._tree_store = None
+        self._compiled = None
+        self._leaves = None
         self.observed = dependent_column
+        self.n_jobs = effective_n_jobs(config.get('n_jobs', 1))
+        self.parallel_backend = config.get('parallel_backend', 'process')
+        grouping = config.get('grouping', 'heuristic')
+        if grouping == 'optimal' and isinstance(dependent_column, ContinuousColumn):
+            raise NotImplementedError('Optimal grouping is only supported for a categorical dependent variable')
         self._stats = Stats(
             config.get('alpha_merge', 0.05),
             min_child_node_size,
             config.get('max_splits', None),
             config.get('split_threshold', 0),
             dependent_column.arr,
-            config.get('is_exhaustive', False)
+            config.get('is_exhaustive', False),
+            config.get('variance_test', None),
+            config.get('normality_sample_size', None),
+            grouping
         )
+        if isinstance(dependent_column, ContinuousColumn):
+            # the test for a continuous dependent variable is chosen once for every node,
+            # before the stats are copied to any worker
+            self._stats.variance_test
 
     @staticmethod
     def from_numpy(ndarr, arr, alpha_merge=0.05, max_depth=2, min_parent_node_size=30,
                  min_child_node_size=30, split_titles=None, split_threshold=0, weights=None,
-                 variable_types=None, dep_variable_type='categorical', is_exhaustive=False, max_splits=None):
+                 variable_types=None, dep_variable_type='categorical', is_exhaustive=False, max_splits=None,
+                 n_jobs=1, parallel_backend='process', frequencies=None, copy=True, variance_test=None,
+                 normality_sample_size=None, grouping='heuristic'):
         """
         Create a CHAID object from numpy
 
@@ -91,6 +118,37 @@ class Tree(object):
             array of variable types, or dict of column names to variable types.
             Supported variable types are the strings 'nominal' or 'ordinal' in
             lower case
+        n_jobs : int
+            the number of workers splitting the nodes of a level, or the
+            independent variables of a node, concurrently; -1 uses every cpu
+            (default 1)
+        parallel_backend : str
+            the workers used when n_jobs isn't 1. Supported backends are
+            'process' or 'thread' (default 'process')
+        frequencies : array-like
+            the number of respondents each row stands for, when the rows are
+            the cells of pre-aggregated data. Only supported for a
+            categorical dependent variable
+        copy : bool
+            whether to copy the independent variables (default True). If
+            False, ndarr must already be integer coded, with -1 for missing
+            nominal values and the minimum of its dtype for missing ordinal
+            values, and its columns are used in place. This allows ndarr to
+            be a np.memmap, or a view of Arrow buffers, that is larger than
+            memory. A Fortran ordered ndarr keeps every column contiguous
+        variance_test : str
+            the test for equal variances of a continuous dependent variable,
+            'bartlett' or 'levene'. If None, Bartlett's test is used if the
+            dependent variable is normally distributed, and Levene's test
+            otherwise (default None)
+        normality_sample_size : int
+            the number of dependent values the normality test is run on,
+            sampled reproducibly; every value if None (default None)
+        grouping : str
+            how the levels of each independent variable are grouped, for a
+            categorical dependent variable. 'heuristic' merges the most
+            similar pair of groups in turn, 'optimal' searches every
+            grouping for the most significant one (default 'heuristic')
         """
         vectorised_array = []
         variable_types = variable_types or ['nominal'] * ndarr.shape[1]
@@ -98,28 +156,36 @@ class Tree(object):
             title = None
             if split_titles is not None: title = split_titles[ind]
             if col_type == 'ordinal':
-                col = OrdinalColumn(ndarr[:, ind], name=title)
+                col = OrdinalColumn(ndarr[:, ind], name=title, copy=copy)
             elif col_type == 'nominal':
-                col = NominalColumn(ndarr[:, ind], name=title)
+                col = NominalColumn(ndarr[:, ind], name=title, copy=copy)
             else:
                 raise NotImplementedError('Unknown independent variable type ' + col_type)
             vectorised_array.append(col)
 
         if dep_variable_type == 'categorical':
-            observed = NominalColumn(arr, weights=weights)
+            observed = NominalColumn(arr, weights=weights, frequencies=frequencies)
+        elif dep_variable_type == 'continuous' and frequencies is not None:
+            raise NotImplementedError('Frequencies are only supported for a categorical dependent variable')
         elif dep_variable_type == 'continuous':
             observed = ContinuousColumn(arr, weights=weights)
         else:
             raise NotImplementedError('Unknown dependent variable type ' + dep_variable_type)
         config = { 'alpha_merge': alpha_merge, 'max_depth': max_depth, 'min_parent_node_size': min_parent_node_size,
                    'min_child_node_size': min_child_node_size, 'max_splits': max_splits,
-                   'split_threshold': split_threshold, 'is_exhaustive': is_exhaustive, }
+                   'split_threshold': split_threshold, 'is_exhaustive': is_exhaustive,
+                   'n_jobs': n_jobs, 'parallel_backend': parallel_backend, 'variance_test': variance_test,
+                   'normality_sample_size': normality_sample_size, 'grouping': grouping, }
         return Tree(vectorised_array, observed, config)
 
     def build_tree(self):
         """ Build chaid tree """
-        self._tree_store = []
-        self.node(np.arange(0, self.data_size, dtype=np.int64), self.vectorised_array, self.observed)
+        rows = np.arange(0, self.data_size, dtype=np.int64)
+        if self.n_jobs == 1:
+            self.grow(rows, self.observed)
+            return
+        with WorkerPool(self._stats, self.column_store, self.n_jobs, self.parallel_backend) as pool:
+            self.grow(rows, self.observed, pool)
 
     @property
     def tree_store(self):
@@ -127,10 +193,23 @@ class Tree(object):
             self.build_tree()
         return self._tree_store
 
+    @property
+    def column_store(self):
+        """ The independent columns encoded once for every node, built when first used """
+        if self._column_store is None:
+            self._column_store = ColumnStore(self.vectorised_array)
+        return self._column_store
+
+    @column_store.setter
+    def column_store(self, store):
+        self._column_store = store
+
     @staticmethod
     def from_pandas_df(df, i_variables, d_variable, alpha_merge=0.05, max_depth=2,
                        min_parent_node_size=30, min_child_node_size=30, split_threshold=0,
-                       weight=None, dep_variable_type='categorical', is_exhaustive=False, max_splits=None):
+                       weight=None, dep_variable_type='categorical', is_exhaustive=False, max_splits=None,
+                       n_jobs=1, parallel_backend='process', variance_test=None, normality_sample_size=None,
+                       grouping='heuristic'):
         """
         Helper method to pre-process a pandas data frame in order to run CHAID
         analysis
@@ -166,6 +245,26 @@ class Tree(object):
         dep_variable_type : str
             the type of dependent variable. Supported variable types are 'categorical' or
             'continuous'
+        n_jobs : int
+            the number of workers splitting the nodes of a level, or the
+            independent variables of a node, concurrently; -1 uses every cpu
+            (default 1)
+        parallel_backend : str
+            the workers used when n_jobs isn't 1. Supported backends are
+            'process' or 'thread' (default 'process')
+        variance_test : str
+            the test for equal variances of a continuous dependent variable,
+            'bartlett' or 'levene'. If None, Bartlett's test is used if the
+            dependent variable is normally distributed, and Levene's test
+            otherwise (default None)
+        normality_sample_size : int
+            the number of dependent values the normality test is run on,
+            sampled reproducibly; every value if None (default None)
+        grouping : str
+            how the levels of each independent variable are grouped, for a
+            categorical dependent variable. 'heuristic' merges the most
+            similar pair of groups in turn, 'optimal' searches every
+            grouping for the most significant one (default 'heuristic')
         """
         ind_df = df[list(i_variables.keys())]
         ind_values = ind_df.values
@@ -173,48 +272,181 @@ class Tree(object):
         weights = df[weight] if weight is not None else None
         return Tree.from_numpy(ind_values, dep_values, alpha_merge, max_depth, min_parent_node_size,
                     min_child_node_size, list(ind_df.columns.values), split_threshold, weights,
-                    list(i_variables.values()), dep_variable_type, is_exhaustive, max_splits)
-
-    def node(self, rows, ind, dep, depth=0, parent=None, parent_decisions=None):
-        """ internal method to create a node in the tree """
-        depth += 1
-
-        if self.max_depth < depth:
-            terminal_node = Node(choices=parent_decisions, node_id=self.node_count,
-                                 parent=parent, indices=rows, dep_v=dep)
-            self._tree_store.append(terminal_node)
-            self.node_count += 1
-            terminal_node.split.invalid_reason = InvalidSplitReason.MAX_DEPTH
-            return self._tree_store
-
-        split = self._stats.best_split(ind, dep)
-
-        node = Node(choices=parent_decisions, node_id=self.node_count, indices=rows, dep_v=dep,
-                    parent=parent, split=split)
-
-        self._tree_store.append(node)
-        parent = self.node_count
-        self.node_count += 1
-
-        if not split.valid():
-            return self._tree_store
-
-        for index, choices in enumerate(split.splits):
-            correct_rows = np.isin(ind[split.column_id].arr, choices)
-            dep_slice = dep[correct_rows]
-            ind_slice = [vect[correct_rows] for vect in ind]
-            row_slice = rows[correct_rows]
-            if self.min_parent_node_size < len(dep_slice.arr):
-                self.node(row_slice, ind_slice, dep_slice, depth=depth, parent=parent,
-                          parent_decisions=split.split_map[index])
-            else:
-                terminal_node = Node(choices=split.split_map[index], node_id=self.node_count,
-                                     parent=parent, indices=row_slice, dep_v=dep_slice)
-                terminal_node.split.invalid_reason = InvalidSplitReason.MIN_PARENT_NODE_SIZE
-                self._tree_store.append(terminal_node)
-                self.node_count += 1
+                    list(i_variables.values()), dep_variable_type, is_exhaustive, max_splits,
+                    n_jobs, parallel_backend, variance_test=variance_test,
+                    normality_sample_size=normality_sample_size, grouping=grouping)
+
+    @staticmethod
+    def from_aggregated(df, i_variables, d_variable, count_column, alpha_merge=0.05, max_depth=2,
+                        min_parent_node_size=30, min_child_node_size=30, split_threshold=0,
+                        is_exhaustive=False, max_splits=None, n_jobs=1, parallel_backend='process',
+                        grouping='heuristic'):
+        """
+        Create a CHAID object from a pre-aggregated data frame, holding a row
+        per combination of the variables with the number of respondents in
+        it. The tree is the same as the tree of the respondent level data,
+        without expanding the rows: node sizes, members and the chi-square
+        tests count the respondents of each row
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            the aggregated dataframe with the dependent and independent
+            variables and the count of respondents of each row
+        i_variables : dict
+            dict of instance variable names with their variable types. Supported
+            variable types are the strings 'nominal' or 'ordinal' in lower case
+        d_variable : string
+            the name of the (categorical) dependent variable in the dataframe
+        count_column : string
+            the name of the column holding the number of respondents of
+            each row. Rows with no respondents are left out
+        alpha_merge : float
+            the threshold value in which to create a split (default 0.05)
+        max_depth : float
+            the threshold value for the maximum number of levels after the root
+            node in the tree (default 2)
+        split_threshold : float
+            the variation in chi-score such that surrogate splits are created
+            (default 0)
+        min_parent_node_size : float
+            the threshold value of the number of respondents that the node must
+            contain (default 30)
+        min_child_node_size : float
+            the threshold value of the number of respondents that each child node must
+            contain (default 30)
+        max_splits : int
+            maximum number of splits allowed at each depth; no limit if None (default None)
+        n_jobs : int
+            the number of workers splitting the nodes of a level, or the
+            independent variables of a node, concurrently; -1 uses every cpu
+            (default 1)
+        parallel_backend : str
+            the workers used when n_jobs isn't 1. Supported backends are
+            'process' or 'thread' (default 'process')
+        grouping : str
+            how the levels of each independent variable are grouped. 'heuristic' merges the most
+            similar pair of groups in turn, 'optimal' searches every
+            grouping for the most significant one (default 'heuristic')
+        """
+        counts = df[count_column].values
+        if (counts < 0).any():
+            raise ValueError('Counts of respondents must not be negative')
+        df = df[counts > 0]
+        ind_df = df[list(i_variables.keys())]
+        return Tree.from_numpy(ind_df.values, df[d_variable].values, alpha_merge, max_depth, min_parent_node_size,
+                    min_child_node_size, list(ind_df.columns.values), split_threshold, None,
+                    list(i_variables.values()), 'categorical', is_exhaustive, max_splits,
+                    n_jobs, parallel_backend, df[count_column].values, grouping=grouping)
+
+    def grow(self, rows, dep, pool=None):
+        """
+        internal method to grow the tree from the given rows. The nodes are
+        split a level at a time, so that the nodes of a level (and with them
+        sibling subtrees) can be split concurrently, and are then numbered
+        depth first, as if the tree had been grown recursively
+        """
+        root = Node(indices=rows, dep_v=dep)
+        children = {}
+        categories = dep_codes = None
+        if not isinstance(dep, ContinuousColumn):
+            categories, dep_codes = np.unique(dep.arr, return_inverse=True)
+            dep_codes = dep_codes.ravel()
+        frontier = [root]
+        if self.max_depth < 1:
+            root.split.invalid_reason = InvalidSplitReason.MAX_DEPTH
+            frontier = []
+
+        depth = 1
+        while frontier:
+            next_frontier = []
+            for node, split in zip(frontier, self.split_nodes(frontier, pool)):
+                node.split = split
+                if not split.valid():
+                    continue
+
+                # the independent columns are shared by every node, only the rows are partitioned
+                split_column = self.vectorised_array[split.column_id].arr[node.indices]
+                branches = np.zeros(len(node.indices), dtype=np.intp)
+                for index, choices in enumerate(split.splits):
+                    branches[np.isin(split_column, choices)] = index
+                members = [None] * len(split.splits)
+                if dep_codes is not None:
+                    members = self.child_members(node, branches, len(split.splits), categories, dep_codes[node.indices])
+
+                children[id(node)] = []
+                for index in range(len(split.splits)):
+                    correct_rows = branches == index
+                    child = Node(choices=split.split_map[index], indices=node.indices[correct_rows],
+                                 dep_v=node.dep_v[correct_rows], members=members[index])
+                    children[id(node)].append(child)
+                    if self.min_parent_node_size >= self.respondents(child.dep_v):
+                        child.split.invalid_reason = InvalidSplitReason.MIN_PARENT_NODE_SIZE
+                    elif self.max_depth <= depth:
+                        child.split.invalid_reason = InvalidSplitReason.MAX_DEPTH
+                    else:
+                        next_frontier.append(child)
+            frontier = next_frontier
+            depth += 1
+        nodes = self.number_nodes(root, children)
+
+        # every row is in exactly one terminal node
+        self._leaves = np.zeros(self.data_size, dtype=np.intp)
+        for node in nodes:
+            if node.is_terminal:
+                self._leaves[node.indices] = node.node_id
+        return nodes
+
+    def number_nodes(self, root, children):
+        """
+        internal method to store the grown nodes, numbered depth first from
+        the root. children maps the id of every split node to its children
+        """
+        self._tree_store = []
+        stack = [(root, None)]
+        while stack:
+            node, parent = stack.pop()
+            node.node_id, node.parent = len(self._tree_store), parent
+            self._tree_store.append(node)
+            stack.extend((child, node.node_id) for child in reversed(children.get(id(node), [])))
+        self.node_count = len(self._tree_store)
+        self._compiled = None
         return self._tree_store
 
+    def child_members(self, node, branches, n_children, categories, dep_codes):
+        """
+        internal method to tabulate the members of every child of a split
+        node at once, from the child (branch) and the dependent category
+        code of every row of the node
+        """
+        n_categories = len(categories)
+        combined = branches * n_categories + dep_codes
+        size = n_children * n_categories
+        counts = np.bincount(combined, minlength=size).reshape(n_children, n_categories)
+        weights = node.dep_v.weights if node.dep_v.weights is not None else node.dep_v.frequencies
+        if weights is None:
+            frequencies = counts.astype(float)
+        else:
+            frequencies = np.bincount(combined, weights=weights, minlength=size).reshape(n_children, n_categories)
+        return [
+            category_members(self.observed.metadata, categories, child_counts, child_frequencies)
+            for child_counts, child_frequencies in zip(counts, frequencies)
+        ]
+
+    def respondents(self, dep):
+        """ internal method to count the respondents of a node's dependent variable """
+        return len(dep.arr) if dep.frequencies is None else dep.frequencies.sum()
+
+    def split_nodes(self, nodes, pool=None):
+        """
+        internal method to find the best split of each node. When there are
+        fewer nodes than workers, the workers share out the independent
+        columns of each node instead
+        """
+        if pool is None or len(nodes) < pool.n_jobs:
+            return [self._stats.best_split(self.column_store, node.dep_v, node.indices) for node in nodes]
+        return pool.map_nodes([(node.dep_v, node.indices) for node in nodes])
+
     def generate_best_split(self, ind, dep):
         """ internal method to generate the best split """
         return self._stats.best_split(ind, dep)
@@ -247,13 +479,16 @@ class Tree(object):
         """ prints the tree out """
         self.to_tree().show(line_type='ascii')
 
+    @property
+    def leaves(self):
+        """ The id of the terminal node that every row falls into """
+        if not self._tree_store:
+            self.build_tree()
+        return self._leaves
+
     def node_predictions(self):
         """ Determines which rows fall into which node """
-        pred = np.zeros(self.data_size)
-        for node in self:
-            if node.is_terminal:
-                pred[node.indices] = node.node_id
-        return pred
+        return self.leaves.astype(float)
 
     def classification_rules(self, node=None, stack=None):
         if node is None:
@@ -280,6 +515,77 @@ class Tree(object):
         else:
             return self.classification_rules(self.get_node(node.parent), stack)
 
+    def compile(self):
+        """
+        Returns the tree flattened into lookup tables, to route new data
+        through it without the training data
+        """
+        if self._compiled is None:
+            self._compiled = CompiledTree.from_tree(self)
+        return self._compiled
+
+    def apply(self, data):
+        """
+        Determines which node each row of new data falls into. A row with a
+        value that the split of a node doesn't include (such as a category,
+        or missing values, unseen in training) is routed by the node's
+        surrogate splits instead, in order of how well they agree with the
+        split. The row stays in that node only if the node has no surrogate
+        splits, or none of them include the row's values either
+
+        Parameters
+        ----------
+        data : pandas.DataFrame or numpy.ndarray
+            the independent variables. The columns of a DataFrame are
+            selected by the names the tree was built with, otherwise they
+            are taken in the order the tree was built with
+        """
+        return self.compile().apply(data)
+
+    def predict(self, data):
+        """
+        Predicts the dependent variable of each row of new data, as the
+        highest frequency category (or for a continuous dependent variable,
+        the mean) of the node that the row falls into
+
+        Parameters
+        ----------
+        data : pandas.DataFrame or numpy.ndarray
+            the independent variables. The columns of a DataFrame are
+            selected by the names the tree was built with, otherwise they
+            are taken in the order the tree was built with
+        """
+        return self.compile().predict(data)
+
+    def predict_proba(self, data):
+        """
+        Predicts the probability of every category of a categorical
+        dependent variable for each row of new data, as the (weighted) share
+        of the category in the node that the row falls into. Returns an
+        array with a row per row of data and a column per category, in the
+        order of the members of the nodes (compile().classes)
+
+        Parameters
+        ----------
+        data : pandas.DataFrame or numpy.ndarray
+            the independent variables. The columns of a DataFrame are
+            selected by the names the tree was built with, otherwise they
+            are taken in the order the tree was built with
+        """
+        return self.compile().predict_proba(data)
+
+    def terminal_predictions(self):
+        """
+        internal method returning the highest frequency category of every
+        node, indexed by node id, or None for nodes that aren't terminal
+        """
+        nodes = self.tree_store
+        predictions = np.empty(len(nodes), dtype=object)
+        for node in nodes:
+            if node.is_terminal:
+                predictions[node.node_id] = max(node.members, key=node.members.get)
+        return predictions
+
     def model_predictions(self):
         """
         Determines the highest frequency of
@@ -288,11 +594,13 @@ class Tree(object):
         """
         if isinstance(self.observed, ContinuousColumn):
             return ValueError("Cannot make model predictions on a continuous scale")
-        pred = np.zeros(self.data_size).astype('object')
-        for node in self:
-            if node.is_terminal:
-                pred[node.indices] = max(node.members, key=node.members.get)
-        return pred
+        # the predictions are looked up in an array of the dependent variable's labels' own dtype
+        predictions = self.terminal_predictions()
+        classes = np.asarray(pd.Index(list(self.observed.metadata.values())))
+        lookup = np.zeros(len(predictions), dtype=classes.dtype)
+        terminal = [node_id for node_id, prediction in enumerate(predictions) if prediction is not None]
+        lookup[terminal] = [predictions[node_id] for node_id in terminal]
+        return lookup[self.leaves]
 
     def risk(self):
         """
@@ -309,8 +617,25 @@ class Tree(object):
         """
         if not self.observed.metadata: return float('nan') 
 
-        sub_observed = np.array([self.observed.metadata[i] for i in self.observed.arr])
-        return float((self.model_predictions() == sub_observed).sum()) / self.data_size
+        # tabulate the respondents of every terminal node by dependent category
+        leaves = self.leaves
+        categories, codes = np.unique(self.observed.arr, return_inverse=True)
+        frequencies = self.observed.frequencies
+        counts = np.bincount(
+            leaves * len(categories) + codes.ravel(), minlength=self.node_count * len(categories),
+            weights=None if frequencies is None else np.asarray(frequencies, dtype=float)
+        ).reshape(self.node_count, len(categories))
+
+        position = dict(
+            (convert_to_python_type(self.observed.metadata[category]), i) for i, category in enumerate(categories)
+        )
+        predictions = self.terminal_predictions()
+        correct = sum(
+            counts[node.node_id, position[predictions[node.node_id]]] for node in self
+            if node.is_terminal and predictions[node.node_id] in position
+        )
+        respondents = self.data_size if frequencies is None else frequencies.sum()
+        return float(correct) / respondents
 
     def render(self, path=None, view=False):
         Graph(self).render(path, view)
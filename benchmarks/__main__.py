@@ -0,0 +1,63 @@
+"""
+Runs the benchmarks once each without asv, printing the time taken (and
+the peak memory allocated, for peakmem benchmarks):
+
+    python -m benchmarks [--quick] [pattern]
+"""
+import argparse
+import importlib
+import itertools
+import pkgutil
+import re
+import time
+import tracemalloc
+import benchmarks
+
+
+def discover(pattern):
+    """ Yields every benchmark class and method name matching pattern """
+    for module_info in pkgutil.iter_modules(benchmarks.__path__):
+        if not module_info.name.startswith('bench_'):
+            continue
+        module = importlib.import_module('benchmarks.' + module_info.name)
+        for name, cls in sorted(vars(module).items()):
+            if not isinstance(cls, type) or cls.__module__ != module.__name__:
+                continue
+            for method in sorted(dir(cls)):
+                full_name = '%s.%s.%s' % (module_info.name, name, method)
+                if method.startswith(('time_', 'peakmem_')) and re.search(pattern, full_name):
+                    yield full_name, cls, method
+
+
+def run(cls, method, params):
+    """ Returns the seconds taken and the peak bytes allocated by one call """
+    benchmark = cls()
+    if hasattr(benchmark, 'setup'):
+        benchmark.setup(*params)
+    tracemalloc.start()
+    start = time.time()
+    getattr(benchmark, method)(*params)
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the CHAID benchmarks once each')
+    parser.add_argument('pattern', nargs='?', default='', help='regular expression to select benchmarks')
+    parser.add_argument('--quick', action='store_true', help='only run the first combination of parameters')
+    args = parser.parse_args()
+
+    for full_name, cls, method in discover(args.pattern):
+        params = list(itertools.product(*getattr(cls, 'params', [])))
+        if not isinstance(getattr(cls, 'params', None), (list, tuple)):
+            params = [()]
+        for combination in params[:1] if args.quick else params:
+            elapsed, peak = run(cls, method, combination)
+            result = '%.1f MiB' % (peak / 2.0 ** 20) if method.startswith('peakmem_') else '%.3f s' % elapsed
+            print('%-60s %-40s %s' % (full_name, combination, result), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+"""
+Benchmarks of grouping the levels of a column
+"""
+import numpy as np
+import CHAID
+
+
+class Grouping(object):
+    """ Merging every level of a column, a pair at a time """
+    params = ([100000, 1000000], [16, 256], ['nominal', 'ordinal'])
+    param_names = ['rows', 'cardinality', 'variable_type']
+    number = 1
+    timeout = 300
+
+    def setup(self, rows, cardinality, variable_type):
+        arr = np.random.RandomState(0).randint(0, cardinality, rows).astype(float)
+        arr[::10] = np.nan
+        column_type = CHAID.NominalColumn if variable_type == 'nominal' else CHAID.OrdinalColumn
+        self.column = column_type(arr)
+
+    def time_group(self, rows, cardinality, variable_type):
+        pairs = self.column.possible_pairs()
+        while len(pairs) > 0:
+            self.column.group(*pairs[len(pairs) // 2].tolist())
+            pairs = self.column.possible_pairs()
+        self.column.arr
@@ -0,0 +1,22 @@
+"""
+Benchmarks of summarising the members of the nodes of a tree
+"""
+import CHAID
+from .data import dataset
+
+
+class NodeMembers(object):
+    """ Computing the members of every node of a built tree """
+    params = ([10000, 100000], ['categorical', 'continuous'], [False, True])
+    param_names = ['rows', 'dependent', 'weighted']
+    timeout = 300
+
+    def setup(self, rows, dependent, weighted):
+        data = dataset(rows, 10, dependent=dependent, weighted=weighted)
+        self.tree = CHAID.Tree.from_numpy(max_depth=4, min_parent_node_size=100, **data)
+        self.tree.build_tree()
+
+    def time_members(self, rows, dependent, weighted):
+        for node in self.tree:
+            node._members = None
+            node.members
@@ -0,0 +1,91 @@
+"""
+Benchmarks of the split search and chi-squared tests
+"""
+import numpy as np
+import CHAID
+from CHAID.stats import chisquare, chisquare_batch, select_variance_test
+from .data import dataset, contingency_table
+
+
+def columns(data):
+    """ Returns the independent and dependent columns the Tree would build """
+    tree = CHAID.Tree.from_numpy(**data)
+    return tree.vectorised_array, tree.observed, tree._stats
+
+
+class CategoricalSplit(object):
+    """ Finding the best split of the root node for a categorical dependent variable """
+    params = ([4, 16, 64], [2, 10], ['nominal', 'ordinal'], [False, True])
+    param_names = ['cardinality', 'classes', 'variable_type', 'weighted']
+    timeout = 300
+
+    def setup(self, cardinality, classes, variable_type, weighted):
+        data = dataset(50000, 10, cardinality=cardinality, classes=classes,
+                       variable_type=variable_type, weighted=weighted)
+        self.ind, self.dep, self.stats = columns(data)
+        self.rows = np.arange(len(self.dep.arr))
+
+    def time_best_cat_heuristic_split(self, cardinality, classes, variable_type, weighted):
+        self.stats.best_cat_heuristic_split(self.ind, self.dep, self.rows)
+
+    def peakmem_best_cat_heuristic_split(self, cardinality, classes, variable_type, weighted):
+        self.stats.best_cat_heuristic_split(self.ind, self.dep, self.rows)
+
+
+class ContinuousSplit(object):
+    """ Finding the best split of the root node for a continuous dependent variable """
+    params = ([4, 16, 64], [False, True])
+    param_names = ['cardinality', 'weighted']
+    timeout = 300
+
+    def setup(self, cardinality, weighted):
+        data = dataset(50000, 10, cardinality=cardinality, dependent='continuous', weighted=weighted)
+        self.ind, self.dep, self.stats = columns(data)
+        self.rows = np.arange(len(self.dep.arr))
+
+    def time_best_con_split(self, cardinality, weighted):
+        self.stats.best_con_split(self.ind, self.dep, self.rows)
+
+
+class OptimalGrouping(object):
+    """ Finding the best split of the root node by searching every grouping of the categories """
+    params = ([6, 9, 12], ['nominal', 'ordinal'])
+    param_names = ['cardinality', 'variable_type']
+    timeout = 300
+
+    def setup(self, cardinality, variable_type):
+        data = dataset(50000, 1, cardinality=cardinality, classes=2, variable_type=variable_type, missing=0)
+        self.ind, self.dep, self.stats = columns(dict(data, grouping='optimal'))
+        self.rows = np.arange(len(self.dep.arr))
+
+    def time_best_cat_optimal_split(self, cardinality, variable_type):
+        self.stats.best_cat_heuristic_split(self.ind, self.dep, self.rows)
+
+
+class VarianceTest(object):
+    """ Choosing the variance test of a continuous dependent variable, once per tree """
+    params = ([100000, 1000000, 10000000], [None, 5000])
+    param_names = ['rows', 'sample_size']
+    timeout = 300
+
+    def setup(self, rows, sample_size):
+        self.population = np.random.RandomState(0).normal(300, 100, rows)
+
+    def time_select_variance_test(self, rows, sample_size):
+        select_variance_test(self.population, sample_size)
+
+
+class ChiSquare(object):
+    """ The chi-squared test of a single table, and of a batch of pairs of levels """
+    params = ([2, 32], [2, 10], [False, True])
+    param_names = ['levels', 'classes', 'weighted']
+
+    def setup(self, levels, classes, weighted):
+        self.table = contingency_table(levels, classes, weighted)
+        self.batch = np.stack([contingency_table(2, classes, weighted, seed) for seed in range(500)])
+
+    def time_chisquare(self, levels, classes, weighted):
+        chisquare(self.table, weighted)
+
+    def time_chisquare_batch(self, levels, classes, weighted):
+        chisquare_batch(self.batch, weighted)
@@ -0,0 +1,102 @@
+"""
+Benchmarks of building trees, and of the prediction helpers of a built tree
+"""
+import CHAID
+from .data import dataset
+
+
+def build(data, **kwargs):
+    tree = CHAID.Tree.from_numpy(max_depth=4, min_parent_node_size=100, **dict(data, **kwargs))
+    tree.build_tree()
+    return tree
+
+
+class TreeBuild(object):
+    """ Building a tree with a categorical dependent variable """
+    params = ([10000, 100000], [10, 40], ['nominal', 'ordinal'], [False, True])
+    param_names = ['rows', 'predictors', 'variable_type', 'weighted']
+    timeout = 600
+
+    def setup(self, rows, predictors, variable_type, weighted):
+        self.data = dataset(rows, predictors, variable_type=variable_type, weighted=weighted)
+
+    def time_build_tree(self, rows, predictors, variable_type, weighted):
+        build(self.data)
+
+    def peakmem_build_tree(self, rows, predictors, variable_type, weighted):
+        build(self.data)
+
+
+class TreeBuildCardinality(object):
+    """ Building a tree from predictors with many categories, or many classes """
+    params = ([4, 32, 128], [2, 10])
+    param_names = ['cardinality', 'classes']
+    timeout = 600
+
+    def setup(self, cardinality, classes):
+        self.data = dataset(20000, 10, cardinality=cardinality, classes=classes)
+
+    def time_build_tree(self, cardinality, classes):
+        build(self.data)
+
+
+class TreeBuildContinuous(object):
+    """ Building a tree with a continuous dependent variable """
+    params = ([10000, 100000], [10, 40], [False, True])
+    param_names = ['rows', 'predictors', 'weighted']
+    timeout = 600
+
+    def setup(self, rows, predictors, weighted):
+        self.data = dataset(rows, predictors, dependent='continuous', weighted=weighted)
+
+    def time_build_tree(self, rows, predictors, weighted):
+        build(self.data)
+
+    def peakmem_build_tree(self, rows, predictors, weighted):
+        build(self.data)
+
+
+class TreeBuildParallel(object):
+    """ Building a tree with several workers """
+    params = ([1, 2, 4], ['process', 'thread'])
+    param_names = ['n_jobs', 'parallel_backend']
+    timeout = 600
+
+    def setup(self, n_jobs, parallel_backend):
+        self.data = dataset(100000, 40)
+
+    def time_build_tree(self, n_jobs, parallel_backend):
+        build(self.data, n_jobs=n_jobs, parallel_backend=parallel_backend)
+
+
+class Predictions(object):
+    """ Scoring the training data, and new data, with a built tree """
+    params = ([10000, 100000],)
+    param_names = ['rows']
+    timeout = 600
+
+    def setup(self, rows):
+        self.tree = build(dataset(rows, 10))
+        self.new_data = dataset(rows * 10, 10, seed=1)['ndarr']
+        self.tree.compile()
+
+    def time_node_predictions(self, rows):
+        self.tree.node_predictions()
+
+    def time_model_predictions(self, rows):
+        self.tree.model_predictions()
+
+    def time_accuracy(self, rows):
+        self.tree.accuracy()
+
+    def time_classification_rules(self, rows):
+        self.tree.classification_rules()
+
+    def time_compile(self, rows):
+        CHAID.CompiledTree.from_tree(self.tree)
+
+    def time_predict_new_data(self, rows):
+        self.tree.predict(self.new_data)
+
+    def peakmem_predict_new_data(self, rows):
+        self.tree.predict(self.new_data)
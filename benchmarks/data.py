@@ -0,0 +1,73 @@
+"""
+Synthetic data generators shared by the benchmarks
+"""
+import numpy as np
+
+
+def independent_variables(rows, predictors, cardinality, missing=0.0, seed=0):
+    """
+    Returns a rows x predictors array of categories in [0, cardinality),
+    with a fraction of the values replaced with NaN
+    """
+    rng = np.random.RandomState(seed)
+    ndarr = rng.randint(0, cardinality, size=(rows, predictors)).astype(float)
+    if missing:
+        ndarr[rng.rand(rows, predictors) < missing] = np.nan
+    return ndarr
+
+
+def dependent_variable(ndarr, classes=3, dependent='categorical', seed=0):
+    """
+    Returns a dependent variable that is related to the first two
+    predictors, with noise, so that the trees built have a few levels
+    """
+    rng = np.random.RandomState(seed + 1)
+    signal = np.nan_to_num(ndarr[:, :2]).sum(axis=1)
+    if dependent == 'continuous':
+        return signal * rng.uniform(0.5, 1.5, size=len(signal)) + rng.normal(size=len(signal))
+    return (signal + rng.randint(0, classes, size=len(signal))) % classes
+
+
+def dataset(rows, predictors, cardinality=8, classes=3, variable_type='nominal',
+            dependent='categorical', weighted=False, missing=0.05, seed=0):
+    """
+    Returns the keyword arguments of Tree.from_numpy for a synthetic data set
+
+    Parameters
+    ----------
+    rows : int
+        the number of respondents
+    predictors : int
+        the number of independent variables
+    cardinality : int
+        the number of categories of every independent variable
+    classes : int
+        the number of categories of a categorical dependent variable
+    variable_type : str
+        'nominal' or 'ordinal', the type of every independent variable
+    dependent : str
+        'categorical' or 'continuous'
+    weighted : bool
+        whether respondents are given weights in [0.5, 2)
+    missing : float
+        the fraction of independent values that are missing
+    """
+    ndarr = independent_variables(rows, predictors, cardinality, missing, seed)
+    weights = np.random.RandomState(seed + 2).uniform(0.5, 2, size=rows) if weighted else None
+    return {
+        'ndarr': ndarr,
+        'arr': dependent_variable(ndarr, classes, dependent, seed),
+        'weights': weights,
+        'variable_types': [variable_type] * predictors,
+        'dep_variable_type': dependent,
+    }
+
+
+def contingency_table(levels, classes, weighted=False, seed=0):
+    """ Returns a levels x classes frequency matrix, with a few empty cells """
+    rng = np.random.RandomState(seed)
+    table = rng.poisson(20, size=(levels, classes)).astype(float)
+    table[rng.rand(levels, classes) < 0.05] = 0
+    if weighted:
+        table *= rng.uniform(0.5, 2, size=table.shape)
+    return table
@@ -0,0 +1,64 @@
+"""
+Testing module for encoding and grouping the values of columns
+"""
+from unittest import TestCase
+import numpy as np
+from numpy import nan
+from setup_tests import CHAID
+import os
+import shutil
+import tempfile
+
+
+def test_numeric_object_column_with_nan_has_distinct_codes():
+    """
+    Check that numbers in an object array with NaN, as from_pandas_df
+    passes them when any column holds strings, are each given a single
+    code in sorted order, whatever order they appear in
+    """
+    arr = np.array([1.0, nan, 0.0, 2.0, nan, 0.0, 1.0, 0.0], dtype=object)
+    column = CHAID.NominalColumn(arr)
+
+    assert column.metadata == {0: 0.0, 1: 1.0, 2: 2.0, -1: '<missing>'}, 'Every value is listed once'
+    assert list(column.arr) == [1, -1, 0, 2, -1, 0, 1, 0]
+
+    reordered = CHAID.NominalColumn(arr[::-1].copy())
+    assert reordered.metadata == column.metadata, 'The codes are the same whatever the order of the rows'
+    assert list(reordered.arr) == list(column.arr[::-1])
+
+
+class TestGroupingInPlace(TestCase):
+    """ Test grouping columns whose integer codes are used in place """
+    def setUp(self):
+        """ Setup a memory-mapped file of nominal and ordinal codes """
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'codes.dat')
+        self.codes = np.array([[0, 1, 2, 1, -1, 2], [1, 2, 3, -128, 2, 1]], dtype=np.int8)
+        memmap = np.memmap(self.path, dtype=np.int8, mode='w+', shape=self.codes.shape)
+        memmap[:] = self.codes
+        memmap.flush()
+        del memmap
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def grouped(self, mode):
+        """ Groups the columns of the file opened in mode, returning their codes """
+        memmap = np.memmap(self.path, dtype=np.int8, mode=mode, shape=self.codes.shape)
+        nominal = CHAID.NominalColumn(memmap[0], copy=False)
+        ordinal = CHAID.OrdinalColumn(memmap[1], copy=False)
+        nominal.group(1, 2)
+        ordinal.group(1, 2)
+        ordinal.group(1, ordinal._nan)
+        arrs = [list(nominal.arr), list(ordinal.arr)]
+        assert (memmap == self.codes).all(), "The caller's array is left as it is"
+        return arrs
+
+    def test_writable_memmap(self):
+        """ Check grouping a writable memmap relabels a copy of the codes """
+        assert self.grouped('r+') == [[0, 1, 1, 1, -1, 1], [1, 1, 3, 1, 1, 1]]
+        assert (np.fromfile(self.path, dtype=np.int8).reshape(self.codes.shape) == self.codes).all()
+
+    def test_read_only_memmap(self):
+        """ Check grouping a read-only memmap relabels a copy of the codes """
+        assert self.grouped('r') == [[0, 1, 1, 1, -1, 1], [1, 1, 3, 1, 1, 1]]
@@ -0,0 +1,98 @@
+"""
+Testing module for the class ColumnStore
+"""
+from unittest import TestCase
+import numpy as np
+from setup_tests import CHAID
+from CHAID.column_store import ColumnStore
+
+
+class TestColumnStore(TestCase):
+    """ Test encoding the independent columns once for every node """
+    def setUp(self):
+        """ Setup a nominal and an ordinal column with missing values """
+        self.nominal = CHAID.NominalColumn(np.array(['b', 'a', None, 'b', 'c', 'a'], dtype=object), name='n')
+        self.ordinal = CHAID.OrdinalColumn(np.array([3.0, 1.0, 2.0, np.nan, 3.0, 1.0]), name='o')
+        self.store = ColumnStore([self.nominal, self.ordinal])
+
+    def test_codes_index_levels(self):
+        """ Check every row's code points at its value within the levels """
+        for column, levels, codes, offset in zip(self.store, self.store.levels, self.store.codes, self.store.offsets):
+            assert (levels[codes - offset] == column.arr).all()
+            assert list(levels) == sorted(set(column.arr.tolist()))
+            assert codes.dtype == np.int8
+
+    def test_level_codes_of_node(self):
+        """ Check a node's rows are given the position of their level, whatever the offset """
+        rows = np.array([4, 2, 0])
+        for i, column in enumerate(self.store):
+            codes = self.store.level_codes(i, rows)
+            assert codes.dtype == np.intp
+            assert (self.store.levels[i][codes] == column.arr[rows]).all()
+
+    def test_level_counts(self):
+        """ Check a node's rows are tabulated by level and dependent category """
+        rows = np.array([0, 1, 3, 4])
+        dep_codes = np.array([0, 1, 1, 0])
+        counts, present = self.store.level_counts(0, rows, dep_codes, 2)
+        expected = np.zeros((len(self.store.levels[0]), 2), dtype=int)
+        for row, dep_code in zip(rows, dep_codes):
+            expected[self.store.codes[0][row] - self.store.offsets[0], dep_code] += 1
+        assert (counts == expected).all()
+        assert (present == (expected.sum(axis=1) > 0)).all()
+
+    def test_weighted_level_counts(self):
+        """ Check a level present with zero weight is still present """
+        rows = np.array([0, 1])
+        counts, present = self.store.level_counts(0, rows, np.array([0, 1]), 2, np.array([0.0, 2.5]))
+        assert counts.sum() == 2.5
+        assert present.sum() == 2
+
+    def test_consecutive_codes_are_used_in_place(self):
+        """ Check nominal codes aren't copied, and ordinal values with gaps are """
+        assert np.shares_memory(self.store.codes[0], self.nominal.arr)
+        assert self.store.offsets[0] == -1
+        assert not np.shares_memory(self.store.codes[1], self.ordinal.arr)
+        assert self.store.offsets[1] == 0
+
+    def test_level_counts_of_aggregated_rows(self):
+        """ Check pre-aggregated rows are tabulated by their frequencies """
+        rows = np.array([0, 1, 3])
+        counts, present = self.store.level_counts(0, rows, np.array([0, 1, 1]), 2, frequencies=np.array([4, 0, 2]))
+        assert counts.sum() == 6
+        assert present.sum() == 1
+
+    def test_level_groups_keep_row_order(self):
+        """ Check values are grouped by level in the order of the rows """
+        rows = np.array([4, 0, 1, 5])
+        present, groups = self.store.level_groups(1, rows, np.array([10.0, 20.0, 30.0, 40.0]))
+        assert present.sum() == 2
+        assert [group.tolist() for group in groups] == [[30.0, 40.0], [10.0, 20.0]]
+
+    def test_level_moments_summarise_each_level(self):
+        """ Check the values of a node's rows are summarised by level without grouping them """
+        rows = np.array([4, 0, 1, 5])
+        values = np.array([10.0, 20.0, 30.0, 50.0])
+        present, counts, means, squares = self.store.level_moments(1, rows, values)
+        assert present.sum() == 2
+        assert list(counts) == [2, 2]
+        assert list(means) == [40.0, 15.0]
+        assert list(squares) == [200.0, 50.0]
+
+    def test_node_column_groups_present_levels(self):
+        """ Check a node's column only holds the levels present in its rows """
+        rows = np.array([0, 2, 3, 4])
+        _, present = self.store.level_counts(1, rows, np.zeros(4, dtype=int), 1)
+        node_column = self.store.node_column(1, present)
+        assert isinstance(node_column, CHAID.OrdinalColumn)
+        assert node_column._nan == self.ordinal._nan
+        assert node_column.groups() == self.ordinal[rows].groups()
+
+    def test_tree_builds_store_once(self):
+        """ Check the tree encodes its columns once and splits from the store """
+        dep = CHAID.NominalColumn(np.array([0, 1, 0, 1, 0, 1]))
+        tree = CHAID.Tree([self.nominal, self.ordinal], dep, {'min_child_node_size': 1, 'min_parent_node_size': 1})
+        assert tree.column_store.columns == [self.nominal, self.ordinal]
+        store = tree.column_store
+        tree.build_tree()
+        assert tree.column_store is store
@@ -0,0 +1,231 @@
+"""
+Testing module for the class CompiledTree
+"""
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from setup_tests import CHAID, ROOT_FOLDER
+from CHAID.compiled_tree import CompiledTree
+import json
+import os
+import shutil
+import tempfile
+
+
+class TestCompiledTree(TestCase):
+    """ Test routing rows through the lookup tables of a compiled tree """
+    def setUp(self):
+        """ Setup a tree on titanic with nominal, ordinal and missing values """
+        self.df = pd.read_csv(os.path.join(ROOT_FOLDER, 'tests/data/titanic.csv'))
+        self.i_variables = dict(sex='nominal', embarked='nominal', pclass='ordinal', age='ordinal', parch='nominal')
+        self.tree = CHAID.Tree.from_pandas_df(
+            self.df, self.i_variables, 'survived', max_depth=4, min_parent_node_size=2, min_child_node_size=10
+        )
+        self.compiled = CompiledTree.from_tree(self.tree)
+
+    def test_routes_training_rows_to_their_nodes(self):
+        """ Check training rows end up in the terminal node that holds them """
+        assert len(self.compiled) == len(self.tree.tree_store)
+        assert (self.compiled.apply(self.df) == self.tree.node_predictions()).all()
+
+    def test_predicts_training_rows(self):
+        """ Check training predictions match the model predictions """
+        assert (self.compiled.predict(self.df) == self.tree.model_predictions()).all()
+
+    def test_predicts_probabilities_of_training_rows(self):
+        """ Check the probabilities are the shares of the members of each row's node """
+        probabilities = self.compiled.predict_proba(self.df)
+        assert probabilities.shape == (len(self.df), 2)
+        assert np.allclose(probabilities.sum(axis=1), 1)
+        for row, node_id in zip(probabilities, self.tree.node_predictions().astype(int)):
+            members = self.tree.get_node(node_id).members
+            total = float(sum(members.values()))
+            assert np.allclose(row, [members[member] / total for member in self.compiled.classes])
+        assert (self.compiled.classes[probabilities.argmax(axis=1)] == self.tree.model_predictions()).all()
+        assert (self.tree.predict_proba(self.df) == probabilities).all()
+
+    def test_continuous_probabilities_raise(self):
+        """ Check there are no probabilities of a continuous dependent variable """
+        tree = CHAID.Tree.from_pandas_df(self.df, self.i_variables, 'fare', dep_variable_type='continuous')
+        with self.assertRaises(ValueError):
+            tree.predict_proba(self.df)
+
+    def test_selects_columns_by_name(self):
+        """ Check the columns of a DataFrame are found by name, in any order """
+        shuffled = self.df[list(reversed(self.df.columns))]
+        assert (self.compiled.apply(shuffled) == self.tree.node_predictions()).all()
+
+    def test_unseen_values_stay_at_the_node(self):
+        """ Check a value absent from a node's split stops the row at that node """
+        root_column = self.tree.vectorised_array[self.tree.tree_store[0].split.column_id].name
+        rows = self.df.head(3).copy()
+        rows[root_column] = 'unseen'
+        assert (self.compiled.apply(rows) == 0).all()
+        assert (self.compiled.predict(rows) == self.compiled.predictions[0]).all()
+
+    def test_unseen_values_follow_the_surrogates(self):
+        """ Check a value absent from a node's split routes the row by the node's surrogates in turn """
+        tree = CHAID.Tree.from_pandas_df(
+            self.df, self.i_variables, 'survived', max_depth=4, min_parent_node_size=2, min_child_node_size=10,
+            split_threshold=0.9
+        )
+        compiled = tree.compile()
+        assert (compiled.apply(self.df) == tree.node_predictions()).all(), 'Training rows never need surrogates'
+        root = tree.get_node(0)
+        surrogates = compiled.surrogate_column[compiled.surrogate_start[0]:compiled.surrogate_start[1]]
+        assert sorted(surrogates) == sorted(sur.column_id for sur in root.split.surrogates)
+
+        rows = self.df.copy()
+        names = [column.name for column in tree.vectorised_array]
+        rows[names[root.split.column_id]] = 'unseen'
+        children = [node.node_id for node in tree if node.parent == 0]
+        for rank, column_id in enumerate(surrogates):
+            offset = compiled.surrogate_offset[compiled.surrogate_start[0] + rank]
+            expected = compiled.children[offset + compiled.levels(column_id, rows[names[column_id]])]
+            first_nodes = [self.ancestor_at_depth(tree, node_id, 1) for node_id in compiled.apply(rows)]
+            assert (np.array(first_nodes) == expected).all()
+            assert set(first_nodes) <= set(children)
+            # the next surrogate takes over once this one can't route the rows either
+            rows[names[column_id]] = 1000 if tree.vectorised_array[column_id].type == 'ordinal' else 'unseen'
+        assert (compiled.apply(rows) == 0).all()
+
+    def test_surrogates_lead_to_the_child_of_most_rows(self):
+        """ Check each group of a surrogate leads to the child that most of its training rows went to """
+        tree = CHAID.Tree.from_pandas_df(
+            self.df, self.i_variables, 'survived', max_depth=4, min_parent_node_size=2, min_child_node_size=10,
+            split_threshold=0.9
+        )
+        compiled = tree.compile()
+        root = tree.get_node(0)
+        children = [node for node in tree if node.parent == 0]
+        column_id = compiled.surrogate_column[0]
+        surrogate = [sur for sur in root.split.surrogates if sur.column_id == column_id][0]
+        column = tree.vectorised_array[column_id]
+        for group in surrogate.splits:
+            votes = [np.isin(column.arr[child.indices], group).sum() for child in children]
+            levels = compiled.levels(column_id, [column.metadata.get(code, code) for code in group]) \
+                if column.type == 'nominal' else compiled.levels(column_id, [
+                    np.nan if code == column._nan else code for code in group
+                ])
+            assert (compiled.children[compiled.surrogate_offset[0] + levels] == children[np.argmax(votes)].node_id).all()
+
+    @staticmethod
+    def ancestor_at_depth(tree, node_id, depth):
+        """ Returns the id of the ancestor of a node at the given depth """
+        path = [node_id]
+        while tree.get_node(path[-1]).parent is not None:
+            path.append(tree.get_node(path[-1]).parent)
+        return list(reversed(path))[depth]
+
+    def test_numpy_rows(self):
+        """ Check rows are routed from an array in the order the tree was built with """
+        ndarr = np.array([[1, 3], [2, 2], [3, 1], [1, 1], [2, 3], [3, 2]] * 10)
+        arr = np.array([1, 1, 0, 1, 0, 0] * 10)
+        tree = CHAID.Tree.from_numpy(ndarr, arr, min_child_node_size=5, variable_types=['ordinal', 'nominal'])
+        compiled = tree.compile()
+        assert (compiled.apply(ndarr) == tree.node_predictions()).all()
+        assert (compiled.apply(np.array([[4, 1]])) == 0).all(), 'An unseen ordinal code stays at the root'
+
+    def test_uncopied_ordinal_missing_values(self):
+        """
+        Check rows whose ordinal code is missing, coded as the minimum of the
+        dtype in data used in place, follow the missing values' branch
+        """
+        random = np.random.RandomState(0)
+        ordinal = random.randint(0, 4, 600).astype(np.int8)
+        ordinal[random.rand(600) < 0.3] = np.iinfo(np.int8).min
+        ndarr = np.column_stack([ordinal, random.randint(0, 3, 600).astype(np.int8)])
+        arr = np.where(ordinal < 0, 1, (ordinal > 1).astype(int))
+        arr = np.where(random.rand(600) < 0.1, 1 - arr, arr)
+        tree = CHAID.Tree.from_numpy(ndarr, arr, variable_types=['ordinal', 'nominal'], copy=False, alpha_merge=0.05)
+        compiled = tree.compile()
+        assert any(tree.vectorised_array[0]._nan in group for group in tree.tree_store[0].split.splits)
+        assert (compiled.apply(ndarr) == tree.leaves).all()
+        assert (compiled.predict(ndarr) == tree.predict(ndarr)).all()
+        assert (compiled.predict(ndarr) == tree.model_predictions()).all()
+
+    def test_continuous_predictions(self):
+        """ Check a continuous tree predicts the mean of each node """
+        tree = CHAID.Tree.from_pandas_df(
+            self.df, self.i_variables, 'fare', max_depth=3, min_parent_node_size=2,
+            dep_variable_type='continuous'
+        )
+        compiled = tree.compile()
+        node_ids = compiled.apply(self.df)
+        assert (node_ids == tree.node_predictions()).all()
+        means = [tree.get_node(node_id).members['mean'] for node_id in node_ids]
+        assert np.allclose(compiled.predict(self.df), means)
+
+
+class TestSavedCompiledTree(TestCase):
+    """ Test saving and loading the flat array format """
+    def setUp(self):
+        """ Setup a saved tree in a temporary directory """
+        self.df = pd.read_csv(os.path.join(ROOT_FOLDER, 'tests/data/titanic.csv'))
+        self.tree = CHAID.Tree.from_pandas_df(
+            self.df, dict(sex='nominal', embarked='nominal', pclass='ordinal', age='ordinal'), 'survived',
+            max_depth=4, min_parent_node_size=2, min_child_node_size=10
+        )
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'model')
+        self.tree.compile().save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_loaded_tree_scores_identically(self):
+        """ Check the loaded tree routes and predicts rows as the tree does """
+        loaded = CompiledTree.load(self.path)
+        assert (loaded.apply(self.df) == self.tree.apply(self.df)).all()
+        assert (loaded.predict(self.df) == self.tree.predict(self.df)).all()
+        assert np.allclose(loaded.distributions, self.tree.compile().distributions)
+        assert np.allclose(loaded.predict_proba(self.df), self.tree.predict_proba(self.df))
+
+    def test_arrays_are_memory_mapped(self):
+        """ Check the per-node arrays are memory-mapped rather than read """
+        loaded = CompiledTree.load(self.path)
+        assert isinstance(loaded.children, np.memmap)
+        assert isinstance(loaded.distributions, np.memmap)
+        assert isinstance(CompiledTree.load(self.path, mmap_mode=None).children, np.ndarray)
+
+    def test_saved_without_training_data(self):
+        """ Check nothing saved grows with the number of training rows """
+        size = sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+        assert size < self.df.memory_usage(deep=True).sum() / 10
+
+    def test_continuous_tree(self):
+        """ Check a continuous tree predicts its means once loaded """
+        tree = CHAID.Tree.from_pandas_df(
+            self.df, dict(sex='nominal', pclass='ordinal'), 'fare', max_depth=2, min_parent_node_size=2,
+            dep_variable_type='continuous'
+        )
+        tree.compile().save(self.path)
+        assert np.allclose(CompiledTree.load(self.path).predict(self.df), tree.predict(self.df))
+
+    def test_unknown_format_version(self):
+        """ Check a directory from another format version is refused """
+        with open(os.path.join(self.path, 'metadata.json'), 'w') as handle:
+            handle.write('{"format_version": 0}')
+        with self.assertRaises(ValueError):
+            CompiledTree.load(self.path)
+
+    def test_surrogates_are_saved(self):
+        """ Check the surrogates of a tree are loaded with it, and are optional in the first format """
+        tree = CHAID.Tree.from_pandas_df(
+            self.df, dict(sex='nominal', embarked='nominal', pclass='ordinal', age='ordinal'), 'survived',
+            max_depth=4, min_parent_node_size=2, min_child_node_size=10, split_threshold=0.9
+        )
+        tree.compile().save(self.path)
+        rows = self.df.assign(sex='unseen')
+        loaded = CompiledTree.load(self.path)
+        assert len(loaded.surrogate_column) > 0
+        assert (loaded.apply(rows) == tree.apply(rows)).all()
+
+        with open(os.path.join(self.path, 'metadata.json')) as handle:
+            metadata = json.load(handle)
+        metadata['format_version'] = 1
+        with open(os.path.join(self.path, 'metadata.json'), 'w') as handle:
+            json.dump(metadata, handle)
+        for name in ('surrogate_start', 'surrogate_column', 'surrogate_offset'):
+            os.remove(os.path.join(self.path, name + '.npy'))
+        assert (CompiledTree.load(self.path).apply(rows) == 0).all()
@@ -0,0 +1,62 @@
+"""
+Testing module for the class ContingencyTable
+"""
+import numpy as np
+from setup_tests import CHAID
+from CHAID.contingency_table import ContingencyTable
+
+
+def test_counts_every_level_and_category():
+    """
+    Check that the frequency matrix matches a hand tabulation
+    """
+    ind = np.array([0, 0, 1, 1, 1, 2, 2])
+    dep = np.array([5, 6, 5, 5, 6, 6, 6])
+    table = ContingencyTable.from_arrays(ind, dep)
+
+    assert table.levels == [0, 1, 2], 'One row per independent level'
+    assert list(table.categories) == [5, 6], 'One column per dependent category'
+    assert (table.counts == np.array([[1, 1], [2, 1], [0, 2]])).all(), \
+        'The frequencies are correctly tabulated'
+
+
+def test_weighted_counts():
+    """
+    Check that weights are summed rather than rows counted
+    """
+    ind = np.array([0, 0, 1, 1])
+    dep = np.array([1, 2, 1, 1])
+    weights = np.array([0.5, 1.5, 2.0, 0.25])
+    table = ContingencyTable.from_arrays(ind, dep, weights)
+
+    assert np.allclose(table.counts, np.array([[0.5, 1.5], [2.25, 0]])), \
+        'The weighted frequencies are correctly tabulated'
+
+
+def test_merge_levels():
+    """
+    Check that merging folds one level into another
+    """
+    ind = np.array([0., 1., 2., 2., -1.])
+    dep = np.array([0, 1, 0, 1, 1])
+    table = ContingencyTable.from_arrays(ind, dep)
+
+    assert len(table) == 4
+    table.merge(0., 2.)
+    assert len(table) == 3, 'The merged level is no longer counted'
+    assert (table.counts[table.positions(0.)] == np.array([2, 1])).all(), 'The frequencies are summed'
+    assert (table.counts[table.positions([-1., 1.])] == np.array([[0, 1], [0, 1]])).all()
+    assert (table.table() == np.array([[0, 1], [2, 1], [0, 1]])).all(), \
+        'The remaining levels are returned in their original order'
+
+
+def test_positions_of_pairs():
+    """
+    Check that an array of pairs of levels is mapped to their rows
+    """
+    table = ContingencyTable(np.ones((4, 2)), [3., 0., -1., 2.], [0, 1])
+    pairs = np.array([[0., 2.], [3., -1.]])
+
+    assert (table.positions(pairs) == np.array([[1, 3], [0, 2]])).all()
+    assert (table.positions(pairs) == table.index([(0., 2.), (3., -1.)])).all(), \
+        'Positions agree with the index of the pairs'
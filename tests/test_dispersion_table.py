@@ -0,0 +1,75 @@
+"""
+Testing module for the class DispersionTable
+"""
+import numpy as np
+from scipy import stats
+from setup_tests import CHAID
+from CHAID.dispersion_table import DispersionTable
+from CHAID.stats import bartlett_batch, levene_batch, dispersion_tests
+
+
+def groups():
+    """ Returns the dependent values of four levels """
+    rng = np.random.RandomState(0)
+    return [rng.normal(10, scale, size) for scale, size in [(1, 30), (2, 12), (1.5, 45), (4, 7)]]
+
+
+def test_summaries_match_the_values():
+    """
+    Check every level holds the count, mean and squared deviations of its values
+    """
+    values = groups()
+    table = DispersionTable.from_groups(values, [0, 1, 2, 3])
+    assert list(table.counts) == [30, 12, 45, 7]
+    assert np.allclose(table.means, [group.mean() for group in values])
+    assert np.allclose(table.squares, [group.var() * len(group) for group in values])
+    assert not table.median_centred
+
+
+def test_merged_levels_match_the_concatenated_values():
+    """
+    Check merging levels gives the summaries of their concatenated values
+    """
+    values = groups()
+    table = DispersionTable.from_groups(values, [0, 1, 2, 3], median_centred=True)
+    table.merge(1, 3)
+    merged = np.concatenate((values[3], values[1]))
+    assert len(table) == 3
+    assert list(table.sizes()) == [30, 19, 45]
+    assert np.isclose(table.means[1], merged.mean())
+    assert np.isclose(table.squares[1], ((merged - merged.mean()) ** 2).sum())
+    deviations = np.abs(merged - np.median(merged))
+    assert np.isclose(table.deviations[1], deviations.mean())
+    assert np.isclose(table.deviation_squares[1], ((deviations - deviations.mean()) ** 2).sum())
+
+
+def test_batch_tests_match_scipy():
+    """
+    Check the batched tests of every pair of levels match scipy's tests of their values
+    """
+    values = groups()
+    pairs = [(0, 1), (0, 2), (1, 3), (2, 3)]
+    for median_centred, test in [(False, stats.bartlett), (True, stats.levene)]:
+        table = DispersionTable.from_groups(values, [0, 1, 2, 3], median_centred)
+        scores, p_values = dispersion_tests(table, table.index(pairs))
+        for (x, y), score, p_value in zip(pairs, scores, p_values):
+            expected = test(values[x], values[y])
+            assert np.isclose(score, expected[0]) and np.isclose(p_value, expected[1])
+        score, p_value = dispersion_tests(table, table.remaining()[None, :])
+        assert np.isclose(score[0], test(*values)[0]) and np.isclose(p_value[0], test(*values)[1])
+
+
+def test_degenerate_groups_match_scipy():
+    """
+    Check groups of a single row or a single value give the statistics scipy does
+    """
+    for values in ([1.0], [2.0, 3.0]), ([1.0, 1.0], [2.0, 3.0]), ([1.0, 1.0], [2.0, 2.0]):
+        values = [np.array(group) for group in values]
+        table = DispersionTable.from_groups(values, [0, 1], median_centred=True)
+        index = table.remaining()[None, :]
+        for result, expected in [
+            (bartlett_batch(table.counts[index], table.squares[index]), stats.bartlett(*values)),
+            (levene_batch(table.counts[index], table.deviations[index], table.deviation_squares[index]),
+             stats.levene(*values)),
+        ]:
+            assert np.allclose(np.array(result).ravel(), np.array(expected), equal_nan=True)
@@ -23,7 +23,7 @@ def no_graph_packages():
     for name in sys.modules:
         if name.startswith('plotly') or name.startswith('graphviz') or name.startswith('CHAID') or name.startswith('setup_tests') or name in ['colorlover', 'graphviz', 'Digraph']:
             modules_to_remove.append(name)
-    _ = [sys.modules.pop(x) for x in modules_to_remove]
+    removed = {x: sys.modules.pop(x) for x in modules_to_remove}
 
     d = PackageDiscarder()
     d.pkgnames.extend([
@@ -36,6 +36,8 @@ def no_graph_packages():
     sys.meta_path.insert(0, d)
     yield
     sys.meta_path.remove(d)
+    # put back the modules other tests were collected against
+    sys.modules.update(removed)
 
 
 def test_graph_warns_without_optional_imports(no_graph_packages):
@@ -23,3 +23,37 @@ def test_node_should_have_a_score():
     split = CHAID.Split("a", [], 2, 3, 4)
     node = CHAID.Node(dep_v=continuous_dp, split=split)
     assert node.score == 2
+
+def test_members_count_the_frequency_of_each_row():
+    """
+    Tests that the members of pre-aggregated rows count their respondents
+    """
+    dep = CHAID.NominalColumn(np.array(['a', 'b', 'a', 'c']), frequencies=np.array([3, 5, 2, 1]))
+    node = CHAID.Node(dep_v=dep[np.array([0, 1, 2])])
+    assert node.members == {'a': 5.0, 'b': 5.0, 'c': 0}
+
+def test_members_sum_the_weights_of_each_category():
+    """
+    Tests that weighted members sum the weights of each category's rows,
+    and that a category of zero weight still appears as a float
+    """
+    dep = CHAID.NominalColumn(np.array(['a', 'b', 'a', 'c', 'b']), weights=np.array([0.5, 0.0, 1.25, 2.0, 0.0]))
+    node = CHAID.Node(dep_v=dep[np.array([0, 1, 2, 4])])
+    assert node.members == {'a': 1.75, 'b': 0.0, 'c': 0}
+    assert type(node.members['b']) is float
+
+def test_children_members_are_tabulated_when_split():
+    """
+    Tests that the tree hands every child its members as it splits, matching
+    the members derived from the child's own rows
+    """
+    rng = np.random.RandomState(0)
+    ndarr = rng.randint(0, 4, size=(500, 3))
+    dep = (ndarr[:, 0] + rng.randint(0, 3, size=500) > 3).astype(int)
+    weights = rng.uniform(0.5, 2, size=500)
+    tree = CHAID.Tree.from_numpy(ndarr, dep, weights=weights, max_depth=3, min_child_node_size=10)
+    for node in list(tree)[1:]:
+        assert node._members is not None
+        derived = CHAID.Node(dep_v=node.dep_v).members
+        assert list(node.members) == list(derived)
+        assert np.allclose(list(node.members.values()), list(derived.values()))
@@ -5,6 +5,7 @@ from unittest import TestCase
 import numpy as np
 from numpy import nan
 from setup_tests import list_ordered_equal, CHAID
+from CHAID.column import distinct_values
 
 
 def test_chaid_vector_converts_strings():
@@ -102,6 +103,43 @@ def test_chaid_vector_with_dtype_object_and_nans():
     assert vector.metadata == {0: 1, 1: 2, -1: '<missing>'}, \
         'The metadata is formed correctly'
 
+def test_chaid_vector_with_negative_numbers():
+    """
+    Check that values equal to an earlier substituted code keep their own
+    code
+    """
+    arr = np.array([-5.0, 0.0, 0.5, -5.0])
+    vector = CHAID.NominalColumn(arr)
+
+    assert np.array_equal(vector.arr, np.array([0, 1, 2, 0])), \
+        'The indices are correctly substituted'
+    assert vector.metadata == {0: -5.0, 1: 0.0, 2: 0.5}, \
+        'The metadata is formed correctly'
+
+
+def test_chaid_vector_with_mixed_types_is_sorted():
+    """
+    Check that mixed numbers and strings are coded in a stable order, with
+    None counted as missing
+    """
+    arr = np.array(['b', 3, None, 'a', 1, nan], dtype=object)
+    vector = CHAID.NominalColumn(arr)
+
+    assert np.array_equal(vector.arr, np.array([3, 1, -1, 2, 0, -1])), \
+        'The indices are correctly substituted'
+    assert vector.metadata == {0: 1, 1: 3, 2: 'a', 3: 'b', -1: '<missing>'}, \
+        'The metadata is formed correctly'
+
+
+def test_codes_use_compact_dtype():
+    """
+    Check codes are stored in the smallest integer dtype holding them
+    """
+    assert CHAID.NominalColumn(np.array(['a', 'b', nan], dtype=object)).arr.dtype == np.int8
+    assert CHAID.NominalColumn(np.arange(1000)).arr.dtype == np.int16
+    assert CHAID.NominalColumn(np.arange(40000)).arr.dtype == np.int32
+
+
 def test_column_stores_weights():
     """
     Tests that the columns store the weights when they are passed
@@ -163,6 +201,28 @@ class TestDeepCopy(TestCase):
         assert self.copy.metadata == self.orig.metadata, 'Copied metadata should be equivalent'
 
 
+class TestGrouping(TestCase):
+    """ Test fixture class for merging the groups of a column """
+    def setUp(self):
+        """ Setup for grouping tests """
+        self.col = CHAID.NominalColumn(np.array(['a', 'b', 'c', 'd', 'b', 'a', 'd']))
+
+    def test_grouping_defers_relabelling_rows(self):
+        """ Ensure merges only track the group of each value until the rows are read """
+        arr = self.col._arr.copy()
+        self.col.group(0, 2)
+        self.col.group(3, 0)
+        assert (self.col._arr == arr).all(), 'No row data is touched while merging'
+        assert [[self.col.metadata[x] for x in group] for group in self.col.groups()] == [['b'], ['d', 'a', 'c']]
+        assert list(self.col.arr) == [3, 1, 3, 3, 1, 3, 3]
+
+    def test_possible_pairs_match_possible_groupings(self):
+        """ Ensure every pair of remaining groups can be merged, in order """
+        self.col.group(1, 2)
+        assert self.col.possible_pairs().tolist() == [[0, 1], [0, 3], [1, 3]]
+        assert list(self.col.possible_groupings()) == [(0, 1), (0, 3), (1, 3)]
+
+
 class TestBugFixes(TestCase):
     """ Specific tests for bug fixes """
     def test_comparison_of_different_object_types(self):
@@ -177,3 +237,11 @@ class TestBugFixes(TestCase):
         vector = CHAID.NominalColumn(object_arr)
 
         assert [vector.metadata[x] for x in vector.arr] == ['<missing>' if x != x else x for x in input_list]
+
+
+def test_distinct_values_read_in_blocks():
+    """
+    Check the distinct values of an array read a block at a time are those of the whole array
+    """
+    arr = np.random.RandomState(0).randint(-5, 50, size=1000)
+    assert (distinct_values(arr, block_size=64) == np.unique(arr)).all()
@@ -22,7 +22,7 @@ def test_all_ordinal_combinations():
 def test_all_ordinal_combinations_with_nan():
     arr = np.array([1.0, 2.0, 3.0, np.nan])
     ordinal = CHAID.OrdinalColumn(arr)
-    nan_val = np.iinfo(np.int64).min
+    nan_val = ordinal._nan
     assert [
         i for i in ordinal.all_combinations()
     ] == [[[nan_val], [1, 2, 3]],
@@ -37,6 +37,25 @@ def test_all_ordinal_combinations_with_nan():
           [[1], [2], [nan_val, 3]],
           [[nan_val], [1], [2], [3]]]
 
+def test_compact_dtype_reserves_missing_code():
+    """
+    Check codes are stored in the smallest integer dtype, with its minimum
+    reserved for missing values
+    """
+    ordinal = CHAID.OrdinalColumn(np.array([1.0, 2.5, 120.0, np.nan]))
+    assert ordinal.arr.dtype == np.int8
+    assert ordinal._nan == np.iinfo(np.int8).min
+    assert list(ordinal.arr) == [1, 2, 120, ordinal._nan]
+    assert ordinal.metadata[ordinal._nan] == '<missing>'
+
+    wide = CHAID.OrdinalColumn(np.array([-200, 1990, 2020]))
+    assert wide.arr.dtype == np.int16
+    assert wide[np.array([0, 2])]._nan == wide._nan, 'Slices keep the missing code'
+
+    edge = CHAID.OrdinalColumn(np.array([0, 127]))
+    assert edge.arr.dtype == np.int16, 'The maximum must leave room for the end of its range'
+
+
 class TestOrdinalDeepCopy(TestCase):
     """ Test fixture class for deep copy method """
     def setUp(self):
@@ -281,6 +300,33 @@ class TestOrdinalGroupingWithnan(TestCase):
         actual_groups = [[1.0], [2.0, 3.0, 4.0, '<missing>'], [5.0], [10.0]]
         assert list_unordered_equal(actual_groups, groups), 'With NaNs, with groups containing nan identified, actual groupings are incorrectly reported'
 
+class TestOrdinalIntervals(TestCase):
+    """ Test fixture class for grouping on interval bounds """
+    def setUp(self):
+        """ Setup for grouping tests """
+        arr = np.array([1.0, 2.0, nan, 3.0, 3.0, nan, 4.0, 5.0, 10.0])
+        self.col = CHAID.OrdinalColumn(arr)
+
+    def test_possible_pairs_match_possible_groupings(self):
+        """ Ensure the pairs array lists possible_groupings in order, after every merge """
+        while True:
+            pairs = self.col.possible_pairs()
+            assert [tuple(pair) for pair in pairs.tolist()] == list(self.col.possible_groupings())
+            if len(pairs) == 0:
+                break
+            self.col.group(*pairs[len(pairs) // 2].tolist())
+        assert len(self.col.groups()) == 2, 'The gap between 5 and 10 is never merged'
+
+    def test_grouping_defers_relabelling_rows(self):
+        """ Ensure merges only move interval bounds until the rows are read """
+        arr = self.col._arr.copy()
+        self.col.group(3.0, 4.0)
+        self.col.group(3.0, self.col._nan)
+        self.col.group(1.0, 2.0)
+        assert (self.col._arr == arr).all(), 'No row data is touched while merging'
+        assert list(self.col.arr) == [1, 1, 3, 3, 3, 3, 3, 5, 10]
+        assert self.col._merged == []
+
 class TestOrdinalConstructor(TestCase):
     """ Test fixture class for testing external Ordinal contruction """
     def setUp(self):
@@ -0,0 +1,93 @@
+"""
+Testing module for the parallel evaluation of predictors
+"""
+import numpy as np
+import pytest
+from setup_tests import CHAID
+from CHAID.column_store import ColumnStore
+from CHAID.parallel import WorkerPool, SharedArray, SharedColumnStore, effective_n_jobs
+
+
+def test_effective_n_jobs():
+    """
+    Check negative n_jobs count back from the number of cpus
+    """
+    assert effective_n_jobs(3) == 3
+    assert effective_n_jobs(None) == 1
+    assert effective_n_jobs(-1) >= 1
+    with pytest.raises(ValueError):
+        effective_n_jobs(0)
+
+
+def test_shared_column_store_round_trip():
+    """
+    Check a shared column store is rebuilt with the same codes and levels
+    """
+    column = CHAID.OrdinalColumn(np.array([1, 2, 2, 3, 5]), name='a')
+    store = ColumnStore([column])
+    shared = SharedColumnStore(store)
+    try:
+        attached = shared.attach()
+        assert type(attached[0]) is CHAID.OrdinalColumn
+        assert attached[0].name == 'a'
+        assert (attached.codes[0] == store.codes[0]).all()
+        assert (attached.levels[0] == store.levels[0]).all()
+        present = np.ones(len(store.levels[0]), dtype=bool)
+        assert attached.node_column(0, present).groups() == column.groups()
+    finally:
+        shared.release()
+
+
+def test_pool_returns_outcomes_in_column_order():
+    """
+    Check the pooled outcomes match a serial evaluation of every column
+    """
+    rng = np.random.RandomState(0)
+    columns = ColumnStore([CHAID.NominalColumn(rng.randint(0, 4, size=200)) for _ in range(5)])
+    dep = CHAID.NominalColumn(rng.randint(0, 2, size=200))
+    stats = CHAID.Stats(0.5, 10, None, 0.9, dep.arr)
+    rows = np.arange(200)
+    split = stats.best_split(columns, dep, rows)
+    serial = [repr(split)] + [repr(sur) for sur in split.surrogates]
+    assert len(serial) > 2
+
+    for backend in ('thread', 'process'):
+        with WorkerPool(stats, columns, n_jobs=3, backend=backend) as pool:
+            assert stats.pool is pool
+            split = stats.best_split(columns, dep, rows)
+            assert [repr(split)] + [repr(sur) for sur in split.surrogates] == serial
+        assert stats.pool is None
+
+
+def test_pool_splits_nodes_in_order():
+    """
+    Check the pooled node splits match splitting each node serially
+    """
+    rng = np.random.RandomState(1)
+    columns = ColumnStore([CHAID.NominalColumn(rng.randint(0, 4, size=300)) for _ in range(3)])
+    dep = CHAID.NominalColumn(rng.randint(0, 2, size=300))
+    stats = CHAID.Stats(0.5, 10, None, 0, dep.arr)
+    nodes = [(dep[rows], rows) for rows in np.array_split(rng.permutation(300), 4)]
+    serial = [repr(stats.best_split(columns, node_dep, rows)) for node_dep, rows in nodes]
+
+    for backend in ('thread', 'process'):
+        with WorkerPool(stats, columns, n_jobs=2, backend=backend) as pool:
+            assert [repr(split) for split in pool.map_nodes(nodes)] == serial
+
+
+def test_shared_array_maps_memory_mapped_files(tmpdir):
+    """
+    Check a contiguous view of a np.memmap is mapped again rather than copied
+    """
+    path = str(tmpdir.join('codes.dat'))
+    arr = np.memmap(path, dtype=np.int16, mode='w+', shape=(4, 3), order='F')
+    arr[...] = np.arange(12).reshape(4, 3)
+    shared = SharedArray(arr[:, 1])
+    assert shared.mapped == (path, 8)
+    assert (shared.attach() == [1, 4, 7, 10]).all()
+    strided = SharedArray(arr[1])
+    try:
+        assert strided.mapped is None, 'a strided row is copied to shared memory'
+        assert (strided.attach() == [3, 4, 5]).all()
+    finally:
+        strided.release()
@@ -0,0 +1,70 @@
+"""
+Testing module for enumerating the groupings of levels
+"""
+from itertools import product
+import numpy as np
+from setup_tests import CHAID
+from CHAID.partitions import JOIN_ANY, JOIN_LAST, JOIN_NONE, level_moves, partition_count, restricted_growth_strings
+
+
+def all_strings(moves, counts, min_size=0, max_groups=None):
+    """ Returns every string yielded, with its number of groups and frequencies """
+    found = [
+        (list(string), n_groups, grouped)
+        for strings, used, frequencies in restricted_growth_strings(moves, counts, min_size, max_groups, block_size=3)
+        for string, n_groups, grouped in zip(strings, used, frequencies)
+    ]
+    return found
+
+
+def test_partition_count_is_bell_number():
+    """ Check the groupings of nominal levels are counted by the Bell numbers """
+    bell = [1, 2, 5, 15, 52, 203, 877, 4140]
+    for n, expected in enumerate(bell, 1):
+        assert partition_count(np.full(n, JOIN_ANY)) == expected
+
+
+def test_strings_are_enumerated_in_order():
+    """ Check every grouping into two or more groups is found once, in lexicographic order, with its frequencies """
+    counts = np.array([[1, 0], [2, 1], [0, 4], [3, 3]])
+    moves = np.full(4, JOIN_ANY)
+    found = all_strings(moves, counts)
+    expected = [
+        list(string) for string in product(range(4), repeat=4)
+        if all(string[k] <= max(string[:k] + (-1,)) + 1 for k in range(4)) and max(string) > 0
+    ]
+    assert [string for string, _, _ in found] == expected
+    assert len(found) == partition_count(moves) - 1
+    for string, n_groups, grouped in found:
+        assert n_groups == max(string) + 1
+        for group in range(4):
+            assert (grouped[group] == counts[np.array(string) == group].sum(axis=0)).all()
+
+
+def test_ordinal_levels_only_join_consecutive_levels():
+    """ Check ordinal groups are runs of consecutive values, and the missing level joins any group """
+    missing = np.iinfo(np.int32).min
+    column = CHAID.OrdinalColumn(np.array([4, 1, 2, missing, 5], dtype=np.int32), substitute=False)
+    order, moves = level_moves(column)
+    assert list(column.arr[order]) == [1, 2, 4, 5, missing]
+    assert list(moves[1:]) == [JOIN_LAST, JOIN_NONE, JOIN_LAST, JOIN_ANY]
+
+    # the gap between 2 and 4 always splits the levels, so every grouping has two or more groups
+    found = all_strings(moves, np.ones((5, 1)))
+    assert len(found) == partition_count(moves) == 3 + 4 + 4 + 5
+    for string, _, _ in found:
+        assert string[:4] in ([0, 0, 1, 1], [0, 0, 1, 2], [0, 1, 2, 2], [0, 1, 2, 3])
+
+
+def test_groupings_are_pruned():
+    """ Check only groupings within max_groups whose groups reach min_size are found """
+    counts = np.array([[3], [1], [2], [4], [1]])
+    moves = np.full(5, JOIN_ANY)
+    found = all_strings(moves, counts, min_size=3, max_groups=3)
+    expected = [
+        string for string, _, _ in all_strings(moves, counts)
+        if max(string) < 3 and all(counts[np.array(string) == group].sum() >= 3 for group in range(max(string) + 1))
+    ]
+    assert [string for string, _, _ in found] == expected
+    assert len(expected) > 0
+    assert all_strings(np.array([JOIN_ANY, JOIN_NONE]), counts[:2], min_size=2) == []
@@ -4,6 +4,11 @@ Testing module for the class Stats
 
 from unittest import TestCase
 from setup_tests import CHAID
+from CHAID.column_store import ColumnStore
+from CHAID.contingency_table import ContingencyTable
+from CHAID.stats import select_variance_test
+from unittest.mock import patch
+import warnings
 import numpy as np
 import pandas as pd
 
@@ -148,3 +153,244 @@ class TestContinuousStats(TestCase):
         assert round(split.score, 4) == 2.8841
         assert round(split.p, 4) == 0.0895
         assert split.dof == 118.
+
+    def test_variance_test_chosen_by_normality(self):
+        """
+        Check Bartlett's test is chosen for normal data and Levene's test otherwise
+        """
+        assert self.stats_normal_data.variance_test == 'bartlett'
+        assert self.stats_random_data.variance_test == 'levene'
+
+    def test_given_variance_test_is_used(self):
+        """
+        Check a variance test given to the stats is used whatever the population
+        """
+        stats = CHAID.Stats(0.5, 10, None, .95, self.random_arr, variance_test='bartlett')
+        split = stats.best_con_split(self.ndarr, CHAID.ContinuousColumn(self.normal_arr))
+        assert round(split.score, 4) == 2.7346
+        assert round(split.p, 4) == 0.0982
+        with self.assertRaises(NotImplementedError):
+            CHAID.Stats(0.5, 10, None, .95, self.random_arr, variance_test='anova')
+
+    def test_normality_tested_once_per_tree(self):
+        """
+        Check the tree chooses its variance test before it's built, and never tests for normality again
+        """
+        tree = CHAID.Tree(self.ndarr, CHAID.ContinuousColumn(self.normal_arr), {'alpha_merge': 0.5, 'min_child_node_size': 10})
+        assert tree._stats._variance_test == 'bartlett'
+        with patch('CHAID.stats.stats.normaltest', side_effect=AssertionError):
+            tree.build_tree()
+        assert len(tree.tree_store) > 1
+
+    def test_normality_tested_on_a_sample(self):
+        """
+        Check the normality test can be run on a reproducible sample of the population
+        """
+        population = np.random.RandomState(1).normal(300, 100, 100000)
+        assert select_variance_test(population, 1000) == 'bartlett'
+        assert select_variance_test(population ** 2, 1000) == 'levene'
+        assert select_variance_test(self.random_arr, 1000) == select_variance_test(self.random_arr)
+
+
+class TestChisquareBatch(TestCase):
+    """ Tests for evaluating many contingency tables at once """
+    def setUp(self):
+        """ Setup a stack of 2 x k tables, one with an empty category """
+        self.tables = np.array([
+            [[10, 4, 6], [3, 9, 2]],
+            [[5, 5, 0], [8, 1, 0]],
+            [[12, 7, 1], [11, 8, 3]],
+        ])
+
+    def test_matches_single_table_chisquare(self):
+        """
+        Check that every result matches the single table calculation, with
+        empty categories left out as in the heuristic merge
+        """
+        chis, p_vals, dofs = CHAID.stats.chisquare_batch(self.tables, False)
+        for table, chi, p_val, dof in zip(self.tables, chis, p_vals, dofs):
+            table = table[:, table.any(axis=0)]
+            expected = CHAID.stats.chisquare(table, False)
+            assert np.isclose(chi, expected[0])
+            assert np.isclose(p_val, expected[1])
+            assert dof == expected[2]
+
+    def test_matches_single_table_chisquare_weighted(self):
+        """
+        Check that the weighted results match the single table calculation
+        """
+        tables = self.tables[[0, 2]] * 1.1
+        chis, p_vals, dofs = CHAID.stats.chisquare_batch(tables, True)
+        for table, chi, p_val, dof in zip(tables, chis, p_vals, dofs):
+            expected = CHAID.stats.chisquare(table, True)
+            assert np.isclose(chi, expected[0])
+            assert np.isclose(p_val, expected[1])
+            assert dof == expected[2]
+
+    def test_empty_rows_do_not_warn(self):
+        """
+        Check that a table with an empty row has no statistic, without
+        warning of the division by zero
+        """
+        tables = np.array([[[0, 0, 0], [3, 1, 2]], [[10, 4, 6], [3, 9, 2]]])
+        for weighted in (False, True):
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', RuntimeWarning)
+                chis, _, _ = CHAID.stats.chisquare_batch(tables, weighted)
+            assert np.isnan(chis[0]) and not np.isnan(chis[1])
+
+
+class TestMergeState(TestCase):
+    """ Tests for the cached pairwise statistics of the heuristic merge """
+    def setUp(self):
+        """ Setup a table of 4 levels """
+        ind = np.array([0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 3])
+        dep = np.array([0, 0, 1, 1, 1, 0, 0, 1, 2, 2, 2, 1, 0])
+        self.table = ContingencyTable.from_arrays(ind, dep)
+        self.state = CHAID.stats.MergeState(self.table, False)
+
+    def test_scores_match_chisquare(self):
+        """ Check that the cached scores match a direct calculation """
+        chis, p_vals = self.state.scores([(0, 1), (2, 3)])
+        n_ij = self.table.counts[self.table.positions([0, 1])]
+        expected = CHAID.stats.chisquare(n_ij[:, n_ij.any(axis=0)], False)
+        assert np.isclose(chis[0], expected[0])
+        assert np.isclose(p_vals[0], expected[1])
+
+    def test_merge_only_recomputes_merged_level(self):
+        """
+        Check that after a merge, pairs with the merged level are recomputed
+        and other pairs are served from the cache
+        """
+        self.state.scores([(0, 1), (0, 2), (2, 3)])
+        self.state.merge(0, 1)
+
+        calls = []
+        batch = CHAID.stats.chisquare_batch
+        def counting_batch(n_ij, weighted):
+            calls.append(len(n_ij))
+            return batch(n_ij, weighted)
+        CHAID.stats.chisquare_batch = counting_batch
+        try:
+            chis, p_vals = self.state.scores([(0, 2), (2, 3)])
+        finally:
+            CHAID.stats.chisquare_batch = batch
+
+        assert calls == [1], 'Only the pair with the merged level is recomputed'
+        expected = CHAID.stats.chisquare(self.table.counts[self.table.positions([0, 2])], False)
+        assert np.isclose(chis[0], expected[0])
+        assert np.isclose(p_vals[0], expected[1])
+
+
+class TestWeightedChisquare(TestCase):
+    """ Tests for the SPSS weighted expected frequencies """
+    def setUp(self):
+        """ Setup weighted tables with and without empty cells """
+        self.full = np.array([[2.5, 1.2, 3.1], [0.9, 4.4, 1.7]])
+        self.sparse = np.array([[2.5, 0.0, 3.1], [0.9, 4.4, 1.7]])
+
+    def test_closed_form_without_empty_cells(self):
+        """ Check the independence model is returned when no cell is empty """
+        m_ij, converged = CHAID.stats.ipf_expected(self.full)
+        expected = np.outer(self.full.sum(axis=1), self.full.sum(axis=0)) / self.full.sum()
+        assert converged
+        assert np.allclose(m_ij, expected)
+
+    def test_fit_matches_margins(self):
+        """ Check the fitted frequencies reproduce the observed margins """
+        m_ij, converged = CHAID.stats.ipf_expected(self.sparse)
+        assert converged
+        assert np.allclose(m_ij.sum(axis=1), self.sparse.sum(axis=1), atol=1e-4)
+        assert np.allclose(m_ij.sum(axis=0), self.sparse.sum(axis=0), atol=1e-4)
+
+    def test_reports_non_convergence(self):
+        """ Check that hitting the iteration cap is reported """
+        _, converged = CHAID.stats.ipf_expected(self.sparse, max_iter=1)
+        assert not converged
+        _, converged = CHAID.stats.ipf_expected_batch(np.array([self.full, self.sparse]), max_iter=1)
+        assert list(converged) == [True, False]
+
+    def test_batch_matches_single_fits(self):
+        """ Check each batched fit equals fitting the table on its own """
+        tables = np.array([self.sparse, self.full, self.sparse[::-1]])
+        m_ijs, converged = CHAID.stats.ipf_expected_batch(tables)
+        assert converged.all()
+        for table, m_ij in zip(tables, m_ijs):
+            assert np.allclose(m_ij, CHAID.stats.ipf_expected(table)[0])
+
+
+class TestOptimalGrouping(TestCase):
+    """ Tests for searching every grouping of a column's levels """
+    def node_column(self, column, dep, weights=None):
+        """ Returns the node column of every row and its contingency table """
+        store = ColumnStore([column])
+        all_dep, dep_codes = np.unique(dep, return_inverse=True)
+        counts, present = store.level_counts(0, np.arange(len(dep)), dep_codes, len(all_dep), weights)
+        ind_var = store.node_column(0, present)
+        return ind_var, ContingencyTable(counts[present], ind_var.arr, all_dep)
+
+    def brute_force(self, ind_var, freq, weighted, min_size, max_splits):
+        """ Returns the p-value and chi of the best grouping, comparing the bell set one by one """
+        rows = {level: freq.counts[k] for k, level in enumerate(freq.levels)}
+        best = None
+        for comb in ind_var.bell_set(sorted(ind_var._groupings.keys()), ind_var.type == 'ordinal'):
+            if len(comb) < 2 or (max_splits and len(comb) > max_splits):
+                continue
+            n_ij = np.array([sum(rows[level] for level in group) for group in comb])
+            if (n_ij.sum(axis=1) < min_size).any():
+                continue
+            chi, p_split, _ = CHAID.stats.chisquare(n_ij, weighted)
+            if best is None or p_split < best[0] or (p_split == best[0] and chi > best[1]):
+                best = (p_split, chi, sorted(sorted(group) for group in comb))
+        return best
+
+    def test_finds_the_most_significant_grouping(self):
+        """ Check the grouping found is the best of every grouping, for nominal and ordinal columns """
+        for seed in range(40):
+            rng = np.random.RandomState(seed)
+            x = rng.choice(np.arange(rng.randint(2, 7)) * (1 + (seed % 3 == 0)), 200).astype(float)
+            if seed % 5 == 0:
+                x[rng.rand(200) < 0.1] = np.nan
+            y = (rng.rand(200) < 0.3 + 0.1 * (np.nan_to_num(x) % 3)).astype(int) + (rng.rand(200) < 0.2)
+            weights = rng.uniform(0.5, 2, 200) if seed % 7 == 0 else None
+            column = CHAID.OrdinalColumn(x) if seed % 2 == 0 else CHAID.NominalColumn(x)
+            min_size, max_splits = [1, 10, 30][seed % 3], [None, 2, 3][seed % 4 % 3]
+            stats = CHAID.Stats(0.99, min_size, max_splits, 0, y, grouping='optimal')
+
+            ind_var, freq = self.node_column(column, y, weights)
+            expected = self.brute_force(ind_var, freq, weights is not None, min_size, max_splits)
+            split, _ = stats.optimal_table_split(0, ind_var, freq, weights is not None)
+            if expected is None or expected[0] >= 0.99:
+                assert split is None
+            else:
+                assert np.isclose(split.p, expected[0]) and np.isclose(split.score, expected[1])
+                assert sorted(sorted(group) for group in split.splits) == expected[2]
+
+    def test_optimum_is_as_significant_as_the_heuristic(self):
+        """ Check the optimal split of a node is never less significant than the heuristic split """
+        rng = np.random.RandomState(0)
+        x = rng.randint(0, 8, 1000)
+        y = (rng.rand(1000) < (x % 4) / 5.0 + 0.1).astype(int)
+        ind = [CHAID.NominalColumn(x), CHAID.OrdinalColumn(x)]
+        heuristic = CHAID.Stats(0.05, 30, None, 0, y).best_split(ind, CHAID.NominalColumn(y))
+        optimal = CHAID.Stats(0.05, 30, None, 0, y, grouping='optimal').best_split(ind, CHAID.NominalColumn(y))
+        assert optimal.p <= heuristic.p
+        assert len(optimal.splits) > 1
+
+    def test_many_levels_are_merged_heuristically(self):
+        """ Check a column with too many groupings to search falls back to the heuristic with a warning """
+        rng = np.random.RandomState(0)
+        x, y = rng.randint(0, 6, 500), rng.randint(0, 2, 500)
+        heuristic = CHAID.Stats(0.05, 30, None, 0, y).best_split([CHAID.NominalColumn(x)], CHAID.NominalColumn(y))
+        stats = CHAID.Stats(0.05, 30, None, 0, y, grouping='optimal')
+        with patch('CHAID.stats.MAX_PARTITIONS', 100), self.assertWarns(RuntimeWarning):
+            split = stats.best_split([CHAID.NominalColumn(x)], CHAID.NominalColumn(y))
+        assert split.splits == heuristic.splits
+
+    def test_unknown_grouping(self):
+        """ Check unsupported groupings are refused """
+        with self.assertRaises(NotImplementedError):
+            CHAID.Stats(0.05, 30, None, 0, np.array([0, 1]), grouping='greedy')
+        with self.assertRaises(NotImplementedError):
+            CHAID.Tree.from_numpy(np.array([[0], [1]]), np.array([0.5, 1.5]), dep_variable_type='continuous',
+                                  grouping='optimal')
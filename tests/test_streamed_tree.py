@@ -0,0 +1,110 @@
+"""
+Testing module for the class StreamedTree
+"""
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+import pytest
+from unittest.mock import patch
+from setup_tests import CHAID, ROOT_FOLDER
+from CHAID.streamed_tree import ChunkedData, StreamedTree, csv_chunks
+import os
+
+
+def dataframe_chunks(df, chunksize):
+    """ Returns a callable yielding df chunksize rows at a time """
+    def chunks():
+        return (df.iloc[start:start + chunksize] for start in range(0, len(df), chunksize))
+    return chunks
+
+
+class TestStreamedTree(TestCase):
+    """ Test building a tree from data read a chunk at a time """
+    def setUp(self):
+        """ Setup the titanic data, with nominal, ordinal and missing values """
+        self.path = os.path.join(ROOT_FOLDER, 'tests/data/titanic.csv')
+        self.df = pd.read_csv(self.path)
+        self.i_variables = dict(sex='nominal', embarked='nominal', pclass='ordinal', age='ordinal', parch='nominal')
+
+    def test_builds_the_same_tree_as_in_memory(self):
+        """ Check the streamed tree has the same nodes as the tree built from the DataFrame """
+        config = dict(max_depth=4, min_parent_node_size=2, min_child_node_size=10)
+        tree = CHAID.Tree.from_pandas_df(self.df, self.i_variables, 'survived', **config)
+        streamed = StreamedTree.from_chunks(csv_chunks(self.path, 97), self.i_variables, 'survived', **config)
+        assert [repr(node) for node in streamed] == [repr(node) for node in tree]
+        assert streamed.data_size == tree.data_size
+
+    def test_encodes_the_distinct_values_once(self):
+        """ Check the tree splits from the store of the chunked data, without building its own """
+        data = ChunkedData(csv_chunks(self.path, 97), self.i_variables, 'survived')
+        with patch('CHAID.tree.ColumnStore') as column_store:
+            streamed = StreamedTree(data, dict(max_depth=2))
+            streamed.build_tree()
+        assert not column_store.called
+        assert streamed.column_store is data.store
+
+    def test_fractional_node_sizes_count_rows(self):
+        """ Check fractional node sizes are a fraction of every row, not of the distinct values """
+        config = dict(max_depth=5, min_parent_node_size=0.05, min_child_node_size=0.02)
+        tree = CHAID.Tree.from_pandas_df(self.df, self.i_variables, 'survived', **config)
+        streamed = StreamedTree.from_chunks(csv_chunks(self.path, 200), self.i_variables, 'survived', **config)
+        assert [repr(node) for node in streamed] == [repr(node) for node in tree]
+
+    def test_predictions_read_every_chunk(self):
+        """ Check node and model predictions and accuracy match the in-memory tree """
+        tree = CHAID.Tree.from_pandas_df(self.df, self.i_variables, 'survived', max_depth=3)
+        streamed = StreamedTree.from_chunks(csv_chunks(self.path, 300), self.i_variables, 'survived', max_depth=3)
+        assert (streamed.node_predictions() == tree.node_predictions()).all()
+        assert (streamed.model_predictions() == tree.model_predictions()).all()
+        assert streamed.accuracy() == tree.accuracy()
+
+    def test_weighted_tree(self):
+        """ Check a weighted streamed tree has the same splits as in memory """
+        df = self.df.copy()
+        df['weight'] = np.random.RandomState(0).uniform(0.5, 2, len(df))
+        tree = CHAID.Tree.from_pandas_df(df, self.i_variables, 'survived', max_depth=3, weight='weight')
+        streamed = StreamedTree.from_chunks(
+            dataframe_chunks(df, 250), self.i_variables, 'survived', max_depth=3, weight='weight'
+        )
+        assert len(list(streamed)) == len(list(tree))
+        for node, streamed_node in zip(tree, streamed):
+            assert streamed_node.split.column_id == node.split.column_id
+            assert streamed_node.split.groupings == node.split.groupings
+            assert np.isclose(streamed_node.split.score or 0, node.split.score or 0)
+            assert list(streamed_node.members) == list(node.members)
+            assert np.allclose(list(streamed_node.members.values()), list(node.members.values()))
+
+    def test_max_depth_zero_reads_root_members(self):
+        """ Check a tree that can't be split still counts its root """
+        tree = CHAID.Tree.from_pandas_df(self.df, self.i_variables, 'survived', max_depth=0)
+        streamed = StreamedTree.from_chunks(dataframe_chunks(self.df, 400), self.i_variables, 'survived', max_depth=0)
+        assert [repr(node) for node in streamed] == [repr(node) for node in tree]
+
+    def test_continuous_dependent_variable_not_supported(self):
+        """ Check only categorical dependent variables can be streamed """
+        with pytest.raises(NotImplementedError):
+            StreamedTree.from_chunks(
+                dataframe_chunks(self.df, 400), self.i_variables, 'fare', dep_variable_type='continuous'
+            )
+
+
+class TestChunkedData(TestCase):
+    """ Test encoding chunks as the columns of the whole data would be encoded """
+    def test_codes_match_full_columns(self):
+        """ Check the chunks are coded as the full columns are """
+        df = pd.DataFrame({
+            'a': ['z', 'x', None, 'y', 'x', 'z'],
+            'b': [3.5, 1.0, np.nan, 2.2, 1.7, 3.5],
+            'dep': [1, 0, 1, 1, 0, 0],
+        })
+        data = ChunkedData(dataframe_chunks(df, 4), {'a': 'nominal', 'b': 'ordinal'}, 'dep')
+        full = [CHAID.NominalColumn(df['a'].values), CHAID.OrdinalColumn(df['b'].values)]
+        for column, full_column in zip(data.columns, full):
+            assert column.metadata == full_column.metadata
+            assert (data.codes(column, df[column.name].values) == full_column.arr).all()
+        assert data.data_size == 6
+
+    def test_unknown_variable_type(self):
+        """ Check an unknown independent variable type raises before reading """
+        with pytest.raises(NotImplementedError):
+            ChunkedData(None, {'a': 'interval'}, 'dep')
@@ -7,6 +7,8 @@ from setup_tests import list_ordered_equal, list_unordered_equal, CHAID, ROOT_FO
 import pandas as pd
 from treelib import Tree as TreeLibTree
 import os
+import shutil
+import tempfile
 
 class TestClassificationRules(TestCase):
     def setUp(self):
@@ -290,6 +292,41 @@ def test_max_splits():
     assert len(split.split_groups) == 2
 
 
+def test_weighted_last_pair_is_merged_above_alpha_merge():
+    """
+    Check that when the last two weighted levels are no more different than
+    alpha_merge allows, they merge rather than split, even though their
+    total weight differs from the node's by rounding
+    """
+    ndarr = np.array([[0, 1, 1, 0, 1, 1, 1, 1]]).T
+    income = np.array([1, 1, 1, 0, 0, 1, 0, 0])
+    weighting = np.array([1.0, 0.4, 0.8, 0.6, 0.6, 0.9, 0.2, 0.2])
+    assert weighting.sum() != weighting[ndarr[:, 0] == 0].sum() + weighting[ndarr[:, 0] == 1].sum()
+
+    tree = CHAID.Tree.from_numpy(ndarr, income, alpha_merge=0.2, weights=weighting, min_child_node_size=0)
+
+    assert len(tree.tree_store) == 1, 'The levels are merged, so the root is not split'
+    assert tree.tree_store[0].split.invalid_reason == CHAID.InvalidSplitReason.ALPHA_MERGE
+
+
+def test_large_weighted_last_pair_is_merged_above_alpha_merge():
+    """
+    Check that the rounding of a million weights, which grows with their
+    total, doesn't keep the last two levels apart either
+    """
+    random = np.random.RandomState(0)
+    ndarr = random.randint(0, 2, (1000000, 1))
+    income = random.randint(0, 2, 1000000)
+    weighting = np.round(random.uniform(0.1, 1.0, 1000000), 1)
+    counts = np.bincount(ndarr[:, 0] * 2 + income, weights=weighting)
+    assert abs(weighting.sum() - counts.sum()) > 1e-8
+
+    tree = CHAID.Tree.from_numpy(ndarr, income, alpha_merge=0.05, weights=weighting, min_child_node_size=1)
+
+    assert len(tree.tree_store) == 1, 'The levels are merged, so the root is not split'
+    assert tree.tree_store[0].split.invalid_reason == CHAID.InvalidSplitReason.ALPHA_MERGE
+
+
 def test_zero_subbed_weighted_ndarry():
     """
     Test how the split works when 0 independent categorical variable chooses a dependent categorical variable for the weighted case.
@@ -407,6 +444,39 @@ def test_accuracy():
     assert tree.accuracy() == 0.85
     assert tree.accuracy() == 1 - tree.risk()
 
+def test_leaves_are_assigned_when_built():
+    """
+    Test that every row is assigned its terminal node as the tree is built,
+    and that the predictions are read from it
+    """
+    gender = np.array([0,0,1,1,0,0,1,1,0,0,1,2,2,2,2,2,2,2,2,1])
+    income = np.array([0,0,1,1,2,0,1,1,1,0,1,0,0,0,0,0,0,0,0,0])
+
+    ndarr = np.transpose(np.vstack([gender]))
+    tree = CHAID.Tree.from_numpy(ndarr, income, alpha_merge=0.9, max_depth=1,
+                      min_child_node_size=1, min_parent_node_size=1)
+
+    assert tree.leaves.dtype == np.intp
+    for node in tree:
+        assert (tree.leaves[node.indices] == node.node_id).all() == node.is_terminal
+    predictions = dict((node.node_id, max(node.members, key=node.members.get)) for node in tree)
+    assert list(tree.model_predictions()) == [predictions[leaf] for leaf in tree.leaves]
+    assert tree.model_predictions().dtype == income.dtype, 'Predictions have the dependent variable\'s dtype'
+
+def test_accuracy_of_unpredicted_categories():
+    """
+    Test that rows of a category no node predicts are never counted as correct
+    """
+    gender = np.array([0,0,1,1,0,0,1,1,0,0,1,2,2,2,2,2,2,2,2,1])
+    income = np.array(['lo','lo','hi','hi','mid','lo','hi','hi','hi','lo','hi','lo','lo','lo','lo','lo','lo','lo','lo','lo'])
+
+    ndarr = np.transpose(np.vstack([gender]))
+    tree = CHAID.Tree.from_numpy(ndarr, income, alpha_merge=0.9,
+                      min_child_node_size=1, min_parent_node_size=1)
+
+    expected = (tree.model_predictions() == income).mean()
+    assert tree.accuracy() == expected == 0.85
+
 def test_max_depth_returns_correct_invalid_message():
     """
     Test when max_depth reached, it has the correct invalid message
@@ -746,3 +816,262 @@ class TestStringCategoricalDependentVariableForModelPrediction(TestCase):
             alpha_merge=0.05
         )
         assert self.tree.risk() == other_tree.risk()
+
+
+class TestRowPartitioning(TestCase):
+    """ Test that nodes partition row indices over shared columns """
+    def setUp(self):
+        """ Setup a tree that splits more than one level deep """
+        self.arr = np.array(([1] * 15) + ([2] * 15))
+        self.ndarr = np.array(([2, 3] * 20) + ([2, 5] * 20) + ([3, 4] * 19) + [2, 3]).reshape(30, 4)
+        self.tree = CHAID.Tree.from_numpy(self.ndarr, self.arr, alpha_merge=0.999, max_depth=5, min_child_node_size=5)
+
+    def test_columns_are_shared_and_unmodified(self):
+        """ Check building the tree leaves the independent columns untouched """
+        columns = list(self.tree.vectorised_array)
+        arrays = [col.arr.copy() for col in columns]
+        self.tree.build_tree()
+        assert all(a is b for a, b in zip(columns, self.tree.vectorised_array))
+        assert all((col.arr == arr).all() for col, arr in zip(columns, arrays))
+
+    def test_children_partition_parent_rows(self):
+        """ Check each child holds exactly the parent's rows in its split groups """
+        for node in self.tree:
+            children = [n for n in self.tree if n.parent == node.node_id]
+            if not children:
+                continue
+            column = self.tree.vectorised_array[node.split.column_id].arr
+            rows = np.sort(np.concatenate([child.indices for child in children]))
+            assert (rows == np.sort(node.indices)).all()
+            for child, group in zip(children, node.split.splits):
+                assert np.isin(column[child.indices], group).all()
+                assert (child.dep_v.arr == self.tree.observed.arr[child.indices]).all()
+
+
+class TestParallelPredictors(TestCase):
+    """ Test that splitting nodes and predictors in parallel builds the same tree """
+    def setUp(self):
+        """ Setup data with several predictors, some of them weighted """
+        rng = np.random.RandomState(3)
+        self.ndarr = rng.randint(0, 6, size=(400, 5)).astype(float)
+        self.ndarr[rng.rand(400) < 0.1, 0] = np.nan
+        self.arr = (self.ndarr[:, 1] % 2 + rng.randint(0, 2, size=400)) % 3
+        self.weights = rng.uniform(0.5, 2, size=400)
+        self.kwargs = dict(
+            max_depth=3, min_parent_node_size=20, min_child_node_size=10, alpha_merge=0.3,
+            variable_types=['ordinal', 'nominal', 'ordinal', 'nominal', 'nominal'], split_threshold=0.5
+        )
+
+    def assert_same_tree(self, arr, **kwargs):
+        kwargs = dict(self.kwargs, **kwargs)
+        serial = CHAID.Tree.from_numpy(self.ndarr, arr, **kwargs)
+        for backend in ('thread', 'process'):
+            parallel = CHAID.Tree.from_numpy(self.ndarr, arr, n_jobs=2, parallel_backend=backend, **kwargs)
+            assert repr(parallel.tree_store) == repr(serial.tree_store), backend
+            assert parallel._stats.pool is None, 'The pool is detached once the tree is built'
+
+    def test_categorical_tree(self):
+        """ Check the categorical tree and its surrogates are unchanged """
+        self.assert_same_tree(self.arr)
+
+    def test_weighted_tree(self):
+        """ Check the weighted categorical tree is unchanged """
+        self.assert_same_tree(self.arr, weights=self.weights)
+
+    def test_continuous_tree(self):
+        """ Check the continuous tree is unchanged """
+        self.assert_same_tree(self.ndarr[:, 2] * 2.5 + self.arr, dep_variable_type='continuous')
+
+    def test_more_workers_than_nodes(self):
+        """ Check the same tree is built while workers share out nodes or predictors """
+        self.assert_same_tree(self.arr, max_depth=4, min_parent_node_size=5, min_child_node_size=2)
+
+    def test_nodes_are_numbered_depth_first(self):
+        """ Check every subtree takes the ids directly after its root """
+        tree = CHAID.Tree.from_numpy(self.ndarr, self.arr, n_jobs=2, parallel_backend='thread', **self.kwargs)
+        nodes = list(tree)
+        assert len(nodes) > 3
+        assert [node.node_id for node in nodes] == list(range(len(nodes)))
+        sizes = {}
+        for node in reversed(nodes):
+            sizes[node.node_id] = 1 + sum(sizes[n.node_id] for n in nodes if n.parent == node.node_id)
+        for node in nodes:
+            subtree = nodes[node.node_id + 1:node.node_id + sizes[node.node_id]]
+            assert all(n.parent is not None and node.node_id <= n.parent < n.node_id for n in subtree)
+
+    def test_rebuild_keeps_node_ids(self):
+        """ Check building the tree again numbers the nodes from 0 """
+        tree = CHAID.Tree.from_numpy(self.ndarr, self.arr, **self.kwargs)
+        before = repr(tree.tree_store)
+        tree.build_tree()
+        assert repr(tree.tree_store) == before
+        assert tree.tree_store[0].node_id == 0
+        assert tree.node_count == len(tree.tree_store)
+
+    def test_unknown_backend(self):
+        """ Check an unknown backend is rejected """
+        tree = CHAID.Tree.from_numpy(self.ndarr, self.arr, n_jobs=2, parallel_backend='gpu')
+        with self.assertRaises(NotImplementedError):
+            tree.build_tree()
+
+
+class TestPredictNewData(TestCase):
+    """ Test scoring rows that weren't used to build the tree """
+    def setUp(self):
+        """ Setup a tree from a DataFrame """
+        self.df = pd.read_csv(os.path.join(ROOT_FOLDER, 'tests/data/titanic.csv'))
+        self.tree = CHAID.Tree.from_pandas_df(
+            self.df, dict(sex='nominal', embarked='nominal', pclass='ordinal'), 'survived',
+            max_depth=3, min_parent_node_size=2
+        )
+
+    def test_predict_matches_model_predictions(self):
+        """ Check new rows identical to the training rows are scored identically """
+        new_rows = self.df.sample(frac=1, random_state=0)
+        expected = self.tree.model_predictions()[self.df.index.get_indexer(new_rows.index)]
+        assert (self.tree.predict(new_rows) == expected).all()
+
+    def test_apply_matches_node_predictions(self):
+        """ Check new rows fall into the node of the identical training rows """
+        assert (self.tree.apply(self.df) == self.tree.node_predictions()).all()
+
+    def test_compiled_tree_is_rebuilt_with_the_tree(self):
+        """ Check the compiled tree is cached until the tree is built again """
+        compiled = self.tree.compile()
+        assert self.tree.compile() is compiled
+        self.tree.build_tree()
+        assert self.tree.compile() is not compiled
+
+
+class TestAggregatedData(TestCase):
+    """ Test building a tree from rows that each stand for a count of respondents """
+    def setUp(self):
+        """ Setup the titanic data and its cross-tabulation with a count per cell """
+        i_variables = dict(sex='nominal', embarked='nominal', pclass='ordinal', parch='nominal', sibsp='ordinal')
+        columns = list(i_variables) + ['survived']
+        self.i_variables = i_variables
+        self.df = pd.read_csv(os.path.join(ROOT_FOLDER, 'tests/data/titanic.csv'))[columns].fillna({'embarked': 'NA'})
+        self.aggregated = self.df.groupby(columns).size().reset_index(name='count').sample(frac=1, random_state=0)
+
+    def test_same_tree_as_respondent_rows(self):
+        """ Check the aggregated tree has the same nodes, sizes and members as the expanded one """
+        config = dict(max_depth=4, min_parent_node_size=2, min_child_node_size=10)
+        tree = CHAID.Tree.from_pandas_df(self.df, self.i_variables, 'survived', **config)
+        aggregated = CHAID.Tree.from_aggregated(self.aggregated, self.i_variables, 'survived', 'count', **config)
+        assert len(self.aggregated) < len(self.df)
+        assert [repr(node) for node in aggregated] == [repr(node) for node in tree]
+
+    def test_fractional_node_sizes_count_respondents(self):
+        """ Check fractional node sizes are a fraction of the respondents, not the rows """
+        config = dict(max_depth=5, min_parent_node_size=0.05, min_child_node_size=0.02)
+        tree = CHAID.Tree.from_pandas_df(self.df, self.i_variables, 'survived', **config)
+        aggregated = CHAID.Tree.from_aggregated(self.aggregated, self.i_variables, 'survived', 'count', **config)
+        assert [repr(node) for node in aggregated] == [repr(node) for node in tree]
+
+    def test_accuracy_counts_respondents(self):
+        """ Check the accuracy weighs every row by its respondents """
+        tree = CHAID.Tree.from_pandas_df(self.df, self.i_variables, 'survived', max_depth=3)
+        aggregated = CHAID.Tree.from_aggregated(self.aggregated, self.i_variables, 'survived', 'count', max_depth=3)
+        assert aggregated.accuracy() == tree.accuracy()
+
+    def test_empty_cells_are_left_out(self):
+        """ Check cells without respondents don't change the tree """
+        empty = self.aggregated.head(20).assign(count=0, survived=2)
+        tree = CHAID.Tree.from_aggregated(self.aggregated, self.i_variables, 'survived', 'count', max_depth=3)
+        padded = CHAID.Tree.from_aggregated(
+            pd.concat([self.aggregated, empty]), self.i_variables, 'survived', 'count', max_depth=3
+        )
+        assert [repr(node) for node in padded] == [repr(node) for node in tree]
+
+    def test_negative_counts_raise(self):
+        """ Check negative counts are rejected """
+        self.aggregated.iloc[0, -1] = -1
+        with self.assertRaises(ValueError):
+            CHAID.Tree.from_aggregated(self.aggregated, self.i_variables, 'survived', 'count')
+
+    def test_process_workers(self):
+        """ Check the counts reach the process workers """
+        config = dict(max_depth=3, min_parent_node_size=2)
+        tree = CHAID.Tree.from_aggregated(self.aggregated, self.i_variables, 'survived', 'count', **config)
+        pooled = CHAID.Tree.from_aggregated(
+            self.aggregated, self.i_variables, 'survived', 'count', n_jobs=2, **config
+        )
+        assert [repr(node) for node in pooled] == [repr(node) for node in tree]
+
+    def test_optimal_grouping(self):
+        """ Check the optimal groupings are found from the counts, by process workers too """
+        config = dict(max_depth=3, min_parent_node_size=2, min_child_node_size=10, grouping='optimal')
+        tree = CHAID.Tree.from_pandas_df(self.df, self.i_variables, 'survived', **config)
+        aggregated = CHAID.Tree.from_aggregated(self.aggregated, self.i_variables, 'survived', 'count', **config)
+        pooled = CHAID.Tree.from_aggregated(
+            self.aggregated, self.i_variables, 'survived', 'count', n_jobs=2, **config
+        )
+        heuristic = CHAID.Tree.from_pandas_df(self.df, self.i_variables, 'survived', max_depth=3,
+                                              min_parent_node_size=2, min_child_node_size=10)
+        assert [repr(node) for node in aggregated] == [repr(node) for node in tree]
+        assert [repr(node) for node in pooled] == [repr(node) for node in tree]
+        assert tree.get_node(0).split.p <= heuristic.get_node(0).split.p
+
+
+class TestMemoryMappedData(TestCase):
+    """ Test building a tree from integer codes used in place """
+    def setUp(self):
+        """ Setup the titanic data coded as its columns are, in a memory-mapped file """
+        self.df = pd.read_csv(os.path.join(ROOT_FOLDER, 'tests/data/titanic.csv'))
+        self.i_variables = dict(sex='nominal', embarked='nominal', pclass='ordinal', parch='nominal', sibsp='ordinal')
+        columns = [
+            (CHAID.OrdinalColumn if col_type == 'ordinal' else CHAID.NominalColumn)(self.df[name].values)
+            for name, col_type in self.i_variables.items()
+        ]
+        self.directory = tempfile.mkdtemp()
+        self.codes = np.memmap(
+            os.path.join(self.directory, 'codes.dat'), dtype=np.int8, mode='w+',
+            shape=(len(self.df), len(columns)), order='F'
+        )
+        for i, column in enumerate(columns):
+            assert column.arr.dtype == np.int8
+            self.codes[:, i] = column.arr
+        self.codes.flush()
+        self.codes = np.memmap(
+            os.path.join(self.directory, 'codes.dat'), dtype=np.int8, mode='r', shape=self.codes.shape, order='F'
+        )
+        self.config = dict(max_depth=3, min_parent_node_size=2, variable_types=list(self.i_variables.values()))
+
+    def tearDown(self):
+        """ Remove the memory-mapped file """
+        del self.codes
+        shutil.rmtree(self.directory)
+
+    def assert_same_splits(self, tree):
+        """ Check tree splits the same rows in the same way as the tree built from the DataFrame """
+        expected = CHAID.Tree.from_pandas_df(self.df, self.i_variables, 'survived', max_depth=3, min_parent_node_size=2)
+        nodes, expected_nodes = list(tree), list(expected)
+        assert len(nodes) == len(expected_nodes)
+        for node, expected_node in zip(nodes, expected_nodes):
+            assert node.split.column_id == expected_node.split.column_id
+            assert node.split.splits == expected_node.split.splits
+            assert node.split.score == expected_node.split.score
+            assert node.members == expected_node.members
+            assert (node.indices == expected_node.indices).all()
+
+    def test_codes_are_used_in_place(self):
+        """ Check the columns view the memory-mapped file rather than copying it """
+        tree = CHAID.Tree.from_numpy(self.codes, self.df['survived'].values, copy=False, **self.config)
+        for i, column in enumerate(tree.vectorised_array):
+            assert np.shares_memory(column.arr, self.codes[:, i])
+        in_place = [np.shares_memory(codes, self.codes) for codes in tree.column_store.codes]
+        assert in_place == [True, True, True, True, False], 'sibsp has gaps between its values'
+        assert tree.vectorised_array[1].metadata == {-1: '<missing>'}
+        self.assert_same_splits(tree)
+
+    def test_process_workers_map_the_file(self):
+        """ Check the codes are read from the file by process workers """
+        tree = CHAID.Tree.from_numpy(
+            self.codes, self.df['survived'].values, copy=False, n_jobs=2, **self.config
+        )
+        self.assert_same_splits(tree)
+
+    def test_only_integer_codes_are_used_in_place(self):
+        """ Check values that would need coding are rejected """
+        with self.assertRaises(ValueError):
+            CHAID.Tree.from_numpy(self.df[['fare']].values, self.df['survived'].values, copy=False)